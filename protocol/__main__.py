@@ -1,10 +1,18 @@
+import sys
 import time
 import socket
+import asyncio
 import threading
 import netifaces
 
 from host import Host
 from terminal import Terminal
+from async_host import AsyncHost, run
+from workers import Supervisor
+
+
+""" Global variables """
+STATS_INTERVAL = 10  # Seconds between stats of workers
 
 
 def get_available_ips() -> list:
@@ -54,6 +62,42 @@ def get_new_port() -> int:
     return port
 
 
+async def serve_async(ip: str, port: int):
+    """Host and terminal in one event loop"""
+
+    host = AsyncHost(ip, port)
+    await host.start()
+
+    terminal = Terminal(host, threading.Event())
+    commands = asyncio.ensure_future(terminal.serve())
+
+    await asyncio.wait(
+        [commands, asyncio.ensure_future(host.serve())],
+        return_when=asyncio.FIRST_COMPLETED,
+    )
+
+    host.stop()
+    commands.cancel()
+
+
+def serve_workers(ip: str, port: int, workers: int | None):
+    """Node as workers sharing the port, their stats are printed"""
+
+    supervisor = Supervisor(ip, port, workers)
+    if not supervisor.start():
+        return
+
+    try:
+        while True:
+            time.sleep(STATS_INTERVAL)
+            stats = supervisor.stats()
+            stats.pop("workers")
+            print(stats)
+    except KeyboardInterrupt:
+        supervisor.stop()
+        print("KeyboardInterrupted at {}".format(time.time()))
+
+
 def main():
     stop_event = threading.Event()
 
@@ -82,7 +126,23 @@ def main():
 
     sock.close()
 
-    host = Host(ip, port)
+    if "--workers" in sys.argv:
+        try:
+            workers = int(sys.argv[sys.argv.index("--workers") + 1])
+        except (IndexError, ValueError):
+            workers = None
+        serve_workers(ip, port, workers)
+        return
+
+    if "--async" in sys.argv:
+        try:
+            run(serve_async(ip, port))
+        except KeyboardInterrupt:
+            print("KeyboardInterrupted at {}".format(time.time()))
+        return
+
+    """ Persistence worker writes received files, when disk is slow """
+    host = Host(ip, port, offload="--offload" in sys.argv)
     terminal = Terminal(host, stop_event)
 
     host.register()
@@ -96,6 +156,9 @@ def main():
         stop_event.set()
         terminal_thread.join()
         print("KeyboardInterrupted at {}".format(time.time()))
+    finally:
+        """ Worker, if any, writes what it got before it stops """
+        host.unregister()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,172 @@
+import asyncio
+import logging
+
+from host import Host
+from go.time import Time
+from typing import Callable
+from go.status import Status
+from scheduler import AsyncScheduler
+from go.adressinfo import AddressInfo
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+
+""" Global variables """
+LOGGER = logging.getLogger("AsyncHost")
+
+
+def new_event_loop() -> asyncio.AbstractEventLoop:
+    """uvloop when it is installed, default asyncio loop otherwise"""
+
+    if uvloop is not None:
+        return uvloop.new_event_loop()
+
+    return asyncio.new_event_loop()
+
+
+def run(main) -> object:
+    """Run coroutine in a new event loop, see new_event_loop"""
+
+    with asyncio.Runner(loop_factory=new_event_loop) as runner:
+        return runner.run(main)
+
+
+class AsyncHost(Host, asyncio.DatagramProtocol):
+    """
+    Host driven by asyncio event loop instead of its own selector loop.
+    Socket is a datagram endpoint of the loop, connections and transfers
+    run from loop callbacks and timers, so many hosts and other asyncio
+    services share one loop.
+    Commands of Host work as before, coroutines wait for their result.
+    """
+
+    def __init__(self, ip: str, port: int):
+        self.__scheduler = AsyncScheduler()
+        super().__init__(ip, port, self.__scheduler)
+
+        self.__transport: asyncio.DatagramTransport | None = None
+        self.__received: asyncio.Queue = asyncio.Queue()
+        self.__closed: asyncio.Event = asyncio.Event()
+
+    async def start(self) -> None:
+        """Bind socket in running loop"""
+
+        loop = asyncio.get_running_loop()
+        self.__scheduler.attach(loop)
+
+        await loop.create_datagram_endpoint(lambda: self, local_addr=self.me.values())
+
+    async def serve(self) -> None:
+        """Wait until host is stopped"""
+        await self.__closed.wait()
+
+    def register(self):
+        """Socket of AsyncHost belongs to the event loop"""
+        raise RuntimeError("AsyncHost is bound in running loop, await start()")
+
+    def run(self):
+        """Event loop runs AsyncHost"""
+        raise RuntimeError("AsyncHost runs in event loop, await serve() after start()")
+
+    def stop(self):
+        if self.__transport is not None:
+            self.__transport.close()
+
+        self.__scheduler.close()
+        self.__closed.set()
+
+    async def open_connection(
+        self, ip: str, port: int, timeout: float = Time.RESEND
+    ) -> bool:
+        """Connect to host and wait until connection is approved"""
+
+        addr = AddressInfo(ip, port)
+        connection = self.get_connection(addr)
+
+        if connection is None:
+            connection = self._add_connection(addr)
+            connection.connect()
+
+        try:
+            await asyncio.wait_for(
+                self.__scheduler.until(
+                    connection._iterator, lambda: connection.connected
+                ),
+                timeout,
+            )
+        except asyncio.TimeoutError:
+            LOGGER.warning("Connection to {}:{} timed out".format(ip, port))
+
+        return connection.connected
+
+    async def send(
+        self,
+        ip: str,
+        port: int,
+        data: bytes,
+        name: str = None,
+        ext: str = "",
+        release: Callable = None,
+    ) -> bool:
+        """
+        Send message, or file if it has a name, and wait until transfer ends.
+        True if receiver saved all data.
+        """
+
+        connection = self.get_connection(AddressInfo(ip, port))
+
+        if connection is None:
+            LOGGER.warning("Connection to {}:{} does not exist".format(ip, port))
+            if release is not None:
+                release()
+            return False
+
+        if name is not None:
+            transfer = connection.send_file(data, name, ext, release)
+        else:
+            transfer = connection.send_msg(data)
+
+        if transfer is None:
+            return False
+
+        await self.__scheduler.until(
+            transfer._iterator, lambda: transfer.alive == Status.DEAD
+        )
+
+        return transfer.completed
+
+    async def receive(self) -> tuple[AddressInfo, str | None, str | None]:
+        """Wait for next finished transfer: sender, file path and message"""
+        return await self.__received.get()
+
+    def connection_made(self, transport: asyncio.DatagramTransport) -> None:
+        self.__transport = transport
+        self._bound(transport.get_extra_info("socket"))
+
+    def datagram_received(self, data: bytes, addr: tuple[str, int]) -> None:
+        self._on_datagram(data, addr)
+
+    def error_received(self, exc: Exception) -> None:
+        LOGGER.debug(f"Socket error: {exc}")
+
+    def connection_lost(self, exc: Exception | None) -> None:
+        self.__closed.set()
+
+    def _send(self, data: bytes, addr: AddressInfo):
+        """Send data to addr"""
+
+        self.__transport.sendto(data, addr.values())
+
+    def _add_connection(self, addr: AddressInfo):
+        connection = super()._add_connection(addr)
+        connection._on_received = self._on_received
+
+        return connection
+
+    def _on_received(
+        self, addr: AddressInfo, path: str | None, message: str | None
+    ) -> None:
+        self.__received.put_nowait((addr, path, message))
@@ -0,0 +1,477 @@
+import sys
+import errno
+import socket
+import struct
+import ctypes
+import logging
+
+from go.size import Size
+from typing import Callable
+
+""" Global variables """
+LOGGER = logging.getLogger("Batch")
+MSG_DONTWAIT = 0x40
+SOCKADDR_IN = 16  # family, port, address, padding
+MAX_NAMES = 65536  # Cached peer addresses, cache is dropped when it is full
+UDP_SEGMENT = 103  # Socket option of UDP GSO, missing in socket module
+GSO_SEGMENTS = 64  # Most segments kernel accepts in one send
+GSO_BYTES = 65507  # Most bytes of one UDP send
+
+
+class iovec(ctypes.Structure):
+    _fields_ = [("iov_base", ctypes.c_void_p), ("iov_len", ctypes.c_size_t)]
+
+
+class msghdr(ctypes.Structure):
+    _fields_ = [
+        ("msg_name", ctypes.c_void_p),
+        ("msg_namelen", ctypes.c_uint32),
+        ("msg_iov", ctypes.POINTER(iovec)),
+        ("msg_iovlen", ctypes.c_size_t),
+        ("msg_control", ctypes.c_void_p),
+        ("msg_controllen", ctypes.c_size_t),
+        ("msg_flags", ctypes.c_int),
+    ]
+
+
+class mmsghdr(ctypes.Structure):
+    _fields_ = [("msg_hdr", msghdr), ("msg_len", ctypes.c_uint)]
+
+
+def _load_libc():
+    """libc with recvmmsg and sendmmsg, None outside of Linux"""
+
+    if not sys.platform.startswith("linux"):
+        return None
+
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        libc.recvmmsg
+        libc.sendmmsg
+    except (OSError, AttributeError):
+        return None
+
+    libc.recvmmsg.argtypes = [
+        ctypes.c_int,
+        ctypes.POINTER(mmsghdr),
+        ctypes.c_uint,
+        ctypes.c_int,
+        ctypes.c_void_p,
+    ]
+    libc.recvmmsg.restype = ctypes.c_int
+
+    libc.sendmmsg.argtypes = [
+        ctypes.c_int,
+        ctypes.POINTER(mmsghdr),
+        ctypes.c_uint,
+        ctypes.c_int,
+    ]
+    libc.sendmmsg.restype = ctypes.c_int
+
+    return libc
+
+
+LIBC = _load_libc()
+
+
+class RecvBatch:
+    """
+    Reads up to size datagrams per readiness event into one reusable buffer,
+    with recvfrom_into, or with single recvmmsg call, when mmsg is asked
+    for and it is available. recvmmsg pays off with large batches only,
+    its headers are read through ctypes.
+    Returned datagrams are memoryviews over the buffer, they are valid until
+    the next read. Host hands them to connections, which decode and consume
+    them in the same pass of the loop, before the socket is read again.
+    """
+
+    def __init__(self, sock: socket.socket, size: int = Size.PPT, mmsg: bool = False):
+        self.__socket = sock
+        self.__size = size
+        self.__buffer = bytearray(size * Size.DATAGRAM)
+        self.__view = memoryview(self.__buffer)
+        self.__slots = [
+            self.__view[i * Size.DATAGRAM : (i + 1) * Size.DATAGRAM]
+            for i in range(size)
+        ]
+
+        """ Names of peers, same peer gets the same tuple """
+        self.__addrs: dict[bytes, tuple[str, int]] = {}
+
+        self.__mmsg = mmsg and LIBC is not None and sock.family == socket.AF_INET
+        self.__filled = size
+        if self.__mmsg:
+            self._prepare_mmsg()
+
+    @property
+    def size(self) -> int:
+        return self.__size
+
+    @property
+    def mmsg(self) -> bool:
+        """Check if recvmmsg is used"""
+        return self.__mmsg
+
+    def read(self) -> list[tuple[memoryview, tuple[str, int]]]:
+        """Datagrams waiting in socket, at most size of them"""
+
+        if self.__mmsg:
+            return self._read_mmsg()
+
+        return self._read_each()
+
+    def _read_each(self) -> list[tuple[memoryview, tuple[str, int]]]:
+        datagrams = []
+
+        for slot in self.__slots:
+            try:
+                length, addr = self.__socket.recvfrom_into(slot)
+            except (BlockingIOError, InterruptedError):
+                break
+
+            datagrams.append((slot[:length], addr))
+
+        return datagrams
+
+    def _prepare_mmsg(self) -> None:
+        """Headers point to slots of buffer, they are built once"""
+
+        size = self.__size
+        base = ctypes.addressof(
+            (ctypes.c_char * len(self.__buffer)).from_buffer(self.__buffer)
+        )
+
+        self.__iovecs = (iovec * size)()
+        self.__names = bytearray(size * SOCKADDR_IN)
+        names = ctypes.addressof(
+            (ctypes.c_char * len(self.__names)).from_buffer(self.__names)
+        )
+
+        """ Headers live in bytearray, so lengths are read without ctypes """
+        self.__raw_headers = bytearray(size * ctypes.sizeof(mmsghdr))
+        self.__headers = (mmsghdr * size).from_buffer(self.__raw_headers)
+        self.__words = memoryview(self.__raw_headers).cast("I")
+        self.__stride = ctypes.sizeof(mmsghdr) // 4
+        self.__namelen = mmsghdr.msg_hdr.offset + msghdr.msg_namelen.offset
+        self.__msg_len = mmsghdr.msg_len.offset
+
+        for i in range(size):
+            self.__iovecs[i].iov_base = base + i * Size.DATAGRAM
+            self.__iovecs[i].iov_len = Size.DATAGRAM
+
+            header = self.__headers[i].msg_hdr
+            header.msg_name = names + i * SOCKADDR_IN
+            header.msg_iov = ctypes.pointer(self.__iovecs[i])
+            header.msg_iovlen = 1
+
+    def _read_mmsg(self) -> list[tuple[memoryview, tuple[str, int]]]:
+        words = self.__words
+        stride = self.__stride
+        namelen = self.__namelen // 4
+        msg_len = self.__msg_len // 4
+
+        """ Kernel shortened names of headers it filled """
+        for i in range(self.__filled):
+            words[i * stride + namelen] = SOCKADDR_IN
+
+        count = LIBC.recvmmsg(
+            self.__socket.fileno(), self.__headers, self.__size, MSG_DONTWAIT, None
+        )
+
+        if count < 0:
+            self.__filled = 0
+            error = ctypes.get_errno()
+            if error not in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                LOGGER.debug(f"recvmmsg failed: {errno.errorcode.get(error, error)}")
+            return []
+
+        self.__filled = count
+
+        if len(self.__addrs) > MAX_NAMES:
+            self.__addrs.clear()
+
+        names = self.__names
+        addrs = self.__addrs
+        slots = self.__slots
+        datagrams = []
+
+        for i in range(count):
+            offset = i * SOCKADDR_IN
+            name = bytes(names[offset + 2 : offset + 8])
+
+            addr = addrs.get(name)
+            if addr is None:
+                addr = (socket.inet_ntoa(name[2:]), int.from_bytes(name[:2], "big"))
+                addrs[name] = addr
+
+            datagrams.append((slots[i][: words[i * stride + msg_len]], addr))
+
+        return datagrams
+
+
+class SendBatch:
+    """
+    Datagrams produced in one pass of the loop, sent together by flush.
+    Run of datagrams to the same peer with the same size is sent by one
+    sendmsg with UDP_SEGMENT (GSO), kernel splits it into datagrams again.
+    Other datagrams go by one sendmmsg call, when mmsg is asked for and it
+    is available, or by sendto each.
+    Datagrams which do not fit into socket buffer are dropped, as they
+    would be on the wire, transfers resend them.
+    Datagram over path MTU is dropped as well, on_too_big gets its peer.
+    """
+
+    def __init__(
+        self,
+        sock: socket.socket,
+        size: int = GSO_SEGMENTS,
+        gso: bool = True,
+        mmsg: bool = False,
+        on_too_big: Callable | None = None,
+    ):
+        self.__socket = sock
+        self.__size = size
+        self.__queue: list[tuple[bytes, tuple[str, int]]] = []
+        self.__on_too_big = on_too_big
+
+        linux = LIBC is not None and sock.family == socket.AF_INET
+        self.__gso = gso and linux
+        self.__mmsg = mmsg and linux
+
+        self.__syscalls = 0
+        self.__dropped = 0
+        self.__too_big = 0
+
+        if self.__mmsg:
+            self._prepare_mmsg()
+
+    @property
+    def gso(self) -> bool:
+        """Check if UDP_SEGMENT is used, it is turned off when kernel refuses it"""
+        return self.__gso
+
+    @property
+    def mmsg(self) -> bool:
+        """Check if sendmmsg is used"""
+        return self.__mmsg
+
+    @property
+    def syscalls(self) -> int:
+        """Number of send calls, for monitoring"""
+        return self.__syscalls
+
+    @property
+    def dropped(self) -> int:
+        """Datagrams which socket did not take"""
+        return self.__dropped
+
+    @property
+    def too_big(self) -> int:
+        """Datagrams which were over path MTU"""
+        return self.__too_big
+
+    def __len__(self) -> int:
+        return len(self.__queue)
+
+    def push(self, data: bytes, addr: tuple[str, int]) -> None:
+        """Queue datagram until flush"""
+
+        self.__queue.append((data, addr))
+
+    def flush(self) -> None:
+        """Send queued datagrams, in order of push for every peer"""
+
+        queue = self.__queue
+        if not queue:
+            return
+        self.__queue = []
+
+        if not self.__gso:
+            self._send_singles(queue)
+            return
+
+        singles = []
+        count = len(queue)
+        i = 0
+
+        while i < count:
+            data, addr = queue[i]
+
+            """ Datagram with other peer next to it is not a run """
+            if i + 1 < count and queue[i + 1][1] == addr:
+                end = self._segments(queue, i)
+            else:
+                end = i + 1
+
+            if end - i > 1:
+                self._send_singles(singles)
+                singles = []
+                self._send_gso(queue[i:end])
+            elif self.__mmsg:
+                singles.append((data, addr))
+            else:
+                self._sendto(data, addr)
+
+            i = end
+
+        self._send_singles(singles)
+
+    def _segments(self, queue: list, start: int) -> int:
+        """End of run, which can be sent as one GSO send"""
+
+        data, addr = queue[start]
+        size = len(data)
+        total = size
+        end = start + 1
+        limit = min(len(queue), start + GSO_SEGMENTS)
+
+        while end < limit:
+            next_data, next_addr = queue[end]
+            length = len(next_data)
+
+            if next_addr != addr or length > size or total + length > GSO_BYTES:
+                break
+
+            total += length
+            end += 1
+
+            """ Only last segment can be shorter """
+            if length < size:
+                break
+
+        return end
+
+    def _send_gso(self, run: list) -> None:
+        addr = run[0][1]
+        size = struct.pack("=H", len(run[0][0]))
+
+        try:
+            self.__syscalls += 1
+            self.__socket.sendmsg(
+                [b"".join([data for data, _ in run])],
+                [(socket.SOL_UDP, UDP_SEGMENT, size)],
+                0,
+                addr,
+            )
+        except (BlockingIOError, InterruptedError):
+            self.__dropped += len(run)
+        except OSError as e:
+            """ Segments over path MTU fail as well, singles tell it apart """
+            too_big = self.__too_big
+            self._send_singles(run)
+
+            if self.__too_big == too_big:
+                LOGGER.warning(f"UDP GSO is not supported, it is turned off: {e}")
+                self.__gso = False
+
+    def _send_singles(self, items: list) -> None:
+        if not items:
+            return
+
+        if self.__mmsg and len(items) > 1:
+            for start in range(0, len(items), self.__size):
+                self._send_mmsg(items[start : start + self.__size])
+            return
+
+        for data, addr in items:
+            self._sendto(data, addr)
+
+    def _sendto(self, data: bytes, addr: tuple[str, int]) -> None:
+        try:
+            self.__syscalls += 1
+            self.__socket.sendto(data, addr)
+        except (BlockingIOError, InterruptedError):
+            self.__dropped += 1
+        except OSError as e:
+            if e.errno != errno.EMSGSIZE:
+                raise
+
+            self.__dropped += 1
+            self.__too_big += 1
+            if self.__on_too_big is not None:
+                self.__on_too_big(addr)
+
+    def _prepare_mmsg(self) -> None:
+        """Datagrams are copied into slots of one buffer, headers point to them"""
+
+        size = self.__size
+
+        self.__buffer = bytearray(size * Size.DATAGRAM)
+        self.__view = memoryview(self.__buffer)
+        base = ctypes.addressof(
+            (ctypes.c_char * len(self.__buffer)).from_buffer(self.__buffer)
+        )
+
+        self.__names = bytearray(size * SOCKADDR_IN)
+        names = ctypes.addressof(
+            (ctypes.c_char * len(self.__names)).from_buffer(self.__names)
+        )
+        self.__name_of: dict[tuple[str, int], bytes] = {}
+
+        """ Lengths are written through views, without ctypes """
+        self.__raw_iovecs = bytearray(size * ctypes.sizeof(iovec))
+        self.__iovecs = (iovec * size).from_buffer(self.__raw_iovecs)
+        self.__lengths = memoryview(self.__raw_iovecs).cast("Q")
+
+        self.__raw_headers = bytearray(size * ctypes.sizeof(mmsghdr))
+        self.__headers = (mmsghdr * size).from_buffer(self.__raw_headers)
+
+        for i in range(size):
+            self.__iovecs[i].iov_base = base + i * Size.DATAGRAM
+
+            header = self.__headers[i].msg_hdr
+            header.msg_name = names + i * SOCKADDR_IN
+            header.msg_namelen = SOCKADDR_IN
+            header.msg_iov = ctypes.pointer(self.__iovecs[i])
+            header.msg_iovlen = 1
+
+    def _name(self, addr: tuple[str, int]) -> bytes:
+        """sockaddr_in of peer"""
+
+        name = self.__name_of.get(addr)
+
+        if name is None:
+            if len(self.__name_of) > MAX_NAMES:
+                self.__name_of.clear()
+
+            name = struct.pack(
+                "=H2s4s8x",
+                socket.AF_INET,
+                addr[1].to_bytes(2, "big"),
+                socket.inet_aton(addr[0]),
+            )
+            self.__name_of[addr] = name
+
+        return name
+
+    def _send_mmsg(self, items: list) -> None:
+        view = self.__view
+        names = self.__names
+        lengths = self.__lengths
+        count = 0
+
+        for data, addr in items:
+            length = len(data)
+            if length > Size.DATAGRAM:
+                self._sendto(data, addr)
+                continue
+
+            offset = count * Size.DATAGRAM
+            view[offset : offset + length] = data
+            lengths[count * 2 + 1] = length
+            names[count * SOCKADDR_IN : (count + 1) * SOCKADDR_IN] = self._name(addr)
+            count += 1
+
+        if count == 0:
+            return
+
+        self.__syscalls += 1
+        sent = LIBC.sendmmsg(self.__socket.fileno(), self.__headers, count, 0)
+
+        if sent < 0:
+            error = ctypes.get_errno()
+            if error not in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                LOGGER.debug(f"sendmmsg failed: {errno.errorcode.get(error, error)}")
+            sent = 0
+
+        self.__dropped += count - sent
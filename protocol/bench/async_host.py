@@ -0,0 +1,142 @@
+"""
+Throughput of file transfers, selector loop Host versus AsyncHost.
+
+A file is sent between two hosts on loopback. Host runs its loop in
+a thread per host and the sender is polled until it finishes, as the
+terminal does. AsyncHost runs both hosts in one asyncio loop and awaits
+the transfer, once with the default loop and once with uvloop, when it
+is installed.
+Received files are deleted.
+
+Run from the protocol directory:
+
+    python -m bench.async_host [megabytes ...]
+"""
+
+import os
+import sys
+import glob
+import time
+import asyncio
+import threading
+
+import async_host
+
+from host import Host
+from go.status import Status
+from async_host import AsyncHost
+from go.adressinfo import AddressInfo
+
+
+""" Global variables """
+SIZES = (1, 10, 50)  # Megabytes
+ROUNDS = 3  # Transfers of every size, best one is reported
+NAME = f"asyncbench{os.getpid()}"
+SENDER = ("127.0.0.1", 0)
+RECEIVER = ("127.0.0.2", 0)  # Host ignores packets from its own ip
+
+
+def clean() -> None:
+    for path in glob.glob(os.path.join("files", NAME + "*")):
+        os.remove(path)
+
+
+def selector(data: bytes) -> float:
+    """Seconds of one transfer between Hosts with own loops"""
+
+    sender, receiver = Host(*SENDER), Host(*RECEIVER)
+    threads = []
+
+    for host in (sender, receiver):
+        host.register()
+        threads.append(threading.Thread(target=host.run, daemon=True))
+        threads[-1].start()
+
+    addr = AddressInfo(*receiver.get_bounded_ip_port())
+    sender.connect(*addr.values())
+    connection = sender.get_connection(addr)
+
+    while not connection.connected:
+        time.sleep(0.001)
+
+    started = time.perf_counter()
+
+    transfer = connection.send_file(data, NAME, ".bin")
+    while transfer.alive != Status.DEAD:
+        time.sleep(0.001)
+
+    elapsed = time.perf_counter() - started
+
+    for host, thread in zip((sender, receiver), threads):
+        host.stop()
+        thread.join()
+        host.unregister()
+
+    return elapsed
+
+
+async def asynchronous(data: bytes) -> float:
+    """Seconds of one transfer between AsyncHosts in one loop"""
+
+    sender, receiver = AsyncHost(*SENDER), AsyncHost(*RECEIVER)
+    await sender.start()
+    await receiver.start()
+
+    ip, port = receiver.me.values()
+    await sender.open_connection(ip, port)
+
+    started = time.perf_counter()
+    await sender.send(ip, port, data, NAME, ".bin")
+    elapsed = time.perf_counter() - started
+
+    sender.stop()
+    receiver.stop()
+
+    return elapsed
+
+
+def loop_with(factory) -> object:
+    """Runs coroutine in a loop made by factory"""
+
+    def run(main) -> object:
+        with asyncio.Runner(loop_factory=factory) as runner:
+            return runner.run(main)
+
+    return run
+
+
+def measure(name: str, transfer, size: int) -> None:
+    data = os.urandom(size * 1024 * 1024)
+
+    started = time.process_time()
+    best = min(transfer(data) for _ in range(ROUNDS))
+    cpu = (time.process_time() - started) / ROUNDS
+
+    clean()
+
+    print(
+        f"  {size:>4} MB {name:<10}"
+        f" {size / best:>8.1f} MB/s"
+        f" {cpu:>7.3f} s CPU per transfer"
+    )
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or SIZES
+
+    loops = [("asyncio", loop_with(asyncio.new_event_loop))]
+    if async_host.uvloop is not None:
+        loops.append(("uvloop", loop_with(async_host.uvloop.new_event_loop)))
+    else:
+        print("uvloop is not installed, skipped")
+
+    print(f"Best of {ROUNDS}")
+
+    for size in sizes:
+        measure("selector", selector, size)
+        for name, run in loops:
+            measure(name, lambda data: run(asynchronous(data)), size)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Datagrams which kernel drops on a burst, by socket buffer size.
+
+A sender bursts a window of full fragments to a socket, which does not
+read until the burst is over, as a busy loop does. Socket has default
+buffers, and buffers sized by size_buffers for the window. Drops are
+counted by kernel_drops, and compared with datagrams which were read.
+
+Run from the protocol directory:
+
+    python -m bench.buffers [window ...]
+"""
+
+import sys
+import socket
+
+from go.size import Size
+from buffers import size_buffers, kernel_drops
+
+
+""" Global variables """
+WINDOWS = [64, 256, Size.MAX_WINDOW]
+FRAGMENT = b"\0" * 1475  # Fragment with V2 header
+
+
+def drain(sock: socket.socket) -> int:
+    received = 0
+    while True:
+        try:
+            sock.recv(2048)
+        except BlockingIOError:
+            return received
+        received += 1
+
+
+def burst(window: int, sized: bool) -> None:
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver.bind(("127.0.0.1", 0))
+    receiver.setblocking(False)
+
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sender.bind(("127.0.0.2", 0))
+
+    if sized:
+        size_buffers(receiver, window, len(FRAGMENT))
+        size_buffers(sender, window, len(FRAGMENT))
+
+    for _ in range(window):
+        sender.sendto(FRAGMENT, receiver.getsockname())
+
+    drops = kernel_drops(receiver)
+    received = drain(receiver)
+    buffer = receiver.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+
+    print(
+        f"  {window:>5} fragments {'sized' if sized else 'default':<8}"
+        f" {buffer:>9} B buffer"
+        f" {received:>5} received"
+        f" {drops if drops is not None else '?':>5} kernel drops"
+    )
+
+    receiver.close()
+    sender.close()
+
+
+def main():
+    windows = [int(arg) for arg in sys.argv[1:]] or WINDOWS
+
+    for window in windows:
+        burst(window, sized=False)
+        burst(window, sized=True)
+
+
+if __name__ == "__main__":
+    main()
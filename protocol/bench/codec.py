@@ -0,0 +1,89 @@
+"""
+Micro-benchmark of the Packet codec hot paths.
+
+Run from the protocol directory:
+
+    python -m bench.codec [packets] [fragment_size]
+"""
+
+import os
+import sys
+import time
+import struct
+import crcmod
+
+from packet import Packet
+from go.flags import Flags
+
+
+def legacy_construct(data: bytes, flags: Flags, seq_num: int) -> bytes:
+    """Packet.construct before the shared checksum engine"""
+    crc16_func = crcmod.mkCrcFun(0x18005, rev=True, initCrc=0xFFFF, xorOut=0x0000)
+    crc16 = crc16_func(data)
+
+    return struct.pack("!BHB", flags, crc16, seq_num) + data
+
+
+def legacy_is_valid(data: bytes) -> bool:
+    """Packet.is_valid before the shared checksum engine"""
+    flags, crc16, seq_num = struct.unpack("!BHB", data[:4])
+    packet_data = data[4:]
+
+    crc16_func = crcmod.mkCrcFun(0x18005, rev=True, initCrc=0xFFFF, xorOut=0x0000)
+
+    return crc16_func(packet_data) == crc16
+
+
+def measure(name: str, func, items: list) -> None:
+    """Print packets per second of func over items"""
+
+    start = time.perf_counter()
+    for item in items:
+        func(item)
+    elapsed = time.perf_counter() - start
+
+    print(f"  {name:<28} {len(items) / elapsed:>12,.0f} pkt/s")
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    fragment_size = int(sys.argv[2]) if len(sys.argv) > 2 else 1468
+
+    payloads = [os.urandom(fragment_size) for _ in range(count)]
+    packets = [
+        Packet(payload, Flags.SR, i % (2**8)) for i, payload in enumerate(payloads)
+    ]
+    datagrams = [Packet.packet_to_bytes(packet) for packet in packets]
+
+    print(f"{count} packets, {fragment_size} bytes payload")
+
+    print("encode")
+    measure(
+        "before (table per call)",
+        lambda packet: legacy_construct(packet.data, packet.flags, packet.seq_num),
+        packets,
+    )
+    measure("after (shared engine)", Packet.packet_to_bytes, packets)
+
+    windows = [packets[i : i + 16] for i in range(0, count, 16)]
+    start = time.perf_counter()
+    for window in windows:
+        Packet.construct_window(window)
+    elapsed = time.perf_counter() - start
+    print(f"  {'after (window batch)':<28} {count / elapsed:>12,.0f} pkt/s")
+
+    print("validate")
+    measure("before (table per call)", legacy_is_valid, datagrams)
+    measure("after (shared engine)", Packet.is_valid, datagrams)
+
+    print("validate + decode")
+    measure(
+        "two passes (is_valid+deconstr)",
+        lambda data: Packet.is_valid(data) and Packet.deconstruct(data),
+        datagrams,
+    )
+    measure("single pass (decode)", Packet.decode, datagrams)
+
+
+if __name__ == "__main__":
+    main()
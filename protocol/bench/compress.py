@@ -0,0 +1,112 @@
+"""
+File transfers with and without zlib compression.
+
+Text (package-lock.json from files, repeated) and random data are sent
+between two hosts on loopback, raw and with compression offered.
+Bytes on the wire are counted by the sending host. Loopback is not
+limited, so time shows CPU cost of compression, wire bytes show what
+a slow link would gain. Random data is not compressed, sampling skips it.
+Received files are deleted.
+
+Run from the protocol directory:
+
+    python -m bench.compress [megabytes]
+"""
+
+import os
+import sys
+import glob
+import time
+import logging
+import threading
+
+from host import Host
+from go.status import Status
+from go.adressinfo import AddressInfo
+
+
+""" Global variables """
+MEGABYTES = 8
+NAME = f"compressbench{os.getpid()}"
+TEXT = os.path.join("files", "package-lock_1702035109.json")
+
+
+def clean() -> None:
+    for path in glob.glob(os.path.join("files", NAME + "*")):
+        os.remove(path)
+
+
+def transfer(data: bytes, compression: bool) -> tuple[float, int, float | None]:
+    """Seconds, bytes sent and compression ratio of one transfer"""
+
+    send = Host._send
+    wire = [0]
+
+    sender, receiver = Host("127.0.0.1", 0), Host("127.0.0.2", 0)
+    sender.compression = compression
+
+    def counted(self, datagram: bytes, addr: AddressInfo):
+        if self is sender:
+            wire[0] += len(datagram)
+        send(self, datagram, addr)
+
+    Host._send = counted
+
+    for host in (sender, receiver):
+        host.register()
+        threading.Thread(target=host.run, daemon=True).start()
+
+    addr = AddressInfo(*receiver.get_bounded_ip_port())
+    sender.connect(*addr.values())
+    connection = sender.get_connection(addr)
+
+    while not connection.connected:
+        time.sleep(0.001)
+
+    wire[0] = 0
+    started = time.perf_counter()
+
+    sent = connection.send_file(data, NAME, ".bin")
+    ratio = None
+    while sent.alive != Status.DEAD:
+        ratio = sent.compression or ratio
+        time.sleep(0.001)
+
+    elapsed = time.perf_counter() - started
+
+    for host in (sender, receiver):
+        host.stop()
+    Host._send = send
+    clean()
+
+    return elapsed, wire[0], ratio
+
+
+def main():
+    megabytes = float(sys.argv[1]) if len(sys.argv) > 1 else MEGABYTES
+    size = int(megabytes * 1024 * 1024)
+
+    logging.disable(logging.WARNING)
+
+    text = open(TEXT, "rb").read()
+    kinds = {
+        "text": (text * (size // len(text) + 1))[:size],
+        "random": os.urandom(size),
+    }
+
+    print(f"{megabytes:.0f} MB of data")
+
+    for kind, data in kinds.items():
+        for compression in (False, True):
+            elapsed, wire, ratio = transfer(data, compression)
+            print(
+                f"  {kind:<7} {'zlib' if compression else 'raw':<5}"
+                f" {elapsed:>6.2f} s"
+                f" {len(data) / elapsed / 1e6:>7.1f} MB/s"
+                f" {wire / 1e6:>7.2f} MB on wire"
+                f"  ratio {f'{ratio:.3f}' if ratio else '-'}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Cost of the Host receive path with many peers.
+
+Datagrams from N distinct addresses are fed to Host._on_datagram, first
+creating N connections, then reaching existing ones. For comparison,
+the lookup which scanned a list of connections is timed as well.
+
+Run from the protocol directory:
+
+    python -m bench.connections [peers ...]
+"""
+
+import sys
+import time
+
+from host import Host
+from packet import Packet
+from go.flags import Flags
+from go.adressinfo import AddressInfo
+
+
+""" Global variables """
+PEERS = (1000, 10000, 50000)
+SCANS = 200  # Lookups timed for the list scan, it is slow
+
+
+def addresses(count: int) -> list[tuple[str, int]]:
+    """Distinct peer addresses, ports in the range accepted by Host"""
+
+    ports = 65536 - 49152
+
+    return [
+        (f"10.0.{i // ports // 256}.{i // ports % 256}", 49152 + i % ports)
+        for i in range(count)
+    ]
+
+
+def per_datagram(host: Host, datagram: bytes, addrs: list) -> float:
+    """Microseconds Host spends on one datagram"""
+
+    started = time.perf_counter()
+
+    for addr in addrs:
+        host._on_datagram(datagram, addr)
+
+    return (time.perf_counter() - started) / len(addrs) * 1e6
+
+
+def list_scan(addrs: list) -> float:
+    """Microseconds of one lookup in a list of connections"""
+
+    connections = [AddressInfo(*addr) for addr in addrs]
+    targets = [AddressInfo(*addr) for addr in addrs[-SCANS:]]
+
+    started = time.perf_counter()
+
+    for target in targets:
+        for connection in connections:
+            if connection == target:
+                break
+
+    return (time.perf_counter() - started) / len(targets) * 1e6
+
+
+def run(count: int, datagram: bytes) -> None:
+    host = Host("127.0.0.1", 50000)
+    addrs = addresses(count)
+
+    create = per_datagram(host, datagram, addrs)
+    lookup = per_datagram(host, datagram, addrs)
+    scan = list_scan(addrs)
+
+    print(
+        f"  {count:>6} peers"
+        f" {create:>8.2f} us new"
+        f" {lookup:>8.2f} us existing"
+        f" {scan:>10.2f} us list scan"
+    )
+
+
+def main():
+    peers = [int(arg) for arg in sys.argv[1:]] or PEERS
+
+    """ Keep-alive answer, it is queued but never handled here """
+    datagram = Packet.construct(b"", Flags.SYN | Flags.SACK, 2)
+
+    print("Per datagram, creating connection / reaching existing one")
+
+    for count in peers:
+        run(count, datagram)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Loss rate of paced and unpaced windows on loopback.
+
+Receiver socket has a small SO_RCVBUF, it is drained by a thread, which
+decodes every datagram. Sender sends one window every RTT, either
+back-to-back or spread over RTT by the Pacer used in Sender.
+
+Run from the protocol directory:
+
+    python -m bench.pacing [packets] [window] [rtt_ms] [rcvbuf_bytes]
+"""
+
+import os
+import sys
+import time
+import socket
+import threading
+
+from pacing import Pacer
+from packet import Packet
+from go.flags import Flags
+from go.version import Version
+
+
+def receiver(sock: socket.socket, stop: threading.Event, received: list) -> None:
+    """Count datagrams which made it through the socket buffer"""
+
+    sock.settimeout(0.05)
+
+    while not stop.is_set():
+        try:
+            data = sock.recv(2048)
+        except socket.timeout:
+            continue
+
+        if Packet.decode(data, Version.V2) is not None:
+            received[0] += 1
+
+
+def send_unpaced(sock, addr, datagrams: list, window: int, rtt: float) -> None:
+    """Whole window back-to-back, then wait for the rest of RTT"""
+
+    for start in range(0, len(datagrams), window):
+        started = time.perf_counter()
+
+        for datagram in datagrams[start : start + window]:
+            sock.sendto(datagram, addr)
+
+        time.sleep(max(rtt - (time.perf_counter() - started), 0))
+
+
+def send_paced(sock, addr, datagrams: list, window: int, rtt: float) -> None:
+    """Window spread evenly over RTT"""
+
+    pacer = Pacer()
+    pacer.update(window, rtt, slow_start=False)
+
+    index = 0
+    while index < len(datagrams):
+        count = min(pacer.available(), len(datagrams) - index)
+
+        for datagram in datagrams[index : index + count]:
+            sock.sendto(datagram, addr)
+
+        pacer.consume(count)
+        index += count
+
+        next_send = pacer.next_send()
+        if next_send is not None:
+            time.sleep(max(next_send - time.perf_counter(), 0))
+
+
+def run(name: str, send, datagrams: list, window: int, rtt: float, rcvbuf: int):
+    """Send all datagrams and print how many were dropped"""
+
+    recv_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    recv_sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+    recv_sock.bind(("127.0.0.1", 0))
+
+    send_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    stop = threading.Event()
+    received = [0]
+    thread = threading.Thread(target=receiver, args=(recv_sock, stop, received))
+    thread.start()
+
+    started = time.perf_counter()
+    send(send_sock, recv_sock.getsockname(), datagrams, window, rtt)
+    elapsed = time.perf_counter() - started
+
+    time.sleep(0.2)
+    stop.set()
+    thread.join()
+    recv_sock.close()
+    send_sock.close()
+
+    lost = len(datagrams) - received[0]
+    print(
+        f"  {name:<10} {elapsed:>6.2f} s"
+        f" {lost:>7} lost ({lost / len(datagrams):>6.1%})"
+    )
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    window = int(sys.argv[2]) if len(sys.argv) > 2 else 64
+    rtt = (float(sys.argv[3]) if len(sys.argv) > 3 else 20) / 1000
+    rcvbuf = int(sys.argv[4]) if len(sys.argv) > 4 else 16384
+
+    datagrams = [
+        Packet.construct(os.urandom(1465), Flags.SR, i, Version.V2)
+        for i in range(count)
+    ]
+
+    print(
+        f"{count} packets, window {window}, RTT {rtt * 1000:.0f} ms,"
+        f" SO_RCVBUF {rcvbuf} bytes"
+    )
+
+    run("unpaced", send_unpaced, datagrams, window, rtt, rcvbuf)
+    run("paced", send_paced, datagrams, window, rtt, rcvbuf)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Time the network loop spends on received file data, with and without
+the persistence worker.
+
+Fragments of a file are added to FileReassembly, which writes them
+in the loop, and to OffloadReassembly, which hands them to Persister.
+CPU of the loop process per fragment is what the worker takes off the
+loop, longest pass (PPT fragments) shows how long other connections
+would wait. With one core, worker competes with the loop for it, so
+wall time gains need a spare core. Files are written to a temporary
+directory.
+
+Run from the protocol directory:
+
+    python -m bench.persist [megabytes]
+"""
+
+import os
+import sys
+import time
+import tempfile
+
+from go.size import Size
+from persist import Persister
+from reassembly import FileReassembly, OffloadReassembly
+
+
+""" Global variables """
+MEGABYTES = 64
+FRAGMENT = 1468
+
+
+def passes(reassembly, data: bytes, flush=None) -> tuple[float, float]:
+    """
+    CPU of loop process and longest pass, PPT fragments each.
+    CPU is measured, so worker running on the same core is not counted.
+    """
+
+    fragments = len(data) // FRAGMENT + (len(data) % FRAGMENT > 0)
+    view = memoryview(data)
+
+    longest = 0.0
+    cpu = time.process_time()
+
+    for first in range(0, fragments, Size.PPT):
+        started = time.perf_counter()
+
+        for index in range(first, min(first + Size.PPT, fragments)):
+            fragment = view[index * FRAGMENT : (index + 1) * FRAGMENT]
+            while not reassembly.add(index, fragment):
+                """Ring is full, loop would drop it, sender resends"""
+                flush()
+
+        if flush is not None:
+            flush()
+
+        longest = max(longest, time.perf_counter() - started)
+
+    return time.process_time() - cpu, longest
+
+
+def report(name: str, size: int, cpu: float, longest: float, finish: float):
+    print(
+        f"  {name:<10}"
+        f" {cpu / size * 1e9 * FRAGMENT:>8.0f} ns CPU/fragment in loop"
+        f" {longest * 1e3:>8.2f} ms longest pass"
+        f" {finish * 1e3:>8.2f} ms finish in loop"
+    )
+
+
+def in_loop(directory: str, data: bytes) -> None:
+    reassembly = FileReassembly(
+        os.path.join(directory, "loop.bin"), FRAGMENT, len(data), 2**32
+    )
+
+    cpu, longest = passes(reassembly, data)
+
+    started = time.perf_counter()
+    reassembly.finish()
+    finish = time.perf_counter() - started
+
+    report("loop", len(data), cpu, longest, finish)
+
+
+def offloaded(directory: str, data: bytes) -> None:
+    persister = Persister()
+    persister.start()
+
+    reassembly = OffloadReassembly(
+        persister, os.path.join(directory, "worker.bin"), FRAGMENT, len(data), 2**32
+    )
+
+    cpu, longest = passes(reassembly, data, persister.flush)
+
+    saved = []
+    started = time.perf_counter()
+    reassembly.finish(saved.append)
+    finish = time.perf_counter() - started
+
+    """ Loop would read reports when pipe is readable """
+    while not saved:
+        persister.pipe.poll(None)
+        persister.on_readable()
+    written = time.perf_counter() - started
+
+    persister.close()
+
+    report("worker", len(data), cpu, longest, finish)
+    print(f"  {'':<10} worker saved file {written * 1e3:.0f} ms after finish")
+
+    if saved[0] is None or os.path.getsize(saved[0]) != len(data):
+        print("  worker failed to save file")
+
+
+def main():
+    megabytes = float(sys.argv[1]) if len(sys.argv) > 1 else MEGABYTES
+    data = os.urandom(int(megabytes * 1024 * 1024))
+
+    print(f"{megabytes:.0f} MB file, {FRAGMENT} B fragments, {Size.PPT} per pass")
+
+    with tempfile.TemporaryDirectory() as directory:
+        in_loop(directory, data)
+        offloaded(directory, data)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Time for a connection to find the largest datagram, which its path carries.
+
+Path is simulated on loopback: datagrams over the limit are dropped
+silently, as on a path which blocks ICMP, so only probes find the size.
+A connection is made for every limit, time is measured from connection
+until the search is over, with the size it ended with.
+
+Run from the protocol directory:
+
+    python -m bench.pmtu [limit ...]
+"""
+
+import sys
+import time
+import logging
+import threading
+
+from host import Host
+from connection import PROBE
+from go.adressinfo import AddressInfo
+
+
+""" Global variables """
+LIMITS = [1472, 1400, 1280, 1000, 576]
+TIMEOUT = 30
+
+
+def search(limit: int) -> None:
+    send = Host._send
+    probes = []
+
+    def path(self, data: bytes, addr: AddressInfo):
+        """Path drops datagrams over limit"""
+        if data[0] == PROBE:
+            probes.append(len(data))
+        if len(data) <= limit:
+            send(self, data, addr)
+
+    Host._send = path
+
+    a = Host("127.0.0.1", 0)
+    b = Host("127.0.0.2", 0)
+    for host in (a, b):
+        host.register()
+        threading.Thread(target=host.run, daemon=True).start()
+
+    started = time.perf_counter()
+    a.connect(*b.get_bounded_ip_port())
+    connection = a.get_connection(AddressInfo(*b.get_bounded_ip_port()))
+
+    while time.perf_counter() - started < TIMEOUT:
+        if connection.pmtu.confirmed and not connection.pmtu.searching:
+            break
+        time.sleep(0.01)
+
+    elapsed = time.perf_counter() - started
+
+    print(
+        f"  {limit:>5} B path"
+        f" {connection.pmtu.datagram:>5} B datagrams"
+        f" {connection.frag_size:>5} B fragments"
+        f" {len(probes):>3} probes"
+        f" {elapsed:>6.2f} s"
+    )
+
+    a.stop()
+    b.stop()
+    Host._send = send
+
+
+def main():
+    limits = [int(arg) for arg in sys.argv[1:]] or LIMITS
+
+    logging.disable(logging.WARNING)
+
+    for limit in limits:
+        search(limit)
+
+
+if __name__ == "__main__":
+    main()
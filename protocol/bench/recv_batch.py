@@ -0,0 +1,117 @@
+"""
+Cost of reading datagrams from the socket, one by one versus in batches.
+
+Socket receive buffer is filled with datagrams, then it is drained as
+Host does on readiness events: recvfrom per datagram, RecvBatch with
+recvfrom_into into its buffer, and RecvBatch with recvmmsg, when it is
+available.
+
+Run from the protocol directory:
+
+    python -m bench.recv_batch [datagrams] [batch]
+"""
+
+import sys
+import time
+import socket
+
+from go.size import Size
+from batch import LIBC, RecvBatch
+
+
+""" Global variables """
+DATAGRAMS = 2000  # Fit into default receive buffer with its overhead
+ROUNDS = 50
+PAYLOAD = b"\0" * 1400
+
+
+def sockets() -> tuple[socket.socket, socket.socket]:
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 8 * 1024 * 1024)
+    receiver.bind(("127.0.0.1", 0))
+    receiver.setblocking(False)
+
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sender.bind(("127.0.0.2", 0))
+
+    return receiver, sender
+
+
+def fill(sender: socket.socket, addr: tuple[str, int], count: int) -> None:
+    for _ in range(count):
+        sender.sendto(PAYLOAD, addr)
+
+
+def one_by_one(receiver: socket.socket, batch: int) -> int:
+    """Loop of V4 before batching, recvfrom until socket is empty"""
+
+    received = 0
+    while True:
+        for _ in range(batch):
+            try:
+                receiver.recvfrom(Size.DATAGRAM)
+            except BlockingIOError:
+                return received
+            received += 1
+
+
+def batched(reader: RecvBatch) -> int:
+    received = 0
+    while True:
+        datagrams = reader.read()
+        if not datagrams:
+            return received
+        received += len(datagrams)
+
+
+def run(name: str, drain, count: int) -> None:
+    receiver, sender = sockets()
+    addr = receiver.getsockname()
+    drain = drain(receiver)
+
+    elapsed = 0.0
+    received = 0
+
+    for _ in range(ROUNDS):
+        fill(sender, addr, count)
+
+        started = time.perf_counter()
+        received += drain()
+        elapsed += time.perf_counter() - started
+
+    receiver.close()
+    sender.close()
+
+    print(
+        f"  {name:<14}"
+        f" {elapsed / received * 1e9:>7.0f} ns/datagram"
+        f" {received / elapsed:>12.0f} datagrams/s"
+    )
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else DATAGRAMS
+    batch = int(sys.argv[2]) if len(sys.argv) > 2 else Size.PPT
+
+    print(f"{count} datagrams of {len(PAYLOAD)} B, batch {batch}, {ROUNDS} rounds")
+
+    run("recvfrom", lambda sock: lambda: one_by_one(sock, batch), count)
+
+    def recvfrom_into(sock):
+        reader = RecvBatch(sock, batch, mmsg=False)
+        return lambda: batched(reader)
+
+    run("recvfrom_into", recvfrom_into, count)
+
+    def recvmmsg(sock):
+        reader = RecvBatch(sock, batch, mmsg=True)
+        return lambda: batched(reader)
+
+    if LIBC is not None:
+        run("recvmmsg", recvmmsg, count)
+    else:
+        print("  recvmmsg is not available")
+
+
+if __name__ == "__main__":
+    main()
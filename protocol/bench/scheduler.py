@@ -0,0 +1,116 @@
+"""
+CPU used by the loop with many transfers, polling versus Scheduler.
+
+Idle transfers only need to run for keep-alive, active ones wake up
+every ACK_DELAY. Polling runs every iterator after each select timeout,
+as the V4 loop did, Scheduler runs only those whose timer expired.
+Every size is measured with all transfers idle and with ACTIVE of them
+active.
+
+Run from the protocol directory:
+
+    python -m bench.scheduler [seconds] [transfers ...]
+"""
+
+import sys
+import time
+import random
+import socket
+
+from go.time import Time
+from recv import ACK_DELAY
+from go.status import Status
+from scheduler import Scheduler
+from selectors import DefaultSelector, EVENT_READ
+
+
+""" Global variables """
+TRANSFERS = (100, 1000, 10000)
+ACTIVE = 10  # Transfers which wake up every ACK_DELAY
+SELECT_TIMEOUT = 0.01  # Wait of the polling loop
+
+
+class Transfer:
+    """Iterator with a timer, like Sender and Receiver"""
+
+    def __init__(self, interval: float):
+        self.__interval = interval
+        self.__next = time.perf_counter() + random.random() * interval
+        self.runs = 0
+
+    def _iterator(self) -> Status:
+        self.runs += 1
+
+        now = time.perf_counter()
+        if now >= self.__next:
+            self.__next = now + self.__interval
+
+        return Status.SLEEPING
+
+    def wakeup(self) -> float:
+        return self.__next
+
+
+def transfers(count: int, active: int) -> list[Transfer]:
+    return [
+        Transfer(ACK_DELAY if i < active else Time.RESEND) for i in range(count)
+    ]
+
+
+def polling(tasks: list[Transfer], seconds: float) -> None:
+    selector = DefaultSelector()
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("127.0.0.1", 0))
+    selector.register(sock, EVENT_READ)
+
+    stop = time.perf_counter() + seconds
+    while time.perf_counter() < stop:
+        selector.select(timeout=SELECT_TIMEOUT)
+        for task in tasks:
+            task._iterator()
+
+    selector.close()
+    sock.close()
+
+
+def scheduled(tasks: list[Transfer], seconds: float) -> None:
+    scheduler = Scheduler()
+    for task in tasks:
+        scheduler.add(task._iterator, task.wakeup)
+
+    stop = time.perf_counter() + seconds
+    while time.perf_counter() < stop:
+        scheduler.run_once()
+
+    scheduler.close()
+
+
+def run(name: str, loop, count: int, active: int, seconds: float) -> None:
+    tasks = transfers(count, active)
+
+    started = time.process_time()
+    loop(tasks, seconds)
+    cpu = time.process_time() - started
+
+    runs = sum(task.runs for task in tasks)
+    print(
+        f"  {count:>6} transfers {active:>3} active {name:<10}"
+        f" {cpu / seconds:>7.1%} CPU"
+        f" {runs / seconds:>12.0f} runs/s"
+    )
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 2.0
+    counts = [int(arg) for arg in sys.argv[2:]] or TRANSFERS
+
+    print(f"{seconds:.0f} s each")
+
+    for count in counts:
+        for active in (0, ACTIVE):
+            run("polling", polling, count, active, seconds)
+            run("scheduler", scheduled, count, active, seconds)
+
+
+if __name__ == "__main__":
+    main()
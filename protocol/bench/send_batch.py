@@ -0,0 +1,123 @@
+"""
+Cost of sending datagrams of one loop pass, one by one versus in batches.
+
+A pass sends a window of data fragments to one peer and an ACK to each of
+a few other peers, as a sending node does. It is sent by sendto per
+datagram, and by SendBatch with UDP GSO, with sendmmsg and with both.
+Receiving sockets are drained between passes, outside of measured time.
+
+Run from the protocol directory:
+
+    python -m bench.send_batch [window] [peers]
+"""
+
+import sys
+import time
+import socket
+
+from batch import LIBC, SendBatch
+
+
+""" Global variables """
+WINDOW = 32  # Data fragments of one pass
+PEERS = 4  # Peers which get an ACK every pass
+PASSES = 500
+FRAGMENT = b"\0" * 1471
+ACK = b"\0" * 12
+
+
+def receivers(count: int) -> list[socket.socket]:
+    socks = []
+
+    for i in range(count):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 8 * 1024 * 1024)
+        sock.bind((f"127.0.1.{i + 1}", 0))
+        sock.setblocking(False)
+        socks.append(sock)
+
+    return socks
+
+
+def drain(sock: socket.socket) -> int:
+    received = 0
+    while True:
+        try:
+            sock.recv(2048)
+        except BlockingIOError:
+            return received
+        received += 1
+
+
+def datagrams(socks: list[socket.socket], window: int) -> list:
+    """One pass, window to first peer, ACK to the others"""
+
+    data, *others = [sock.getsockname() for sock in socks]
+
+    return [(FRAGMENT, data)] * window + [(ACK, addr) for addr in others]
+
+
+def run(name: str, window: int, peers: int, **options) -> None:
+    socks = receivers(peers + 1)
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sender.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 8 * 1024 * 1024)
+    sender.bind(("127.0.0.2", 0))
+    sender.setblocking(False)
+
+    batch = SendBatch(sender, **options) if options else None
+    one_pass = datagrams(socks, window)
+
+    elapsed = 0.0
+    received = 0
+    syscalls = 0
+
+    for _ in range(PASSES):
+        started = time.perf_counter()
+
+        if batch is None:
+            for data, addr in one_pass:
+                sender.sendto(data, addr)
+            syscalls += len(one_pass)
+        else:
+            for data, addr in one_pass:
+                batch.push(data, addr)
+            batch.flush()
+
+        elapsed += time.perf_counter() - started
+        received += sum(drain(sock) for sock in socks)
+
+    if batch is not None:
+        syscalls = batch.syscalls
+
+    sent = PASSES * len(one_pass)
+
+    print(
+        f"  {name:<10}"
+        f" {elapsed / sent * 1e9:>7.0f} ns/datagram"
+        f" {syscalls / PASSES:>6.1f} syscalls/pass"
+        f" {sent - received:>6} lost"
+    )
+
+    for sock in socks + [sender]:
+        sock.close()
+
+
+def main():
+    window = int(sys.argv[1]) if len(sys.argv) > 1 else WINDOW
+    peers = int(sys.argv[2]) if len(sys.argv) > 2 else PEERS
+
+    print(f"{window} fragments and {peers} ACKs per pass, {PASSES} passes")
+
+    run("sendto", window, peers)
+
+    if LIBC is None:
+        print("  GSO and sendmmsg are not available")
+        return
+
+    run("gso", window, peers, gso=True)
+    run("sendmmsg", window, peers, gso=False, mmsg=True)
+    run("both", window, peers, gso=True, mmsg=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Receive throughput of a node with many peers, by number of workers.
+
+Node runs as Supervisor with W workers sharing one port. Every peer is
+a process with its own Host and ip, all of them send a file to the node
+at once. Throughput is total bytes over time until the last transfer
+is finished. Received files are deleted.
+Workers only help when there are cores for them and peers are spread
+among workers by the kernel hash of their addresses.
+
+Run from the protocol directory:
+
+    python -m bench.workers [peers] [megabytes] [workers ...]
+"""
+
+import os
+import sys
+import glob
+import time
+import logging
+import threading
+import multiprocessing
+
+from host import Host
+from go.status import Status
+from workers import Supervisor
+from go.adressinfo import AddressInfo
+
+
+""" Global variables """
+PEERS = 8
+MEGABYTES = 2
+NODE = "127.0.0.1"
+NAME = f"workersbench{os.getpid()}"
+
+
+def clean() -> None:
+    for path in glob.glob(os.path.join("files", NAME + "*")):
+        os.remove(path)
+
+
+def peer(index: int, node: tuple, size: int, start, done) -> None:
+    """Connect to node, wait for start, send file, report time"""
+
+    logging.disable(logging.WARNING)
+
+    host = Host(f"127.0.1.{index + 1}", 0)
+    host.register()
+    threading.Thread(target=host.run, daemon=True).start()
+
+    addr = AddressInfo(*node)
+    host.connect(*node)
+    connection = host.get_connection(addr)
+
+    while not connection.connected:
+        time.sleep(0.001)
+
+    data = os.urandom(size)
+    start.wait()
+
+    transfer = connection.send_file(data, f"{NAME}_{index}", ".bin")
+    while transfer.alive != Status.DEAD:
+        time.sleep(0.001)
+
+    done.put((time.perf_counter(), transfer.completed))
+
+    host.stop()
+
+
+def run(workers: int, peers: int, size: int) -> None:
+    supervisor = Supervisor(NODE, 0, workers)
+    if not supervisor.start():
+        return
+
+    start = multiprocessing.Event()
+    done = multiprocessing.Queue()
+
+    processes = [
+        multiprocessing.Process(
+            target=peer, args=(i, supervisor.me.values(), size, start, done)
+        )
+        for i in range(peers)
+    ]
+    for process in processes:
+        process.start()
+
+    """ Peers connect and prepare data before the clock starts """
+    time.sleep(1)
+    started = time.perf_counter()
+    start.set()
+
+    results = [done.get() for _ in processes]
+    elapsed = max(finished for finished, _ in results) - started
+
+    for process in processes:
+        process.join()
+
+    stats = supervisor.stats()
+    supervisor.stop()
+    clean()
+
+    spread = "/".join(str(worker["connections"]) for worker in stats["workers"])
+    completed = sum(ok for _, ok in results)
+
+    print(
+        f"  {workers:>2} workers"
+        f" {peers * size / elapsed / 1e6:>8.1f} MB/s"
+        f" {completed}/{peers} completed"
+        f"  peers per worker {spread}"
+    )
+
+
+def main():
+    peers = int(sys.argv[1]) if len(sys.argv) > 1 else PEERS
+    size = int(float(sys.argv[2]) * 1e6) if len(sys.argv) > 2 else MEGABYTES * 10**6
+    counts = [int(arg) for arg in sys.argv[3:]] or sorted({1, os.cpu_count() or 1})
+
+    logging.disable(logging.WARNING)
+
+    print(f"{peers} peers, {size / 1e6:.0f} MB each, {os.cpu_count()} cores")
+
+    for workers in counts:
+        run(workers, peers, size)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+import os
+import socket
+import logging
+
+from go.size import Size
+
+
+""" Global variables """
+LOGGER = logging.getLogger("Buffers")
+SO_RCVBUFFORCE = getattr(socket, "SO_RCVBUFFORCE", 33)  # Above rmem_max, needs CAP_NET_ADMIN
+SO_SNDBUFFORCE = getattr(socket, "SO_SNDBUFFORCE", 32)  # Above wmem_max, needs CAP_NET_ADMIN
+PROC_UDP = "/proc/net/udp"
+
+
+def needed(window: int, datagram: int) -> int:
+    """
+    Socket buffer for a window of datagrams.
+    Every datagram costs its kernel bookkeeping as well, and kernel frees
+    memory of read datagrams in quarters of the buffer.
+    """
+
+    return window * (datagram + Size.DATAGRAM_OVERHEAD) * 4 // 3
+
+
+def size_buffers(sock: socket.socket, window: int, datagram: int) -> tuple[int, int]:
+    """
+    Grow receive and send buffers, so that a window fits into them.
+    Buffers are never shrunk. Returns sizes which kernel gave.
+    """
+
+    size = needed(window, datagram)
+
+    return (
+        _grow(sock, socket.SO_RCVBUF, SO_RCVBUFFORCE, size, "net.core.rmem_max"),
+        _grow(sock, socket.SO_SNDBUF, SO_SNDBUFFORCE, size, "net.core.wmem_max"),
+    )
+
+
+def _grow(sock: socket.socket, option: int, force: int, size: int, limit: str) -> int:
+    """Set buffer, over system limit when process is allowed to"""
+
+    current = sock.getsockopt(socket.SOL_SOCKET, option)
+    if current >= size:
+        return current
+
+    """ Kernel doubles the value for its bookkeeping, getsockopt returns doubled one """
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, force, (size + 1) // 2)
+    except OSError:
+        sock.setsockopt(socket.SOL_SOCKET, option, (size + 1) // 2)
+
+    current = sock.getsockopt(socket.SOL_SOCKET, option)
+    if current < size:
+        LOGGER.warning(
+            f"Socket buffer is {current} bytes instead of {size}, raise {limit}"
+        )
+
+    return current
+
+
+def kernel_drops(sock: socket.socket) -> int | None:
+    """
+    Datagrams which kernel dropped, because socket buffer was full.
+    Read from /proc/net/udp by inode of the socket, None where it is missing.
+    """
+
+    try:
+        inode = str(os.fstat(sock.fileno()).st_ino)
+        with open(PROC_UDP) as proc:
+            next(proc)
+            for line in proc:
+                fields = line.split()
+                if fields[9] == inode:
+                    return int(fields[-1])
+    except (OSError, ValueError, IndexError, StopIteration):
+        return None
+
+    return None
@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+import os
+import mmap
+import logging
+import threading
+
+from typing import Callable
+from functools import partial
+from collections import OrderedDict
+
+
+""" Global variables """
+LOGGER = logging.getLogger("Cache")
+
+
+class CacheEntry:
+    """Memory-mapped file shared by all senders of that file"""
+
+    def __init__(self, buffer: mmap.mmap):
+        self.buffer = buffer
+        self.size = len(buffer)
+        self.refs = 0
+
+
+class ContentCache:
+    """
+    Process-wide cache of file contents, shared by concurrent senders.
+    Entries are keyed by path, size and mtime, so a changed file is mapped again.
+    Entries are reference-counted, unused ones are evicted in LRU order,
+    when memory budget is exceeded.
+    """
+
+    def __init__(self, budget: int = 512 * 1024**2):
+        self.__budget = budget
+        self.__size = 0
+
+        self.__entries: OrderedDict[tuple, CacheEntry] = OrderedDict()
+        self.__lock = threading.Lock()
+
+    @property
+    def budget(self) -> int:
+        return self.__budget
+
+    @budget.setter
+    def budget(self, value: int) -> None:
+        with self.__lock:
+            self.__budget = value
+            self._evict()
+
+    @property
+    def size(self) -> int:
+        return self.__size
+
+    def acquire(self, path: str) -> tuple[mmap.mmap, Callable] | None:
+        """Get shared buffer of file and function which releases it"""
+
+        try:
+            stat = os.stat(path)
+        except OSError as e:
+            LOGGER.error(f"Failed to stat {path}: {e}")
+            return None
+
+        key = (os.path.realpath(path), stat.st_size, stat.st_mtime_ns)
+
+        with self.__lock:
+            entry = self.__entries.get(key)
+
+            if entry is None:
+                try:
+                    with open(path, "rb") as file:
+                        buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+                except (OSError, ValueError) as e:
+                    LOGGER.error(f"Failed to map {path}: {e}")
+                    return None
+
+                entry = CacheEntry(buffer)
+                self.__entries[key] = entry
+                self.__size += entry.size
+                LOGGER.debug(f"Cached {path}, cache size: {self.__size}")
+
+            entry.refs += 1
+            self.__entries.move_to_end(key)
+
+            self._evict()
+
+        return entry.buffer, partial(self.release, key)
+
+    def release(self, key: tuple) -> None:
+        """Drop one reference, entry stays cached until it is evicted"""
+
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is None:
+                return
+
+            entry.refs = max(entry.refs - 1, 0)
+            self._evict()
+
+    def clear(self) -> None:
+        """Evict every unused entry"""
+
+        with self.__lock:
+            budget, self.__budget = self.__budget, 0
+            self._evict()
+            self.__budget = budget
+
+    def _evict(self) -> None:
+        """Evict least recently used entries, which nobody uses"""
+
+        for key, entry in list(self.__entries.items()):
+            if self.__size <= self.__budget:
+                return
+
+            if entry.refs > 0:
+                continue
+
+            try:
+                entry.buffer.close()
+            except BufferError as e:
+                LOGGER.debug(f"Buffer of {key[0]} is still in use: {e}")
+                continue
+
+            del self.__entries[key]
+            self.__size -= entry.size
+            LOGGER.debug(f"Evicted {key[0]}, cache size: {self.__size}")
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+    def __repr__(self) -> str:
+        return f"ContentCache({len(self)}, {self.__size}, {self.__budget})"
+
+
+""" Shared by every connection of the process """
+CONTENT_CACHE = ContentCache()
@@ -0,0 +1,155 @@
+import zlib
+import logging
+
+
+""" Global variables """
+LOGGER = logging.getLogger("Compress")
+LEVEL = 1  # Fastest zlib level, compression runs in the network loop
+CHUNK = 16 * 1024  # Data compressed at once, when fragments run out
+SAMPLES = 4  # Samples spread over data, which decide if it is compressed
+SAMPLE = 16 * 1024
+SKIP_RATIO = 0.9  # Data which samples do not shrink below that is sent raw
+MIN_SIZE = 512  # Smaller data is sent raw, zlib header would eat the gain
+
+
+def compressible(data: memoryview) -> bool:
+    """Compress samples of data, check if it is worth compressing"""
+
+    size = len(data)
+    if size < MIN_SIZE:
+        return False
+
+    step = max(size // SAMPLES, SAMPLE)
+    sampled = compressed = 0
+
+    for start in range(0, size, step)[:SAMPLES]:
+        sample = data[start : start + SAMPLE]
+        sampled += len(sample)
+        compressed += len(zlib.compress(sample, LEVEL))
+
+    ratio = compressed / sampled
+    LOGGER.debug(f"Sampled compression ratio {ratio:.2f}")
+
+    return ratio < SKIP_RATIO
+
+
+class Deflater:
+    """
+    zlib stream of data, compressed chunk by chunk as fragments are taken.
+    Only compressed bytes, which are not taken yet, are kept.
+    Fragments are copies, packets in flight keep them for resending.
+    """
+
+    def __init__(self, data: memoryview, fragment_size: int, level: int = LEVEL):
+        self.__data = data
+        self.__fragment_size = fragment_size
+        self.__compressor = zlib.compressobj(level)
+
+        self.__consumed = 0
+        self.__produced = 0
+        self.__pending = bytearray()
+        self.__flushed = False
+
+    @property
+    def ratio(self) -> float | None:
+        """Compressed bytes per byte of data, None until data is compressed"""
+        if not self.__consumed:
+            return None
+        return self.__produced / self.__consumed
+
+    def has_more(self) -> bool:
+        """Check if there is a fragment to take"""
+
+        self._fill(1)
+        return bool(self.__pending)
+
+    def next_fragment(self) -> bytes:
+        """Take next fragment of stream, last one can be shorter"""
+
+        self._fill(self.__fragment_size)
+
+        fragment = bytes(self.__pending[: self.__fragment_size])
+        del self.__pending[: self.__fragment_size]
+
+        return fragment
+
+    def _fill(self, size: int) -> None:
+        """Compress data, until size bytes are pending or stream is over"""
+
+        while len(self.__pending) < size and not self.__flushed:
+            if self.__consumed < len(self.__data):
+                chunk = self.__data[self.__consumed : self.__consumed + CHUNK]
+                self.__consumed += len(chunk)
+                output = self.__compressor.compress(chunk)
+            else:
+                output = self.__compressor.flush()
+                self.__flushed = True
+
+            self.__produced += len(output)
+            self.__pending += output
+
+
+class Inflater:
+    """
+    zlib stream inflated in order of fragments.
+    Output is taken piece by piece, so caller can stop when storage is full.
+    Output never grows over size announced by sender.
+    """
+
+    def __init__(self, size: int | None):
+        self.__size = size
+        self.__decompressor = zlib.decompressobj()
+        self.__input = b""
+        self.__more = False
+        self.__produced = 0
+        self.__broken = False
+
+    @property
+    def finished(self) -> bool:
+        """Check if whole stream was inflated into announced size"""
+        return (
+            not self.__broken
+            and self.__decompressor.eof
+            and self.__size in (None, self.__produced)
+        )
+
+    @property
+    def idle(self) -> bool:
+        """Check if all output of last part was taken"""
+        return not self.__more
+
+    def inflate(self, data: bytes) -> None:
+        """Next part of stream, its output is taken by next_piece"""
+
+        self.__input = data
+        self.__more = not (self.__broken or self.__decompressor.eof)
+
+    def next_piece(self) -> bytes | None:
+        """Next piece of output, at most CHUNK bytes, None when part is done"""
+
+        if not self.__more:
+            return None
+
+        try:
+            piece = self.__decompressor.decompress(self.__input, CHUNK)
+        except zlib.error as e:
+            LOGGER.error(f"Compressed data is broken: {e}")
+            return self._break()
+
+        self.__input = self.__decompressor.unconsumed_tail
+
+        self.__produced += len(piece)
+        if self.__size is not None and self.__produced > self.__size:
+            LOGGER.error("Inflated data is over announced size")
+            return self._break()
+
+        """ Full piece can leave output inside zlib, even without input """
+        if self.__decompressor.eof or not self.__input and len(piece) < CHUNK:
+            self.__more = False
+
+        return piece
+
+    def _break(self) -> None:
+        self.__broken = True
+        self.__more = False
+        self.__input = b""
@@ -0,0 +1,239 @@
+import time
+import logging
+
+from go.size import Size
+from collections import deque
+
+
+""" Global variables """
+LOGGER = logging.getLogger("Congestion")
+HISTORY = 1024  # Number of remembered window changes
+
+
+class CongestionControl:
+    """
+    Base of congestion controllers, windows are counted in packets.
+    Keeps fixed window, subclasses grow and shrink it from ACK and loss signals.
+    Every change of window is remembered in history, for tuning.
+    """
+
+    name = "fixed"
+
+    def __init__(
+        self,
+        initial_window: int = Size.WINDOW_SIZE,
+        max_window: int = Size.MAX_WINDOW,
+    ):
+        self._cwnd = float(initial_window)
+        self._ssthresh = float(max_window)
+        self._max_window = max_window
+        self._recovery = 0.0
+        self._recovering = False
+
+        self.__history: deque[tuple[float, int, int, str]] = deque(maxlen=HISTORY)
+        self._record("init")
+
+    @property
+    def cwnd(self) -> int:
+        return max(int(self._cwnd), 1)
+
+    @property
+    def ssthresh(self) -> int:
+        return int(self._ssthresh)
+
+    @property
+    def recovering(self) -> bool:
+        """In fast recovery, until every packet sent before the loss is acked"""
+        return self._recovering
+
+    @property
+    def history(self) -> list[tuple[float, int, int, str]]:
+        """(time, cwnd, ssthresh, event) of every window change"""
+        return list(self.__history)
+
+    def on_ack(self, acked: int, rtt: float | None = None) -> None:
+        """Packets were acknowledged, rtt is the newest sample if any"""
+
+    def on_loss(self, sent_at: float) -> bool:
+        """
+        Packet sent at perf_counter time was lost, later ones got through.
+        True if it started fast recovery.
+        """
+
+        return False
+
+    def on_recovered(self) -> None:
+        """Every packet sent before the loss was acked"""
+
+        self._recovering = False
+
+    def on_timeout(self, sent_at: float) -> None:
+        """Retransmission timer of packet sent at perf_counter time expired"""
+
+    def stats(self) -> dict:
+        """State of controller, for monitoring"""
+
+        return {
+            "algorithm": self.name,
+            "cwnd": self.cwnd,
+            "ssthresh": self.ssthresh,
+            "recovering": self._recovering,
+            "changes": len(self.__history),
+        }
+
+    def _in_recovery(self, sent_at: float) -> bool:
+        """
+        Only one reduction per window of data,
+        packets sent before last reduction were lost in the same event.
+        """
+
+        if sent_at <= self._recovery:
+            return True
+
+        self._recovery = time.perf_counter()
+        return False
+
+    def _limit(self) -> None:
+        self._cwnd = min(max(self._cwnd, 1.0), float(self._max_window))
+
+    def _record(self, event: str) -> None:
+        self.__history.append((time.time(), self.cwnd, self.ssthresh, event))
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.cwnd}, {self.ssthresh})"
+
+
+class NewReno(CongestionControl):
+    """
+    Loss-based AIMD controller (RFC 6582).
+    Slow start doubles window every RTT until ssthresh, congestion avoidance
+    adds one packet per RTT, loss halves the window, timeout restarts slow start.
+    Loss starts fast recovery, window does not grow until every packet sent
+    before it is acked, sender resends the first unacked one on partial acks.
+    """
+
+    name = "newreno"
+
+    def on_ack(self, acked: int, rtt: float | None = None) -> None:
+        if acked <= 0 or self._recovering:
+            return
+
+        cwnd = self.cwnd
+
+        if self._cwnd < self._ssthresh:
+            self._cwnd += acked
+        else:
+            self._cwnd += acked / self._cwnd
+
+        self._limit()
+        if self.cwnd != cwnd:
+            self._record("ack")
+
+    def on_loss(self, sent_at: float) -> bool:
+        if self._in_recovery(sent_at):
+            return False
+
+        self._ssthresh = max(self._cwnd / 2, 2.0)
+        self._cwnd = self._ssthresh
+        self._limit()
+        self._recovering = True
+        self._record("loss")
+
+        return True
+
+    def on_recovered(self) -> None:
+        super().on_recovered()
+        self._record("recovered")
+
+    def on_timeout(self, sent_at: float) -> None:
+        """Timeout ends fast recovery, slow start resends the window"""
+
+        self._recovering = False
+
+        if self._in_recovery(sent_at):
+            return
+
+        self._ssthresh = max(self._cwnd / 2, 2.0)
+        self._cwnd = 1.0
+        self._record("timeout")
+
+
+class Vegas(NewReno):
+    """
+    Delay-based controller (TCP Vegas).
+    Compares expected and actual throughput once per RTT, number of packets
+    queued in the path is kept between ALPHA and BETA.
+    Delay below JITTER is not counted as queueing, acknowledgements are delayed
+    by receiver and both sides poll their sockets.
+    Loss and timeout are handled as in NewReno.
+    """
+
+    name = "vegas"
+
+    ALPHA = 2
+    BETA = 4
+    GAMMA = 1
+    JITTER = 0.01
+
+    def __init__(
+        self,
+        initial_window: int = Size.WINDOW_SIZE,
+        max_window: int = Size.MAX_WINDOW,
+    ):
+        super().__init__(initial_window, max_window)
+
+        self.__base_rtt: float | None = None
+        self.__min_rtt: float | None = None
+        self.__next_adjust = 0.0
+
+    def on_ack(self, acked: int, rtt: float | None = None) -> None:
+        if acked <= 0 or rtt is None or rtt <= 0:
+            return
+
+        if self.__base_rtt is None or rtt < self.__base_rtt:
+            self.__base_rtt = rtt
+        if self.__min_rtt is None or rtt < self.__min_rtt:
+            self.__min_rtt = rtt
+
+        """ Adjust once per RTT, with the smallest RTT seen in it, not in recovery """
+        now = time.perf_counter()
+        if now < self.__next_adjust or self._recovering:
+            return
+
+        cwnd = self.cwnd
+        delay = max(self.__min_rtt - self.__base_rtt - self.JITTER, 0.0)
+        queued = self._cwnd * delay / self.__min_rtt
+
+        if self._cwnd < self._ssthresh:
+            if queued > self.GAMMA:
+                """ Leave slow start with window which fills the path """
+                self._cwnd = max(self._cwnd - queued + 1, 2.0)
+                self._ssthresh = min(self._ssthresh, self._cwnd - 1)
+            else:
+                self._cwnd *= 2
+        elif queued < self.ALPHA:
+            self._cwnd += 1
+        elif queued > self.BETA:
+            self._cwnd = max(self._cwnd - 1, 2.0)
+            self._ssthresh = min(self._ssthresh, self._cwnd - 1)
+
+        self._limit()
+        if self.cwnd != cwnd:
+            self._record("delay")
+
+        self.__next_adjust = now + self.__min_rtt
+        self.__min_rtt = None
+
+    def stats(self) -> dict:
+        stats = super().stats()
+        stats["base_rtt"] = self.__base_rtt
+        return stats
+
+
+""" Algorithms selectable per connection """
+CONTROLLERS: dict[str, type[CongestionControl]] = {
+    CongestionControl.name: CongestionControl,
+    NewReno.name: NewReno,
+    Vegas.name: Vegas,
+}
+DEFAULT = NewReno.name
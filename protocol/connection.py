@@ -1,25 +1,50 @@
 import time
 import logging
 
+from collections import deque
+
 from send import Sender
 from go.time import Time
-from packet import Packet
+from go.size import Size
+from packet import Packet, HANDSHAKE_FLAGS, HEADERS
 from recv import Receiver
+from rtt import RttEstimator
+from congestion import CONTROLLERS, DEFAULT
+from pacing import Pacer
+from pmtu import PathMtu, PROBE_TIMEOUT, path_mtu
+from scheduler import at_wall
 from go.flags import Flags
 from typing import Callable
 from go.status import Status
+from go.version import Version
 from go.adressinfo import AddressInfo
 
 
 """ Global variables """
 LOGGER = logging.getLogger("Connection")
+PROBE = Flags.SYN | Flags.FIN  # Path MTU probe, padded to probed size
+PROBE_FLAGS = (PROBE, PROBE | Flags.ACK)
+CONNECTING_FLAGS = (Flags.SYN, Flags.SYN | Flags.ACK)  # Sent by peers not connected
+BLACK_HOLE = 3  # Timeouts in a row, after which fragment size is confirmed again
 
 
 class ConnectionWith:
-    def __init__(self, addr: AddressInfo, send_func: Callable, frag_size: int):
+    def __init__(
+        self,
+        addr: AddressInfo,
+        send_func: Callable,
+        frag_size: int,
+        recv_buffer: int = Size.RECV_BUFFER,
+    ):
         self._add_iterator = NotImplemented
+        self._del_connection = NotImplemented
+        self._wake = NotImplemented
+        self._on_received = None
+        self._persister = None
+        self._receivers = None
         self.__send_func = send_func
         self.__frag_size = frag_size
+        self.__recv_buffer = recv_buffer
 
         self.__alive = Status.ALIVE
         self.__connecting = False
@@ -31,9 +56,17 @@ class ConnectionWith:
         self.__last_time = time.time()
         self.__keep_alive = Time.KEEPALIVE
         self.__last_transfer = Flags.SR - 1
+        self.__version = Version.V1
+        self.__rtt = RttEstimator()
+        self.__congestion = DEFAULT
+        self.__pacing = False
+        self.__compression = False
+
+        """ Fragments are lowered to what path to peer carries """
+        self.__pmtu = PathMtu(frag_size + max(h.size for h in HEADERS.values()))
 
         self.__transfers: dict[int, Sender | Receiver] = {}
-        self.__packets: list[Packet] = []
+        self.__packets: deque[Packet] = deque()
 
     @property
     def last_time(self) -> float:
@@ -49,7 +82,85 @@ class ConnectionWith:
 
     @property
     def frag_size(self) -> int:
-        return self.__frag_size
+        """Fragment size of new transfers, configured one or less by path MTU"""
+        return min(
+            self.__frag_size, self.__pmtu.datagram - HEADERS[self.__version].size
+        )
+
+    @property
+    def pmtu(self) -> PathMtu:
+        return self.__pmtu
+
+    @property
+    def version(self) -> Version:
+        return self.__version
+
+    @property
+    def transfers(self) -> int:
+        """Number of running transfers"""
+        return len(self.__transfers)
+
+    @property
+    def rtt(self) -> RttEstimator:
+        return self.__rtt
+
+    @property
+    def congestion(self) -> str:
+        """Congestion control algorithm of new transfers"""
+        return self.__congestion
+
+    @congestion.setter
+    def congestion(self, value: str) -> None:
+        if value not in CONTROLLERS:
+            LOGGER.warning(f"Unknown congestion control {value}")
+            return
+        self.__congestion = value
+
+    @property
+    def pacing(self) -> bool:
+        """Pace packets of new transfers over RTT"""
+        return self.__pacing
+
+    @pacing.setter
+    def pacing(self, value: bool) -> None:
+        self.__pacing = value
+
+    @property
+    def compression(self) -> bool:
+        """Offer zlib for new transfers"""
+        return self.__compression
+
+    @compression.setter
+    def compression(self, value: bool) -> None:
+        self.__compression = value
+
+    def wakeup(self) -> float | None:
+        """perf_counter time when keep-alive needs to run"""
+
+        if self.__alive == Status.DEAD or self.__resend_time is None:
+            return time.perf_counter()
+
+        wake_at = []
+
+        """ Keep-alive is not sent, while SYN is resent """
+        if self.__connecting:
+            wake_at.append(self.__last_time + Time.CONN_RESEND)
+        elif self.__resend_keep:
+            wake_at.append(self.__resend_time + Time.RESEND - 1)
+        if self.__connected:
+            wake_at.append(self.__resend_time + Time.RESEND)
+
+        probe_at = self.__pmtu.wakeup(self._probe_timeout())
+        if self.__connected and probe_at is not None:
+            """ Probe time is perf_counter already """
+            if not wake_at:
+                return probe_at
+            return min(at_wall(min(wake_at)), probe_at)
+
+        if not wake_at:
+            return None
+
+        return at_wall(min(wake_at))
 
     def get_addr(self) -> AddressInfo:
         return self.__owner
@@ -57,17 +168,15 @@ class ConnectionWith:
     def vadilate_packet(self, data: bytes) -> None:
         """Check if packet is valid and add it to the list"""
 
-        if not Packet.is_valid(data):
-            LOGGER.warning(f"Invalid packet from {self.__owner}")
-            return
-
-        packet = Packet.deconstruct(data)
+        packet = Packet.decode(data, self.__version)
         if packet is None:
+            LOGGER.warning(f"Invalid packet from {self.__owner}")
             return
 
         self.__packets.append(packet)
         self.__last_time = time.time()
         self.__resend_time = time.time()
+        self._wake(self._iterator)
 
     def time_is_valid(self) -> bool:
         """Check if connection is still alive"""
@@ -80,7 +189,10 @@ class ConnectionWith:
     def connect(self):
         """Connect to host"""
 
-        syn = Packet.construct(data=b"", flags=Flags.SYN, seq_num=0)
+        """ Offer the newest header version we know """
+        syn = Packet.construct(
+            data=f"{max(Version)}".encode(), flags=Flags.SYN, seq_num=0
+        )
         self.__connecting = True
 
         self.__send_func(syn, self.__owner)
@@ -90,22 +202,32 @@ class ConnectionWith:
 
         for transfer in self.__transfers.values():
             transfer.kill()
+            self._wake(transfer._iterator)
 
         self.__connected = False
         self.__connecting = False
         self.__alive = Status.DEAD
 
         """ Build fin packet """
-        fin = Packet.construct(data=b"", flags=Flags.FIN, seq_num=3)
+        fin = Packet.construct(
+            data=b"", flags=Flags.FIN, seq_num=3, version=self.__version
+        )
         self.__send_func(fin, self.__owner)
 
-    def send_file(self, data: bytes, name: str, ext: str) -> None:
+        """ Dead connection leaves the loop on its next run """
+        self._wake(self._iterator)
+
+    def send_file(
+        self, data: bytes, name: str, ext: str, release: Callable = None
+    ) -> Sender | None:
         """Send file to host"""
 
         """ Get last transfer """
         if self.__last_transfer + 1 >= Flags.WM:
             LOGGER.warning(f"Too many transfers from {self.__owner}")
-            return
+            if release is not None:
+                release()
+            return None
 
         """ Update last transfer"""
         transfer_flag = self.__last_transfer + 1
@@ -120,28 +242,32 @@ class ConnectionWith:
             extention=ext,
             transfer_flag=transfer_flag,
             fragment_size=self.frag_size,
+            version=self.__version,
+            rtt=self.__rtt,
+            congestion=CONTROLLERS[self.__congestion](),
+            pacer=Pacer() if self.__pacing else None,
+            compress=self.__compression,
         )
-        transfer.prepare_data(data, transfer_flag)
+        transfer.prepare_data(data, transfer_flag, release)
 
         """ Add transfer to the list """
         self._add_transfer(transfer, transfer_flag)
 
         """ Add iterator to the list """
-        self._add_iterator(transfer._iterator)
+        self._add_iterator(transfer._iterator, transfer.wakeup)
 
         """ Send init packet with file name, extension and transfer flag number """
-        init_packet = Packet.construct(
-            data=f"{name}{ext}:{transfer_flag}".encode(), flags=Flags.FILE, seq_num=0
-        )
-        self.__send_func(init_packet, self.__owner)
+        transfer._send_init()
+
+        return transfer
 
-    def send_msg(self, message: bytes) -> None:
+    def send_msg(self, message: bytes) -> Sender | None:
         """Send message to host"""
 
         """ Get last transfer """
         if self.__last_transfer + 1 >= Flags.WM:
             LOGGER.warning(f"Too many transfers from {self.__owner}")
-            return
+            return None
 
         """ Update last transfer"""
         transfer_flag = self.__last_transfer + 1
@@ -154,6 +280,11 @@ class ConnectionWith:
             type="msg",
             transfer_flag=transfer_flag,
             fragment_size=self.frag_size,
+            version=self.__version,
+            rtt=self.__rtt,
+            congestion=CONTROLLERS[self.__congestion](),
+            pacer=Pacer() if self.__pacing else None,
+            compress=self.__compression,
         )
         transfer.prepare_data(message, transfer_flag)
 
@@ -161,13 +292,44 @@ class ConnectionWith:
         self._add_transfer(transfer, transfer_flag)
 
         """ Add iterator to the list """
-        self._add_iterator(transfer._iterator)
+        self._add_iterator(transfer._iterator, transfer.wakeup)
 
         """ Send init packet with transfer flag number """
-        init_packet = Packet.construct(
-            data=f"{transfer_flag}".encode(), flags=Flags.MSG, seq_num=0
-        )
-        self.__send_func(init_packet, self.__owner)
+        transfer._send_init()
+
+        return transfer
+
+    def stats(self) -> dict:
+        """State of connection, for monitoring"""
+
+        return {
+            "version": int(self.__version),
+            "transfers": len(self.__transfers),
+            "rtt": self.__rtt.stats(),
+            "algorithm": self.__congestion,
+            "pacing": self.__pacing,
+            "compression": self.__compression,
+            "fragment_size": self.frag_size,
+            "pmtu": self.__pmtu.stats(),
+            "congestion": {
+                flag: transfer.congestion.stats()
+                | {
+                    "rwnd": transfer.rwnd,
+                    "window": transfer.window_size,
+                    "retransmitted": transfer.retransmitted,
+                    "fast_retransmitted": transfer.fast_retransmitted,
+                    "pacing_rate": transfer.pacer.rate if transfer.pacer else None,
+                    "compression_ratio": transfer.compression,
+                }
+                for flag, transfer in self.__transfers.copy().items()
+                if isinstance(transfer, Sender)
+            },
+        }
+
+    def too_big(self) -> None:
+        """Datagram was over path MTU, kernel knows the new one"""
+
+        self.__pmtu.too_big(path_mtu(self.__owner.values()))
 
     def _add_transfer(self, transfer: Sender | Receiver, transfer_flag: int) -> None:
         """Add transfer to the dict"""
@@ -237,190 +399,286 @@ class ConnectionWith:
         """Analyze packets"""
 
         if not self._keep_alive():
+            """ Host forgets dead connection """
+            self._del_connection(self)
             return Status.FINISHED
 
-        """ Check for dead transfers """
+        """ Drain packets received since last tick, in order of arrival """
+        packets = self.__packets
+        while packets:
+            packet = packets.popleft()
+
+            if self.connected or packet.flags in HANDSHAKE_FLAGS:
+                DISPATCH[packet.flags](self, packet)
+            elif self.__connecting and packet.flags in PROBE_FLAGS:
+                """ Peer connected first, its SYN | SACK can still come """
+                DISPATCH[packet.flags](self, packet)
+            else:
+                self._on_not_connected(packet)
+
+            """
+            Peer sends SYN | SACK and more than handshake once connected,
+            old peers (V1) do not know probes
+            """
+            if (
+                self.connected
+                and self.__version >= Version.V2
+                and packet.flags not in CONNECTING_FLAGS
+            ):
+                self.__pmtu.start()
+
+        if self.connected:
+            self._probe()
+
+        """ Check for dead transfers, FIN could have just finished them """
         for transfer_flag, transfer in self.__transfers.copy().items():
             if transfer.alive == Status.DEAD:
                 self.__transfers.pop(transfer_flag)
 
-        """ Go through all packets """
-        for packet in self.__packets.copy():
-            if packet.flags == Flags.SYN and not self.connected:
-                """call syn function"""
-                self._syn(packet)
+        return Status.SLEEPING
 
-            elif packet.flags == Flags.SYN and self.connected:
-                """call syn sack function"""
-                self._syn_sack(packet)
+    def _on_syn(self, packet: Packet) -> None:
+        if not self.connected:
+            self._syn(packet)
+            return
 
-            elif packet.flags == (Flags.SYN | Flags.ACK) and (
-                self.__connecting or self.connected
-            ):
-                """call syn ack function"""
-                self._syn_ack(packet)
+        self._syn_sack(packet)
 
-            elif packet.flags == (Flags.SYN | Flags.SACK) and (
-                self.__connecting or self.connected
-            ):
-                """call syn sack function"""
-                self._syn_sack(packet)
-
-            elif not self.connected:
-                """call fin function"""
-                self.disconnect()
-                LOGGER.warning(
-                    f"Not connected, can not recv that packet from {self.__owner}"
-                )
-                self.__packets.remove(packet)
-
-            elif packet.flags == Flags.FIN and packet.data == b"":
-                """call fin function"""
-                self.disconnect()
-                LOGGER.info(f"Disconnected from {self.__owner}")
-                self.__packets.remove(packet)
-
-            elif packet.flags == Flags.FILE:
-                """Create transfer"""
-
-                """ Check transfer overloading """
-                if not self._check_for_avaliable_transfer():
-                    self.__packets.remove(packet)
-                    continue
-
-                data = packet.data.decode().split(":")
-
-                if len(data) != 2:
-                    LOGGER.warning(
-                        f"Received file init from {self.__owner} with invalid data"
-                    )
-                    self.__packets.remove(packet)
-                    continue
-
-                name_ext, flag = data[0], int(data[1])
-                try:
-                    name, ext = name_ext.split(".")
-                except ValueError:
-                    name, ext = name_ext, ""
-
-                transfer = Receiver(
-                    self.__send_func, self.__owner, name, ext, flag, self.frag_size
-                )
-                self._add_transfer(transfer, flag)
-
-                """ Add iterator to the list """
-                self._add_iterator(transfer._iterator)
-
-                """ call transfer function """
-                transfer.receive(packet)
-
-                """ Delete that packet """
-                self.__packets.remove(packet)
-
-            elif packet.flags == Flags.MSG:
-                """Create transfer"""
-
-                """ Check transfer overloading """
-                if not self._check_for_avaliable_transfer():
-                    self.__packets.remove(packet)
-                    continue
-
-                data = packet.data.decode()
-
-                if not data.isdigit():
-                    LOGGER.warning(
-                        f"Received msg from {self.__owner} with invalid data"
-                    )
-                    self.__packets.remove(packet)
-                    continue
-
-                flag = int(data)
-
-                transfer = Receiver(
-                    self.__send_func,
-                    self.__owner,
-                    transfer_flag=flag,
-                    fragment_size=self.frag_size,
-                )
-                self._add_transfer(transfer, flag)
-
-                """ Add iterator to the list """
-                self._add_iterator(transfer._iterator)
-
-                """ call transfer function """
-                transfer.receive(packet)
-
-                """ Delete that packet """
-                self.__packets.remove(packet)
-
-            elif packet.flags >= Flags.SR and packet.flags < Flags.WM:
-                """Handle transfer"""
-
-                transfer_flag = packet.flags
-                if transfer_flag in self.__transfers:
-                    """call transfer function"""
-                    self.__transfers[transfer_flag].receive_data(packet)
-                    self.__packets.remove(packet)
-                else:
-                    LOGGER.warning(
-                        f"Received packet from {self.__owner} with unknown transfer_flag"
-                    )
-                    self.__packets.remove(packet)
-
-            elif (
-                packet.flags == Flags.ACK
-                or packet.flags == Flags.SACK
-                or packet.flags == Flags.FIN
-            ):
-                transfer_flag = packet.data.decode().split(":")
-
-                if len(transfer_flag) != 1:
-                    LOGGER.warning(
-                        f"Received packet from {self.__owner} with invalid data"
-                    )
-                    self.__packets.remove(packet)
-                    continue
-
-                transfer_flag = transfer_flag[0]
-
-                if transfer_flag.isdigit():
-                    transfer_flag = int(transfer_flag)
-                    if transfer_flag in self.__transfers:
-                        """call ack function"""
-                        self.__transfers[transfer_flag].receive(packet)
-                        self.__packets.remove(packet)
-                    else:
-                        LOGGER.warning(
-                            f"Received pack from {self.__owner} with unknown transfer_flag"
-                        )
-                        self.__packets.remove(packet)
-                else:
-                    LOGGER.warning(
-                        f"Received pack from {self.__owner} with invalid transfer_flag"
-                    )
-                    self.__packets.remove(packet)
+        """ Peer resends SYN, when our SYN | SACK was lost, answer it again """
+        syn_ack = Packet.construct(
+            data=f"{self.__version}".encode(), flags=Flags.SYN | Flags.ACK, seq_num=1
+        )
+        self.__send_func(syn_ack, self.__owner)
 
-            else:
-                """call unknown function"""
-                LOGGER.info(f"{packet.flags} is/are unknown")
-                LOGGER.warning(f"Unknown packet from {self.__owner}")
-                self.__packets.remove(packet)
+    def _on_syn_ack(self, packet: Packet) -> None:
+        if not (self.__connecting or self.connected):
+            self._on_not_connected(packet)
+            return
 
-        return Status.SLEEPING
+        self._syn_ack(packet)
+
+    def _on_syn_sack(self, packet: Packet) -> None:
+        if not (self.__connecting or self.connected):
+            self._on_not_connected(packet)
+            return
+
+        self._syn_sack(packet)
+
+    def _on_not_connected(self, packet: Packet) -> None:
+        """Packet of a connection, which is not established"""
+
+        self.disconnect()
+        LOGGER.warning(f"Not connected, can not recv that packet from {self.__owner}")
+
+    def _on_fin(self, packet: Packet) -> None:
+        """FIN of connection is empty, FIN of transfer carries its flag"""
+
+        if packet.data == b"":
+            self.disconnect()
+            LOGGER.info(f"Disconnected from {self.__owner}")
+            return
+
+        self._on_control(packet)
+
+    def _on_file(self, packet: Packet) -> None:
+        """Create transfer"""
+
+        """ Check transfer overloading """
+        if not self._check_for_avaliable_transfer():
+            return
+
+        data, _ = Packet.decode_fields(packet.data)
+
+        if len(data) != 2:
+            LOGGER.warning(f"Received file init from {self.__owner} with invalid data")
+            return
+
+        name_ext, flag = data[0], int(data[1])
+        try:
+            name, ext = name_ext.split(".")
+        except ValueError:
+            name, ext = name_ext, ""
+
+        transfer = Receiver(
+            self.__send_func,
+            self.__owner,
+            name,
+            ext,
+            flag,
+            self.frag_size,
+            version=self.__version,
+            buffer_size=self.__recv_buffer,
+            on_received=self._on_received,
+            persister=self._persister,
+            receivers=self._receivers,
+        )
+        self._add_transfer(transfer, flag)
+
+        """ Add iterator to the list """
+        self._add_iterator(transfer._iterator, transfer.wakeup)
+
+        """ call transfer function """
+        transfer.receive(packet)
+
+    def _on_msg(self, packet: Packet) -> None:
+        """Create transfer"""
+
+        """ Check transfer overloading """
+        if not self._check_for_avaliable_transfer():
+            return
+
+        data, _ = Packet.decode_fields(packet.data)
+
+        if len(data) != 1 or not data[0].isdigit():
+            LOGGER.warning(f"Received msg from {self.__owner} with invalid data")
+            return
+
+        flag = int(data[0])
+
+        transfer = Receiver(
+            self.__send_func,
+            self.__owner,
+            transfer_flag=flag,
+            fragment_size=self.frag_size,
+            version=self.__version,
+            buffer_size=self.__recv_buffer,
+            on_received=self._on_received,
+            receivers=self._receivers,
+        )
+        self._add_transfer(transfer, flag)
+
+        """ Add iterator to the list """
+        self._add_iterator(transfer._iterator, transfer.wakeup)
+
+        """ call transfer function """
+        transfer.receive(packet)
+
+    def _on_data(self, packet: Packet) -> None:
+        """Data fragment, its flags are the transfer flag"""
+
+        transfer = self.__transfers.get(packet.flags)
+
+        if transfer is None:
+            LOGGER.warning(
+                f"Received packet from {self.__owner} with unknown transfer_flag"
+            )
+            return
+
+        transfer.receive_data(packet)
+        self._wake(transfer._iterator)
+
+    def _on_range_ack(self, packet: Packet) -> None:
+        """RangeACK, transfer flag is in the flags as well"""
+
+        transfer = self.__transfers.get(packet.flags ^ Flags.WM)
+
+        if transfer is None:
+            LOGGER.warning(
+                f"Received range ack from {self.__owner} with unknown transfer_flag"
+            )
+            return
+
+        transfer.receive(packet)
+        self._wake(transfer._iterator)
+
+    def _on_control(self, packet: Packet) -> None:
+        """ACK, SACK and FIN of transfer, transfer flag is in the payload"""
+
+        transfer_flag, _ = Packet.decode_fields(packet.data)
+
+        if len(transfer_flag) != 1:
+            LOGGER.warning(f"Received packet from {self.__owner} with invalid data")
+            return
+
+        transfer_flag = transfer_flag[0]
+
+        if not transfer_flag.isdigit():
+            LOGGER.warning(
+                f"Received pack from {self.__owner} with invalid transfer_flag"
+            )
+            return
+
+        transfer = self.__transfers.get(int(transfer_flag))
+
+        if transfer is None:
+            LOGGER.warning(
+                f"Received pack from {self.__owner} with unknown transfer_flag"
+            )
+            return
+
+        """call ack function"""
+        transfer.receive(packet)
+        self._wake(transfer._iterator)
+
+    def _on_probe(self, packet: Packet) -> None:
+        """Path MTU probe, answer with its size, when it arrived whole"""
+
+        size = bytes(packet.data[:8]).split(b":")[0]
+
+        if not size.isdigit():
+            LOGGER.warning(f"Received probe from {self.__owner} with invalid data")
+            return
+
+        if int(size) != len(packet.data) + HEADERS[self.__version].size:
+            return
+
+        answer = Packet.construct(
+            data=size, flags=PROBE | Flags.ACK, seq_num=0, version=self.__version
+        )
+        self.__send_func(answer, self.__owner)
+
+    def _on_probe_ack(self, packet: Packet) -> None:
+        size = bytes(packet.data)
+
+        if size.isdigit():
+            self.__pmtu.acked(int(size))
+
+    def _probe(self) -> None:
+        """Send path MTU probe, when one is due"""
+
+        if self.__rtt.backoffs >= BLACK_HOLE:
+            self.__pmtu.black_hole()
+
+        size = self.__pmtu.next_probe(self._probe_timeout())
+        if size is None:
+            return
+
+        """ Size goes first, rest of probe is padding """
+        data = f"{size}:".encode()
+        data += bytes(size - HEADERS[self.__version].size - len(data))
+
+        probe = Packet.construct(
+            data=data, flags=PROBE, seq_num=0, version=self.__version
+        )
+        self.__send_func(probe, self.__owner)
+
+    def _probe_timeout(self) -> float:
+        """RTO, until RTT is measured a shorter one, probes need no backoff"""
+
+        if self.__rtt.srtt is None:
+            return PROBE_TIMEOUT
+        return self.__rtt.rto
+
+    def _on_unknown(self, packet: Packet) -> None:
+        """call unknown function"""
+        LOGGER.info(f"{packet.flags} is/are unknown")
+        LOGGER.warning(f"Unknown packet from {self.__owner}")
 
     def _syn(self, packet: Packet):
         """Syn function"""
 
-        """ Delete that packet """
-        self.__packets.remove(packet)
-
         """ Check ttl of a packet """
         if not packet.time_is_valid():
             LOGGER.warning(f"Packet from {self.__owner} is dead")
             return
 
+        """ Agree on header version, old peers do not offer any """
+        self.__version = self._negotiate_version(packet)
+
         """ Send syn ack """
-        syn_ack = Packet.construct(data=b"", flags=Flags.SYN | Flags.ACK, seq_num=1)
+        syn_ack = Packet.construct(
+            data=f"{self.__version}".encode(), flags=Flags.SYN | Flags.ACK, seq_num=1
+        )
 
         self.__send_func(syn_ack, self.__owner)
 
@@ -430,14 +688,14 @@ class ConnectionWith:
     def _syn_ack(self, packet: Packet):
         """Syn ack function"""
 
-        """ Delete that packet """
-        self.__packets.remove(packet)
-
         """ Check ttl of a packet """
         if not packet.time_is_valid():
             LOGGER.warning(f"Packet from {self.__owner} is dead")
             return
 
+        """ Use header version chosen by the peer """
+        self.__version = self._negotiate_version(packet)
+
         """ Send syn sack """
         ack = Packet.construct(data=b"", flags=Flags.SYN | Flags.SACK, seq_num=2)
 
@@ -449,12 +707,19 @@ class ConnectionWith:
 
         LOGGER.info(f"Connected to {self.__owner}")
 
+    def _negotiate_version(self, packet: Packet) -> Version:
+        """Highest header version both sides know"""
+
+        offered = bytes(packet.data).decode(errors="ignore")
+
+        if not offered.isdigit():
+            return Version.V1
+
+        return Version(max(Version.V1, min(int(offered), max(Version))))
+
     def _syn_sack(self, packet: Packet):
         """Syn sack function"""
 
-        """ Delete that packet """
-        self.__packets.remove(packet)
-
         """ Check ttl of a packet """
         if not packet.time_is_valid():
             LOGGER.warning(f"Packet from {self.__owner} is dead")
@@ -486,3 +751,23 @@ class ConnectionWith:
 
     def __str__(self) -> str:
         return f"ConnectionWith({self.__owner}, {self.__connected})"
+
+
+""" Handler of every flags value, packet is routed with one lookup """
+DISPATCH: list[Callable[[ConnectionWith, Packet], None]] = [
+    ConnectionWith._on_unknown
+] * 2**8
+DISPATCH[Flags.SYN] = ConnectionWith._on_syn
+DISPATCH[Flags.SYN | Flags.ACK] = ConnectionWith._on_syn_ack
+DISPATCH[Flags.SYN | Flags.SACK] = ConnectionWith._on_syn_sack
+DISPATCH[Flags.ACK] = ConnectionWith._on_control
+DISPATCH[Flags.SACK] = ConnectionWith._on_control
+DISPATCH[Flags.FIN] = ConnectionWith._on_fin
+DISPATCH[Flags.FILE] = ConnectionWith._on_file
+DISPATCH[Flags.MSG] = ConnectionWith._on_msg
+DISPATCH[PROBE] = ConnectionWith._on_probe
+DISPATCH[PROBE | Flags.ACK] = ConnectionWith._on_probe_ack
+for flag in range(Flags.SR, Flags.WM):
+    """ Transfer flags, RangeACK carries its transfer flag with WM """
+    DISPATCH[flag] = ConnectionWith._on_data
+    DISPATCH[Flags.WM | flag] = ConnectionWith._on_range_ack
@@ -3,4 +3,8 @@ from enum import IntFlag
 
 class Size(IntFlag):
     WINDOW_SIZE = 16
+    MAX_WINDOW = 1024
     PPT = 16  # Packets per time
+    DATAGRAM = 1472  # Max UDP payload, 1500 MTU - 20 IP - 8 UDP
+    DATAGRAM_OVERHEAD = 896  # Kernel bookkeeping of one buffered datagram
+    RECV_BUFFER = 212992  # Default socket receive buffer on Linux
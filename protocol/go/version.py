@@ -0,0 +1,8 @@
+from enum import IntEnum
+
+
+class Version(IntEnum):
+    """Header versions, negotiated in SYN / SYN | ACK"""
+
+    V1 = 1  # 1 byte sequence number, wraps at 256
+    V2 = 2  # 4 bytes absolute fragment index
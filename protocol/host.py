@@ -3,11 +3,17 @@ import logging
 import threading
 
 from go.size import Size
+from batch import RecvBatch, SendBatch
+from buffers import size_buffers, kernel_drops
+from packet import HEADERS
+from pmtu import enable, is_too_big
+from persist import Persister
 from typing import Callable
 from go.status import Status
 from connection import ConnectionWith
+from congestion import CONTROLLERS, DEFAULT
+from scheduler import Scheduler
 from go.adressinfo import AddressInfo
-from selectors import DefaultSelector, EVENT_READ, EVENT_WRITE
 
 
 """ Global variables """
@@ -15,18 +21,50 @@ LOGGER = logging.getLogger("Host")
 
 
 class Host:
-    def __init__(self, ip: str, port: int):
-        self.__connections: list[ConnectionWith] = []
+    def __init__(
+        self,
+        ip: str,
+        port: int,
+        scheduler: Scheduler | None = None,
+        reuse_port: bool = False,
+        offload: bool = False,
+        window: int = Size.MAX_WINDOW,
+    ):
+        """ Connections by (ip, port), lock is taken only to change the table """
+        self.__connections: dict[tuple[str, int], ConnectionWith] = {}
         self.__connections_lock = threading.Lock()
 
-        self.__iterators: list[Callable] = []
-        self.__selector = DefaultSelector()
+        self.__scheduler = scheduler if scheduler is not None else Scheduler()
 
         self.__me = AddressInfo(ip, port)
         self.__socket = NotImplemented
+        self.__batch: RecvBatch | None = None
+        self.__outbox: SendBatch | None = None
+        self.__loop_thread: int | None = None
         self.__fragment_size = 1468
+        self.__recv_buffer = Size.RECV_BUFFER
         self.__binded = False
 
+        """ Live receivers of all connections, they share the socket buffer """
+        self.__receivers: set = set()
+
+        """ Socket buffers hold that many fragments """
+        self.__window = window
+
+        """ Workers of one node share the port, kernel spreads peers among them """
+        self.__reuse_port = reuse_port
+        self.__received = 0
+
+        """ Received files are written by persistence worker process """
+        self.__persister = (
+            Persister(on_room=self._wake_receivers) if offload else None
+        )
+
+        """ Defaults of new connections """
+        self.__congestion = DEFAULT
+        self.__pacing = False
+        self.__compression = False
+
     @property
     def me(self) -> AddressInfo:
         return self.__me
@@ -38,15 +76,119 @@ class Host:
     @fragment_size.setter
     def fragment_size(self, value: int) -> None:
         self.__fragment_size = value
+        self._size_buffers()
+
+    @property
+    def window(self) -> int:
+        """Fragments, which socket buffers hold"""
+        return self.__window
+
+    @window.setter
+    def window(self, value: int) -> None:
+        self.__window = value
+        self._size_buffers()
+
+    @property
+    def congestion(self) -> str:
+        """Congestion control algorithm of new connections"""
+        return self.__congestion
+
+    @congestion.setter
+    def congestion(self, value: str) -> None:
+        if value not in CONTROLLERS:
+            LOGGER.warning(f"Unknown congestion control {value}")
+            return
+        self.__congestion = value
+
+    @property
+    def pacing(self) -> bool:
+        """Pacing of new connections"""
+        return self.__pacing
+
+    @pacing.setter
+    def pacing(self, value: bool) -> None:
+        self.__pacing = value
+
+    @property
+    def compression(self) -> bool:
+        """zlib compression of new connections"""
+        return self.__compression
+
+    @compression.setter
+    def compression(self, value: bool) -> None:
+        self.__compression = value
+
+    def stats(self) -> dict:
+        """State of host, for monitoring"""
+
+        connections = self._all_connections()
+        outbox = self.__outbox
+
+        return {
+            "connections": len(connections),
+            "transfers": sum(connection.transfers for connection in connections),
+            "received": self.__received,
+            "runs": self.__scheduler.runs,
+            "send_calls": outbox.syscalls if outbox is not None else 0,
+            "send_dropped": outbox.dropped if outbox is not None else 0,
+            "send_too_big": outbox.too_big if outbox is not None else 0,
+            "kernel_drops": self._kernel_drops(),
+        }
 
     def get_connection(self, addr: AddressInfo) -> ConnectionWith | None:
-        """Get connection"""
+        """Get connection, single dict lookup which needs no lock"""
 
-        with self.__connections_lock:
-            for connection in self.__connections:
-                if connection.get_addr() == addr:
-                    return connection
-        return None
+        return self.__connections.get(addr.values())
+
+    def connection_stats(self, ip: str, port: int) -> dict | None:
+        """Get state of connection, for monitoring"""
+
+        connection = self.get_connection(AddressInfo(ip, port))
+
+        if connection is None:
+            LOGGER.warning("Connection to {}:{} does not exist".format(ip, port))
+            return None
+
+        return connection.stats()
+
+    def set_congestion(self, ip: str, port: int, algorithm: str) -> bool:
+        """Select congestion control algorithm of connection"""
+
+        connection = self.get_connection(AddressInfo(ip, port))
+
+        if connection is None:
+            LOGGER.warning("Connection to {}:{} does not exist".format(ip, port))
+            return False
+
+        connection.congestion = algorithm
+
+        return connection.congestion == algorithm
+
+    def set_pacing(self, ip: str, port: int, enabled: bool) -> bool:
+        """Turn pacing of connection on or off"""
+
+        connection = self.get_connection(AddressInfo(ip, port))
+
+        if connection is None:
+            LOGGER.warning("Connection to {}:{} does not exist".format(ip, port))
+            return False
+
+        connection.pacing = enabled
+
+        return True
+
+    def set_compression(self, ip: str, port: int, enabled: bool) -> bool:
+        """Turn zlib compression of connection on or off"""
+
+        connection = self.get_connection(AddressInfo(ip, port))
+
+        if connection is None:
+            LOGGER.warning("Connection to {}:{} does not exist".format(ip, port))
+            return False
+
+        connection.compression = enabled
+
+        return True
 
     def get_bounded_ip_port(self) -> tuple[str, int]:
         """Get bounded ip and port"""
@@ -57,9 +199,8 @@ class Host:
     def list_connections(self) -> None:
         """List all connections"""
 
-        with self.__connections_lock:
-            for connection in self.__connections:
-                print(connection)
+        for connection in self._all_connections():
+            print(connection)
 
     def validate_addr(self, ip: str, port: int) -> bool:
         """Check if address is valid"""
@@ -85,14 +226,7 @@ class Host:
         connection = self.get_connection(addr)
 
         if connection is None:
-            connection = ConnectionWith(addr, self._send, self.fragment_size)
-
-            with self.__connections_lock:
-                self.__connections.append(connection)
-            self._add_iterator(connection._iterator)
-
-            connection._add_iterator = self._add_iterator
-
+            connection = self._add_connection(addr)
             connection.connect()
         else:
             LOGGER.warning("Connection to {}:{} already exists".format(ip, port))
@@ -111,22 +245,31 @@ class Host:
     def disconnect_all(self):
         """Disconnect from all hosts"""
 
-        with self.__connections_lock:
-            for connection in self.__connections:
-                connection.disconnect()
+        for connection in self._all_connections():
+            connection.disconnect()
 
         LOGGER.info("Disconnected from all hosts")
 
-    def send_file(self, ip: str, port: int, data: bytes, name: str, ext: str):
-        """Send file to host"""
+    def send_file(
+        self,
+        ip: str,
+        port: int,
+        data: bytes,
+        name: str,
+        ext: str,
+        release: Callable = None,
+    ):
+        """Send file to host, release is called when data is not needed"""
 
         addr = AddressInfo(ip, port)
         connection = self.get_connection(addr)
 
         if connection:
-            connection.send_file(data, name, ext)
+            connection.send_file(data, name, ext, release)
         else:
             LOGGER.warning("Connection to {}:{} does not exist".format(ip, port))
+            if release is not None:
+                release()
 
     def send_msg(self, ip: str, port: int, message: bytes):
         """Send message to host"""
@@ -140,83 +283,166 @@ class Host:
             LOGGER.warning("Connection to {}:{} does not exist".format(ip, port))
 
     def _send(self, data: bytes, addr: AddressInfo):
-        """Send data to addr"""
+        """
+        Send data to addr.
+        Datagrams of the loop are queued and flushed at the end of its pass,
+        other threads (terminal) send right away.
+        """
+
+        if self.__loop_thread == threading.get_ident():
+            self.__outbox.push(data, addr.values())
+            return
+
+        try:
+            self.__socket.sendto(data, addr.values())
+        except OSError as e:
+            if not is_too_big(e):
+                raise
+            self._too_big(addr.values())
+
+    def _too_big(self, addr: tuple[str, int]):
+        """Datagram to addr was over path MTU, its connection lowers fragments"""
+
+        connection = self.__connections.get(addr)
+
+        if connection is not None:
+            connection.too_big()
+
+    def _add_iterator(self, iterator: Callable, wakeup: Callable = None):
+        """Run iterator when it is woken up, or at time returned by wakeup"""
+        self.__scheduler.add(iterator, wakeup)
+
+    def _wake(self, iterator: Callable):
+        self.__scheduler.wake(iterator)
+
+    def _wake_receivers(self) -> None:
+        """Ring of persistence worker has room, receivers waiting for it go on"""
+
+        for receiver in list(self.__receivers):
+            self._wake(receiver._iterator)
+
+    def _add_connection(self, addr: AddressInfo) -> ConnectionWith:
+        """Create connection and put it into the table"""
 
-        self.__socket.sendto(data, addr.values())
+        connection = ConnectionWith(
+            addr, self._send, self.fragment_size, self.__recv_buffer
+        )
+        connection._add_iterator = self._add_iterator
+        connection._del_connection = self._del_connection
+        connection._wake = self._wake
+        connection._persister = self.__persister
+        connection._receivers = self.__receivers
+        connection.congestion = self.__congestion
+        connection.pacing = self.__pacing
+        connection.compression = self.__compression
 
-    def _add_iterator(self, iterator: Callable):
-        self.__iterators.append(iterator)
+        with self.__connections_lock:
+            self.__connections[addr.values()] = connection
 
-    def _iterator(self):
-        """Get packets"""
+        self._add_iterator(connection._iterator, connection.wakeup)
 
-        breaker = Size.PPT
+        return connection
 
-        # while breaker > 0:
-        for key, _ in self.__selector.select(timeout=0.01):  # BUG: timeout=0
-            data, addr = self.__socket.recvfrom(1472)
+    def _del_connection(self, connection: ConnectionWith) -> None:
+        """Dead connection leaves the table, unless it was replaced already"""
 
-            """ Ignore spoofed packets """
-            if addr[0] == self.__me.ip:
-                continue
+        key = connection.get_addr().values()
 
-            """ Check if connection already exists """
+        with self.__connections_lock:
+            if self.__connections.get(key) is connection:
+                del self.__connections[key]
 
-            connected_with = self.get_connection(AddressInfo(*addr))
+    def _all_connections(self) -> list[ConnectionWith]:
+        """Snapshot of connections, safe to iterate while table changes"""
 
-            if connected_with is None:
-                # LOGGER.info(f"New connection with {addr}")
-                connected_with = ConnectionWith(
-                    AddressInfo(*addr), self._send, self.fragment_size
-                )
+        with self.__connections_lock:
+            return list(self.__connections.values())
 
-                with self.__connections_lock:
-                    self.__connections.append(connected_with)
+    def _on_readable(self):
+        """
+        Read batch of packets, at most PPT of them, so timers are not held back.
+        Whole batch is put into connections, which consume it in this pass.
+        """
 
-                connected_with._add_iterator = self._add_iterator
+        datagrams = self.__batch.read()
+        self.__received += len(datagrams)
 
-                self._add_iterator(connected_with._iterator)
+        for data, addr in datagrams:
+            self._on_datagram(data, addr)
 
-            connected_with.vadilate_packet(data)
+    def _on_datagram(self, data: bytes, addr: tuple[str, int]) -> None:
+        """Put datagram into its connection, create connection if there is none"""
 
-            # breaker -= 1
+        """ Ignore spoofed packets """
+        if addr[0] == self.__me.ip:
+            return
 
-        return Status.SLEEPING
+        """ Check if connection already exists """
+        connected_with = self.__connections.get(addr)
 
-    def _v4(self):
-        """Run all iterators and check results"""
+        if connected_with is None:
+            # LOGGER.info(f"New connection with {addr}")
+            connected_with = self._add_connection(AddressInfo(*addr))
 
-        for iterator in self.__iterators.copy():
-            result = iterator()
-            if result is Status.FINISHED:
-                self.__iterators.remove(iterator)
-            elif result is Status.RUNNING or Status.SLEEPING:
-                continue
+        connected_with.vadilate_packet(data)
 
     def _endless_loop(self):
-        i = 0
+        self.__loop_thread = threading.get_ident()
+
         while self.__binded:
-            if i == 2:
-                self.del_dead_connections()
-                i = 0
-            self._v4()
-            i += 1
+            self.__scheduler.run_once()
+            self.__outbox.flush()
+
+            if self.__persister is not None:
+                self.__persister.flush()
+
+        self.__loop_thread = None
 
     def del_dead_connections(self):
-        """Delete dead connections"""
+        """
+        Delete dead connections.
+        Connections leave the table themselves when they die,
+        this only sweeps ones whose iterator did not run.
+        """
 
         with self.__connections_lock:
-            for connection in self.__connections.copy():
+            for key, connection in list(self.__connections.items()):
                 if connection.alive is Status.DEAD:
-                    self.__connections.remove(connection)
+                    del self.__connections[key]
 
     def register(self):
         """Bind socket"""
         self.__socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        if self.__reuse_port:
+            self.__socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
         self.__socket.bind(self.__me.values())
         self.__socket.setblocking(False)
 
-        bound_ip, bound_port = self.__socket.getsockname()
+        self._bound(self.__socket)
+        self.__batch = RecvBatch(self.__socket, Size.PPT)
+        self.__outbox = SendBatch(self.__socket, on_too_big=self._too_big)
+
+        self.__scheduler.clear()
+        self.__scheduler.add_reader(self.__socket, self._on_readable)
+
+        if self.__persister is not None:
+            self.__persister.start()
+            self.__scheduler.add_reader(
+                self.__persister.pipe, self.__persister.on_readable
+            )
+
+        self.__binded = True
+
+    def _bound(self, sock: socket.socket):
+        """Socket is bound, take its address and buffer size"""
+
+        self.__socket = sock
+        self._size_buffers()
+
+        """ Datagrams are not fragmented, connections probe path MTU """
+        enable(sock)
+
+        bound_ip, bound_port = sock.getsockname()
 
         LOGGER.debug(f"Host registered on {bound_ip}:{bound_port}")
 
@@ -226,20 +452,37 @@ class Host:
             )
             self.__me = AddressInfo(bound_ip, bound_port)
 
-        self.__connections = []
-        self.__iterators = []
+        self.__connections = {}
 
-        self._add_iterator(self._iterator)
-        self.__selector.register(self.__socket, EVENT_READ)  # | EVENT_WRITE
+    def _size_buffers(self):
+        """Grow socket buffers, so that a window of fragments fits into them"""
 
-        self.__binded = True
+        if self.__socket is NotImplemented or self.__socket.fileno() == -1:
+            return
+
+        datagram = self.__fragment_size + max(h.size for h in HEADERS.values())
+
+        """ Receivers advertise windows which fit into socket buffer """
+        self.__recv_buffer, _ = size_buffers(self.__socket, self.__window, datagram)
+
+    def _kernel_drops(self) -> int:
+        """Datagrams dropped by kernel on full socket buffer, 0 when unknown"""
+
+        if self.__socket is NotImplemented or self.__socket.fileno() == -1:
+            return 0
+
+        return kernel_drops(self.__socket) or 0
 
     def unregister(self):
         """Unbind socket"""
         self.__binded = False
-        self.__selector.unregister(self.__socket)
+        self.__scheduler.remove_reader(self.__socket)
         self.__socket.close()
 
+        if self.__persister is not None:
+            self.__scheduler.remove_reader(self.__persister.pipe)
+            self.__persister.close()
+
         LOGGER.info("Host unregistered")
 
     def run(self):
@@ -247,3 +490,4 @@ class Host:
 
     def stop(self):
         self.__binded = False
+        self.__scheduler.interrupt()
@@ -0,0 +1,84 @@
+import time
+
+
+""" Global variables """
+BURST = 4  # Packets which can always be sent back-to-back
+QUANTUM = 0.001  # and packets of that many seconds at current rate
+SLOW_START_GAIN = 2.0  # Window doubles every RTT in slow start
+GAIN = 1.25  # Headroom, so pacing does not hold back window growth
+
+
+class Pacer:
+    """
+    Token bucket which spreads window evenly over RTT.
+    Tokens are packets, they are refilled at rate of window per smoothed RTT.
+    Bucket holds BURST packets or QUANTUM of rate, so fast transfers are not
+    limited by how often the loop wakes up.
+    Until RTT is measured, packets are not paced.
+    """
+
+    def __init__(self, burst: int = BURST):
+        self.__burst = burst
+        self.__tokens = float(burst)
+        self.__rate: float | None = None
+        self.__last = time.perf_counter()
+
+    @property
+    def rate(self) -> float | None:
+        """Packets per second, None when not paced"""
+        return self.__rate
+
+    def update(self, window: int, srtt: float | None, slow_start: bool) -> None:
+        """Set rate from current window and RTT"""
+
+        self._refill()
+
+        if not srtt:
+            self.__rate = None
+            return
+
+        gain = SLOW_START_GAIN if slow_start else GAIN
+        self.__rate = gain * window / srtt
+
+    def available(self) -> int:
+        """Packets which can be sent now"""
+
+        if self.__rate is None:
+            return 2**31
+
+        self._refill()
+
+        return int(self.__tokens)
+
+    def consume(self, count: int) -> None:
+        """Packets were sent"""
+
+        if self.__rate is not None:
+            self.__tokens -= count
+
+    def next_send(self) -> float | None:
+        """perf_counter time when next packet can be sent, None if it can be now"""
+
+        if self.__rate is None:
+            return None
+
+        self._refill()
+
+        if self.__tokens >= 1:
+            return None
+
+        return self.__last + (1 - self.__tokens) / self.__rate
+
+    def _refill(self) -> None:
+        now = time.perf_counter()
+
+        if self.__rate is not None:
+            capacity = max(float(self.__burst), self.__rate * QUANTUM)
+            self.__tokens = min(
+                self.__tokens + (now - self.__last) * self.__rate, capacity
+            )
+
+        self.__last = now
+
+    def __repr__(self) -> str:
+        return f"Pacer({self.__rate}, {self.__tokens})"
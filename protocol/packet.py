@@ -7,16 +7,62 @@ import logging
 
 from go.time import Time
 from go.flags import Flags
+from typing import Iterable
+from go.version import Version
+from reassembly import Reassembly
+
+
+class Checksum:
+    """
+    CRC-16 engine shared by every packet.
+    Lookup table is generated only once, when the engine is created.
+    """
+
+    def __init__(
+        self, poly: int = 0x18005, init_crc: int = 0xFFFF, xor_out: int = 0x0000
+    ):
+        self.__crc_func = crcmod.mkCrcFun(
+            poly, rev=True, initCrc=init_crc, xorOut=xor_out
+        )
+
+    def compute(self, data: bytes) -> int:
+        """Checksum of one payload"""
+
+        return self.__crc_func(data)
+
+    def compute_many(self, payloads: Iterable[bytes]) -> list[int]:
+        """Checksum of a whole window of payloads in one call"""
+
+        crc_func = self.__crc_func
+        return [crc_func(payload) for payload in payloads]
+
+    def verify(self, data: bytes, crc16: int) -> bool:
+        """Check payload against received checksum"""
+
+        return self.__crc_func(data) == crc16
 
 
 """ Global variables """
 LOGGER = logging.getLogger("Packet")
+CHECKSUM = Checksum()
+HEADERS = {
+    Version.V1: struct.Struct("!BHB"),
+    Version.V2: struct.Struct("!BHI"),
+}
+SEQ_SPACES = {
+    Version.V1: 2**8,
+    Version.V2: 2**32,
+}
+HANDSHAKE_FLAGS = (Flags.SYN, Flags.SYN | Flags.ACK, Flags.SYN | Flags.SACK)
+RANGE_ACK = struct.Struct("!IHB")
+RANGE = struct.Struct("!HH")
 
 
 class Packet:
     def __init__(self, data: bytes, flags: Flags = None, seq_num: int = 0):
         self.__time_to_live: int = time.time()
         self.__time_stamp: int = time.perf_counter()
+        self.__retransmits = 0
         self.__seq_num = seq_num
         self.__flags = flags
         self.__data = data
@@ -30,17 +76,28 @@ class Packet:
         return self.__seq_num
 
     @property
-    def data(self) -> bytes:
+    def data(self) -> bytes | memoryview:
         return self.__data
 
     @property
     def time_stamp(self) -> int:
         return self.__time_stamp
 
+    @property
+    def retransmits(self) -> int:
+        return self.__retransmits
+
     @seq_num.setter
     def seq_num(self, value: int) -> None:
         self.__seq_num = value
 
+    def stamp(self, retransmit: bool = False) -> None:
+        """Remember when packet was (re)sent, for RTT samples and timeouts"""
+
+        self.__time_stamp = time.perf_counter()
+        if retransmit:
+            self.__retransmits += 1
+
     def time_is_valid(self) -> bool:
         """Check if packet is still alive"""
 
@@ -64,7 +121,14 @@ class Packet:
         return Packet(data, flags, seq_num)
 
     @staticmethod
-    def packet_to_bytes(packet: Packet) -> bytes | None:
+    def header_for(flags: int, version: Version) -> struct.Struct:
+        """Header layout, handshake packets are always sent in V1"""
+        if flags in HANDSHAKE_FLAGS:
+            return HEADERS[Version.V1]
+        return HEADERS[version]
+
+    @staticmethod
+    def packet_to_bytes(packet: Packet, version: Version = Version.V1) -> bytes | None:
         """Convert packet to bytes"""
         if packet is None:
             LOGGER.error("Packet is None")
@@ -72,10 +136,14 @@ class Packet:
         if not isinstance(packet, Packet):
             LOGGER.error("Packet is not instance of Packet")
             return None
-        return Packet.construct(packet.__data, packet.__flags, packet.__seq_num)
+        return Packet.construct(
+            packet.__data, packet.__flags, packet.__seq_num, version
+        )
 
     @staticmethod
-    def packet_to_bytes_broken_crc(packet: Packet) -> bytes | None:
+    def packet_to_bytes_broken_crc(
+        packet: Packet, version: Version = Version.V1
+    ) -> bytes | None:
         """Convert packet to bytes, Test purpose only"""
         if packet is None:
             LOGGER.error("Packet is None")
@@ -84,17 +152,18 @@ class Packet:
             LOGGER.error("Packet is not instance of Packet")
             return None
         return Packet.construct_broken_crc(
-            packet.__data, packet.__flags, packet.__seq_num
+            packet.__data, packet.__flags, packet.__seq_num, version
         )
 
     @staticmethod
-    def construct(data: bytes, flags: Flags, seq_num: int) -> bytes | None:
+    def construct(
+        data: bytes, flags: Flags, seq_num: int, version: Version = Version.V1
+    ) -> bytes | None:
         """Construct packet in Bytes"""
-        crc16_func = crcmod.mkCrcFun(0x18005, rev=True, initCrc=0xFFFF, xorOut=0x0000)
-        crc16 = crc16_func(data)
+        crc16 = CHECKSUM.compute(data)
 
         try:
-            header = struct.pack("!BHB", flags, crc16, seq_num)
+            header = Packet.header_for(flags, version).pack(flags, crc16, seq_num)
         except struct.error as e:
             LOGGER.error("Failed to pack header: %s", e)
             return None
@@ -102,13 +171,16 @@ class Packet:
         return header + data
 
     @staticmethod
-    def construct_broken_crc(data: bytes, flags: Flags, seq_num: int) -> bytes | None:
+    def construct_broken_crc(
+        data: bytes, flags: Flags, seq_num: int, version: Version = Version.V1
+    ) -> bytes | None:
         """Construct packet in Bytes, Test purpose only !!!"""
-        crc16_func = crcmod.mkCrcFun(0x18005, rev=True, initCrc=0xFFFF, xorOut=0x0000)
-        crc16 = crc16_func(data)
+        crc16 = CHECKSUM.compute(data)
 
         try:
-            header = struct.pack("!BHB", flags, crc16 + 1, seq_num)
+            header = Packet.header_for(flags, version).pack(
+                flags, (crc16 + 1) % (2**16), seq_num
+            )
         except struct.error as e:
             LOGGER.error("Failed to pack header: %s", e)
             return None
@@ -116,44 +188,161 @@ class Packet:
         return header + data
 
     @staticmethod
-    def deconstruct(data: bytes) -> Packet | None:
+    def construct_window(
+        packets: list[Packet], version: Version = Version.V1
+    ) -> list[bytes]:
+        """Construct whole window of packets in Bytes, checksums in one batch"""
+        crcs = CHECKSUM.compute_many(packet.__data for packet in packets)
+
+        return [
+            Packet.header_for(packet.__flags, version).pack(
+                packet.__flags, crc16, packet.__seq_num
+            )
+            + packet.__data
+            for packet, crc16 in zip(packets, crcs)
+        ]
+
+    @staticmethod
+    def deconstruct(data: bytes, version: Version = Version.V1) -> Packet | None:
         """Deconstruct bytes to packet"""
-        if len(data) < 4:
+        if len(data) < 1:
             LOGGER.error("Packet is too short")
             return None
 
+        header = Packet.header_for(data[0], version)
+
         try:
-            flags, crc16, seq_num = struct.unpack("!BHB", data[:4])
+            flags, crc16, seq_num = header.unpack_from(data)
         except struct.error as e:
             LOGGER.error("Failed to unpack header: %s", e)
             return None
 
-        packet_data = data[4:]
+        packet_data = data[header.size :]
+
+        return Packet(packet_data, Flags(flags), seq_num)
+
+    @staticmethod
+    def decode(data: bytes, version: Version = Version.V1) -> Packet | None:
+        """
+        Validate and deconstruct bytes to packet in a single pass.
+        Payload is a memoryview over the received buffer, not a copy.
+        """
+        if len(data) < 1:
+            LOGGER.error("Packet is too short")
+            return None
+
+        header = Packet.header_for(data[0], version)
+
+        if len(data) < header.size:
+            LOGGER.error("Packet is too short")
+            return None
+
+        flags, crc16, seq_num = header.unpack_from(data)
+        packet_data = memoryview(data)[header.size :]
+
+        if not CHECKSUM.verify(packet_data, crc16):
+            LOGGER.error("CRC16 is not valid")
+            return None
 
         return Packet(packet_data, Flags(flags), seq_num)
 
     @staticmethod
-    def is_valid(data: bytes) -> bool:
+    def is_valid(data: bytes, version: Version = Version.V1) -> bool:
         """Check if packet is valid"""
-        if len(data) < 4:
+        if len(data) < 1:
             LOGGER.error("Packet is too short")
             return False
 
-        flags, crc16, seq_num = struct.unpack("!BHB", data[:4])
-        packet_data = data[4:]
+        header = Packet.header_for(data[0], version)
 
-        crc16_func = crcmod.mkCrcFun(0x18005, rev=True, initCrc=0xFFFF, xorOut=0x0000)
-        computed_crc16 = crc16_func(packet_data)
+        if len(data) < header.size:
+            LOGGER.error("Packet is too short")
+            return False
 
-        if computed_crc16 != crc16:
+        flags, crc16, seq_num = header.unpack_from(data)
+        packet_data = memoryview(data)[header.size :]
+
+        if not CHECKSUM.verify(packet_data, crc16):
             LOGGER.error("CRC16 is not valid")
             return False
 
         return True
 
+    @staticmethod
+    def encode_fields(fields: list, options: dict = None) -> bytes:
+        """
+        Encode control payload, positional fields go first,
+        then negotiated options as key=value.
+        """
+        parts = [str(field) for field in fields]
+
+        if options:
+            parts.extend(f"{key}={value}" for key, value in options.items())
+
+        return ":".join(parts).encode()
+
+    @staticmethod
+    def decode_fields(data: bytes) -> tuple[list[str], dict[str, str]]:
+        """Decode control payload into positional fields and options"""
+        fields = []
+        options = {}
+
+        for part in bytes(data).decode().split(":"):
+            if "=" in part:
+                key, value = part.split("=", 1)
+                options[key] = value
+            else:
+                fields.append(part)
+
+        return fields, options
+
+    @staticmethod
+    def encode_range_ack(
+        cumulative: int, window: int, ranges: list[tuple[int, int]]
+    ) -> bytes:
+        """
+        Payload of RangeACK, every fragment below cumulative is received,
+        window is how many fragments receiver can take in flight,
+        ranges are (start, length) of fragments received above cumulative.
+        """
+        ranges = [
+            (start - cumulative, length)
+            for start, length in ranges
+            if start - cumulative < 2**16 and length < 2**16
+        ][: 2**8 - 1]
+
+        return RANGE_ACK.pack(cumulative, window, len(ranges)) + b"".join(
+            RANGE.pack(offset, length) for offset, length in ranges
+        )
+
+    @staticmethod
+    def decode_range_ack(
+        data: bytes,
+    ) -> tuple[int, int, list[tuple[int, int]]] | None:
+        """Decode RangeACK payload into cumulative ack, window and ranges"""
+        try:
+            cumulative, window, count = RANGE_ACK.unpack_from(data)
+            ranges = [
+                RANGE.unpack_from(data, RANGE_ACK.size + i * RANGE.size)
+                for i in range(count)
+            ]
+        except struct.error as e:
+            LOGGER.error("Failed to unpack range ack: %s", e)
+            return None
+
+        return (
+            cumulative,
+            window,
+            [(cumulative + offset, length) for offset, length in ranges],
+        )
+
     @staticmethod
     def devide(
-        data: bytes, seq_num: int, fragment_size: int, flags: Flags
+        data: bytes,
+        seq_num: int,
+        fragment_size: int,
+        flags: Flags,
+        seq_space: int = 2**8,
     ) -> list[Packet] | None:
         """Devide data into packets"""
         packets = []
@@ -168,7 +357,7 @@ class Packet:
             packet_data = data[start_idx:end_idx]
 
             """ Calculate the seq_num with wrap around """
-            current_seq_num = (seq_num + i) % (2**8)
+            current_seq_num = (seq_num + i) % seq_space
 
             packet = Packet.construct_packet(packet_data, flags, current_seq_num)
 
@@ -177,118 +366,30 @@ class Packet:
         return packets
 
     @staticmethod
-    def merge(packets: list[Packet]) -> bytes | None:
-        """Merge packets into one"""
+    def merge(packets: list[Packet], seq_space: int = 2**8) -> bytes | None:
+        """Merge packets into one, packets are in order of arrival"""
         if not packets:
             LOGGER.error("Packets list is empty")
             return None
 
-        data = b""
-        expected_seq_num = packets[0].seq_num
-        original_len = len(packets)
-
-        # ''' Testing with slising packets '''
-        # packets[13].__time_stamp = packets[13].__time_stamp + 0.0783
-        # packets[14].__time_stamp = packets[14].__time_stamp + 0.0783
-        # packets[15].__time_stamp = packets[15].__time_stamp + 0.0783
-        # packets = packets[0:13] + packets[16: 210] + packets[13:16] + packets[210:]
-
-        start = packets[0].time_stamp
-        arr: list[tuple] = []
-
-        count_of_255_packets = len(packets) // 255
-
-        for i in range(1, count_of_255_packets + 1):
-            end = packets[(i * 255) + (i - 1)].time_stamp
-            arr.append((start, end))
-            start = packets[(i * 255) + (i - 1) + 1].time_stamp
-
-        if count_of_255_packets * 255 < len(packets):
-            arr.append((start, packets[-1].time_stamp))
-
-        timestamp_ranges = {}
-        for start, end in arr:
-            small_list = [
-                packet for packet in packets if start <= packet.time_stamp <= end
-            ]
-            small_list = sorted(small_list, key=lambda packet: packet.seq_num)
-            timestamp_ranges[end] = small_list
-
-        timestamp_ranges = dict(sorted(timestamp_ranges.items()))
-
-        merged_packets = []
-        for value in timestamp_ranges.values():
-            merged_packets.extend(value)
-
-        packets = merged_packets
-
+        reassembly = Reassembly(seq_space=seq_space)
         for packet in packets:
-            if packet.seq_num != expected_seq_num:
-                LOGGER.debug(
-                    "Packet seq is not expected, num, expeted: %s: %s",
-                    packet.seq_num,
-                    expected_seq_num,
-                )
-                return None
-
-            data += packet.data
-            expected_seq_num = (expected_seq_num + 1) % (2**8)
-
-        if original_len != len(packets):
+            reassembly.add(packet.seq_num, packet.data)
+
+        if not reassembly.is_complete():
             LOGGER.error("Packets are missing")
             return None
 
-        return data
+        return bytes(reassembly.getvalue())
 
     @staticmethod
-    def merge_new(packets: set[Packet]) -> bytes | None:
+    def merge_new(packets: list[Packet]) -> bytes | None:
         """Merge packets into one"""
         if not packets:
             LOGGER.error("Packets list is empty")
             return None
 
-        packets = sorted(packets, key=lambda packet: packet.time_stamp)
-
-        data = b""
-        original_len = len(packets)
-
-        start = 0
-        arr: list[tuple] = []
-
-        count_of_255_packets = len(packets) // 255
-
-        for i in range(1, count_of_255_packets + 1):
-            end = (i * 255) + (i - 1)
-            arr.append((start, end))
-            start = (i * 255) + (i - 1) + 1
-
-        if count_of_255_packets * 255 < len(packets):
-            arr.append((start, len(packets) - 1))
-
-        for start, end in arr:
-            small_list = packets[start : end + 1]
-            small_list = sorted(small_list, key=lambda packet: packet.seq_num)
-            packets[start : end + 1] = small_list
-
-        expected_seq_num = packets[0].seq_num
-
-        for packet in packets:
-            if packet.seq_num != expected_seq_num:
-                LOGGER.debug(
-                    "Packet seq is not expected, num, expeted: %s: %s",
-                    packet.seq_num,
-                    expected_seq_num,
-                )
-                return None
-
-            data += packet.data
-            expected_seq_num = (expected_seq_num + 1) % (2**8)
-
-        if original_len != len(packets):
-            LOGGER.error("Packets are missing")
-            return None
-
-        return data
+        return Packet.merge(sorted(packets, key=lambda packet: packet.time_stamp))
 
     def __repr__(self) -> str:
         return f"Packet({self.__flags}, {self.__seq_num}, {self.__time_stamp})"
@@ -297,7 +398,8 @@ class Packet:
         return f"Packet({self.__flags}, {self.__seq_num}, {self.__time_stamp})"
 
     def __hash__(self) -> int:
-        return hash((self.__data, self.__flags, self.__seq_num))
+        """Data can be a view into writable receive buffer, which is not hashable"""
+        return hash((self.__flags, self.__seq_num))
 
     def __eq__(self, other: object) -> bool:
         if not isinstance(other, Packet):
@@ -0,0 +1,344 @@
+import os
+import time
+import struct
+import logging
+import multiprocessing
+
+from typing import Callable
+from multiprocessing.shared_memory import SharedMemory
+
+
+""" Global variables """
+LOGGER = logging.getLogger("Persist")
+RING = 32 * 1024 * 1024  # Shared memory for fragments, which are not written yet
+DESCRIPTOR = struct.Struct("=IQQI")  # file, offset in file, position in ring, length
+SMOOTHING = 1 / 8  # Weight of newest batch in write rate
+
+
+class Persister:
+    """
+    Persistence worker, process which writes received files to disk.
+    Network loop copies fragments into ring in shared memory and sends their
+    descriptors to worker, one message per pass of the loop. Worker writes
+    them at their offsets, checks that finished file has all its bytes,
+    renames it and reports back, so the loop never waits for disk.
+    Worker reports space of written fragments as well, ring is reused.
+    Write into full ring fails at once, on_room is called, when worker
+    frees space of it.
+    When network process dies, worker writes what it got, files stay .part.
+    """
+
+    def __init__(self, size: int = RING, on_room: Callable | None = None):
+        self.__size = size
+        self.__on_room = on_room
+        self.__full = False
+        self.__memory: SharedMemory | None = None
+        self.__process: multiprocessing.Process | None = None
+        self.__pipe = None
+
+        """ Positions only grow, position in ring is modulo size """
+        self.__head = 0
+        self.__released = 0
+        self.__descriptors: list[tuple[int, int, int, int]] = []
+
+        self.__files = 0
+        self.__finished: dict[int, Callable] = {}
+        self.__write_rate: float | None = None
+
+    @property
+    def pipe(self):
+        """Connection to worker, loop watches it for reports"""
+        return self.__pipe
+
+    @property
+    def write_rate(self) -> float | None:
+        """Bytes per second, which worker writes, None until first report"""
+        return self.__write_rate
+
+    @property
+    def pending(self) -> int:
+        """Bytes in ring, which are not written yet"""
+        return self.__head - self.__released
+
+    def start(self) -> None:
+        """Create shared memory and start worker"""
+
+        self.__memory = SharedMemory(create=True, size=self.__size)
+        self.__pipe, child = multiprocessing.Pipe()
+
+        context = multiprocessing.get_context("spawn")
+        self.__process = context.Process(
+            target=_persist,
+            args=(self.__memory.name, self.__size, child),
+            daemon=True,
+        )
+        self.__process.start()
+        child.close()
+
+        """ Worker is ready, when it attached shared memory """
+        self.__pipe.recv()
+
+    def open(self, part_path: str, total_size: int | None) -> int:
+        """Start file, returns its id"""
+
+        self.__files += 1
+        self.__pipe.send(("open", self.__files, part_path, total_size))
+
+        return self.__files
+
+    def has_room(self, length: int) -> bool:
+        """Check if fragment fits into ring, reports of worker are read first"""
+
+        if self.pending + 2 * length <= self.__size:
+            return True
+
+        self.on_readable()
+
+        return self.pending + 2 * length <= self.__size
+
+    def write(self, file_id: int, offset: int, data: bytes) -> bool:
+        """
+        Copy fragment into ring, it is sent to worker by flush.
+        False if ring is full, loop does not wait, caller keeps fragment.
+        """
+
+        length = len(data)
+        position = self.__head
+
+        """ Fragment does not wrap, rest of ring is skipped """
+        start = position % self.__size
+        if start + length > self.__size:
+            position += self.__size - start
+            start = 0
+
+        if position + length - self.__released > self.__size:
+            """ Reports of worker can free space """
+            self.on_readable()
+            if position + length - self.__released > self.__size:
+                self.__full = True
+                return False
+
+        self.__memory.buf[start : start + length] = data
+        self.__descriptors.append((file_id, offset, position, length))
+        self.__head = position + length
+
+        return True
+
+    def finish(
+        self, file_id: int, path: str, size: int, on_finished: Callable
+    ) -> None:
+        """
+        Rename file to path, when all its fragments are written.
+        on_finished gets path, or None if file could not be saved.
+        """
+
+        self.flush()
+        self.__finished[file_id] = on_finished
+        self.__pipe.send(("finish", file_id, path, size))
+
+    def discard(self, file_id: int) -> None:
+        """Delete unfinished file"""
+
+        self.flush()
+        self.__pipe.send(("discard", file_id))
+
+    def flush(self) -> None:
+        """Send descriptors of copied fragments"""
+
+        if not self.__descriptors:
+            return
+
+        """ Worker can not take more, while its reports are not read """
+        self.on_readable()
+
+        batch = b"".join(DESCRIPTOR.pack(*item) for item in self.__descriptors)
+        self.__descriptors = []
+        self.__pipe.send(("write", batch))
+
+    def on_readable(self) -> None:
+        """Read reports of worker"""
+
+        while self.__pipe.poll():
+            try:
+                report = self.__pipe.recv()
+            except (EOFError, OSError):
+                LOGGER.error("Persistence worker is gone")
+                return
+
+            self._report(report)
+
+        if self.__full and self.pending < self.__size:
+            self.__full = False
+            if self.__on_room is not None:
+                self.__on_room()
+
+    def close(self) -> None:
+        """Let worker write everything and stop it"""
+
+        if self.__process is None:
+            return
+
+        self.flush()
+        try:
+            self.__pipe.send(("close",))
+        except OSError:
+            pass
+
+        """ Reports of last writes, until worker closes pipe """
+        while True:
+            try:
+                self._report(self.__pipe.recv())
+            except (EOFError, OSError):
+                break
+
+        self.__process.join()
+        self.__process = None
+        self.__pipe.close()
+
+        self.__memory.close()
+        self.__memory.unlink()
+
+    def _report(self, report: tuple) -> None:
+        if report[0] == "released":
+            _, released, written, seconds = report
+            self.__released = max(self.__released, released)
+
+            if written and seconds > 0:
+                rate = written / seconds
+                if self.__write_rate is None:
+                    self.__write_rate = rate
+                else:
+                    self.__write_rate += SMOOTHING * (rate - self.__write_rate)
+
+        elif report[0] == "finished":
+            _, file_id, path = report
+            on_finished = self.__finished.pop(file_id, None)
+
+            if on_finished is not None:
+                on_finished(path)
+
+
+def _persist(name: str, size: int, pipe) -> None:
+    """Worker process, writes fragments from ring into files"""
+
+    memory = SharedMemory(name=name)
+    pipe.send(("ready",))
+
+    ring = memory.buf
+    files: dict[int, list] = {}  # id: [fd, part path, written bytes]
+
+    while True:
+        try:
+            message = pipe.recv()
+        except (EOFError, OSError):
+            break
+
+        kind = message[0]
+
+        if kind == "write":
+            started = time.perf_counter()
+            released = written = 0
+
+            for file_id, offset, position, length in DESCRIPTOR.iter_unpack(
+                message[1]
+            ):
+                entry = files.get(file_id)
+                start = position % size
+
+                if entry is not None:
+                    try:
+                        _pwrite(entry[0], ring[start : start + length], offset)
+                        entry[2] += length
+                    except OSError as e:
+                        LOGGER.error(f"Failed to write {entry[1]}: {e}")
+
+                released = position + length
+                written += length
+
+            seconds = time.perf_counter() - started
+            pipe.send(("released", released, written, seconds))
+
+        elif kind == "open":
+            _, file_id, part_path, total_size = message
+            try:
+                fd = os.open(
+                    part_path,
+                    os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0),
+                    0o644,
+                )
+                if total_size:
+                    os.ftruncate(fd, total_size)
+                files[file_id] = [fd, part_path, 0]
+            except OSError as e:
+                LOGGER.error(f"Failed to open {part_path}: {e}")
+
+        elif kind == "finish":
+            _, file_id, path, file_size = message
+            entry = files.pop(file_id, None)
+            pipe.send(("finished", file_id, _finish(entry, path, file_size)))
+
+        elif kind == "discard":
+            entry = files.pop(message[1], None)
+            if entry is not None:
+                os.close(entry[0])
+                _remove(entry[1])
+
+        elif kind == "close":
+            break
+
+    """ Unfinished files are kept as .part """
+    for fd, _, _ in files.values():
+        os.close(fd)
+
+    del ring
+    memory.close()
+
+
+def _finish(entry: list | None, path: str, size: int) -> str | None:
+    """Check that file has all its bytes and give it its name"""
+
+    if entry is None:
+        return None
+
+    fd, part_path, written = entry
+
+    try:
+        os.ftruncate(fd, size)
+        os.close(fd)
+    except OSError as e:
+        LOGGER.error(f"Failed to save {path}: {e}")
+        return None
+
+    if written != size:
+        LOGGER.error(f"File {path} has {written} of {size} bytes, it is dropped")
+        _remove(part_path)
+        return None
+
+    try:
+        os.replace(part_path, path)
+    except OSError as e:
+        LOGGER.error(f"Failed to save {path}: {e}")
+        return None
+
+    return path
+
+
+def _pwrite(fd: int, data: memoryview, offset: int) -> None:
+    """Write whole fragment at its offset"""
+
+    while data:
+        if hasattr(os, "pwrite"):
+            written = os.pwrite(fd, data, offset)
+        else:
+            os.lseek(fd, offset, os.SEEK_SET)
+            written = os.write(fd, data)
+
+        data = data[written:]
+        offset += written
+
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError as e:
+        LOGGER.warning(f"Failed to delete {path}: {e}")
@@ -0,0 +1,243 @@
+import time
+import errno
+import socket
+import logging
+
+from go.size import Size
+
+
+""" Global variables """
+LOGGER = logging.getLogger("PMTU")
+IP_MTU_DISCOVER = getattr(socket, "IP_MTU_DISCOVER", 10)
+IP_PMTUDISC_DO = getattr(socket, "IP_PMTUDISC_DO", 2)  # DF on every datagram
+IP_MTU = getattr(socket, "IP_MTU", 14)
+IP_UDP_HEADERS = 28  # IPv4 header without options and UDP header
+BASE = 548  # UDP payload, which every IPv4 path carries (576 MTU)
+MAX_PROBES = 3  # Probes of one size without answer, before size is too big
+PROBE_TIMEOUT = 0.5  # Seconds, until RTT is measured
+SEARCH_STEP = 16  # Search stops, when bounds are that close
+RAISE_INTERVAL = 600  # Seconds between searches for a larger size (RFC 8899)
+
+
+def enable(sock: socket.socket) -> bool:
+    """
+    Send every datagram with DF, so routers do not fragment them.
+    Datagram over known path MTU fails with EMSGSIZE instead.
+    """
+
+    try:
+        sock.setsockopt(socket.IPPROTO_IP, IP_MTU_DISCOVER, IP_PMTUDISC_DO)
+    except OSError as e:
+        LOGGER.info(f"Path MTU discovery is not supported: {e}")
+        return False
+
+    return True
+
+
+def is_too_big(error: OSError) -> bool:
+    """Check if send failed, because datagram is over path MTU"""
+
+    return error.errno == errno.EMSGSIZE
+
+
+def path_mtu(addr: tuple[str, int]) -> int | None:
+    """
+    Path MTU to addr, which kernel knows from its route and ICMP.
+    Read through connected socket, nothing is sent.
+    """
+
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.setsockopt(socket.IPPROTO_IP, IP_MTU_DISCOVER, IP_PMTUDISC_DO)
+            sock.connect(addr)
+            return sock.getsockopt(socket.IPPROTO_IP, IP_MTU)
+    except OSError:
+        return None
+
+
+class PathMtu:
+    """
+    Packetization layer path MTU discovery of one peer (RFC 8899).
+    Sizes are UDP payloads, header of the protocol with fragment.
+    Probe of BASE size checks that peer answers probes, peers which do
+    not (older ones) keep configured size. Then configured size is
+    probed, and when it is lost, largest size is searched for between
+    confirmed one and lost one. Until a size is proven too big, the
+    configured one is used, so transfers do not wait for the search.
+    Search waits for start, until peer is known to be connected.
+    EMSGSIZE from kernel (ICMP) and black holes lower the size and
+    start the search again.
+    """
+
+    def __init__(self, datagram: int, ceiling: int = Size.DATAGRAM):
+        self.__ceiling = int(min(datagram, ceiling))
+        self.__datagram = self.__ceiling
+
+        """ Confirmed size and smallest one which is too big """
+        self.__low = 0
+        self.__high = self.__ceiling + 1
+
+        self.__enabled = True
+        self.__probe: int | None = None
+        self.__attempts = 0
+        self.__sent_at = 0.0
+        self.__search_at: float | None = None
+
+    @property
+    def datagram(self) -> int:
+        """Largest datagram, which is sent to peer"""
+        return self.__datagram
+
+    @property
+    def confirmed(self) -> int:
+        """Size, which peer answered, 0 until it did"""
+        return self.__low
+
+    @property
+    def searching(self) -> bool:
+        """Check if probes are sent, or are due"""
+        if not self.__enabled or self.__search_at is None:
+            return False
+        return self.__probe is not None or self.__search_at <= time.perf_counter()
+
+    @property
+    def enabled(self) -> bool:
+        """Check if peer answers probes"""
+        return self.__enabled
+
+    def start(self) -> None:
+        """Search, once peer is connected, probes would break its handshake"""
+
+        if self.__search_at is None:
+            self.__search_at = time.perf_counter()
+
+    def next_probe(self, timeout: float) -> int | None:
+        """Size of probe to send now, None when none is due"""
+
+        now = time.perf_counter()
+
+        if not self.__enabled:
+            return None
+
+        if self.__probe is not None:
+            if now - self.__sent_at < timeout:
+                return None
+
+            if self.__attempts >= MAX_PROBES:
+                self._lost(self.__probe)
+                return self.next_probe(timeout)
+
+            self.__attempts += 1
+            self.__sent_at = now
+            return self.__probe
+
+        if self.__search_at is None or now < self.__search_at:
+            return None
+
+        size = self._next_size()
+        if size is None:
+            """ Search is over, look for a larger size later """
+            self.__search_at = now + RAISE_INTERVAL
+            self.__high = self.__ceiling + 1
+            return None
+
+        self.__probe = size
+        self.__attempts = 1
+        self.__sent_at = now
+
+        return size
+
+    def wakeup(self, timeout: float) -> float | None:
+        """perf_counter time, when next probe is due"""
+
+        if not self.__enabled:
+            return None
+
+        if self.__probe is not None:
+            return self.__sent_at + timeout
+
+        return self.__search_at
+
+    def acked(self, size: int) -> None:
+        """Peer answered probe"""
+
+        if size != self.__probe:
+            return
+
+        self.__probe = None
+        self.__low = max(self.__low, size)
+
+        if self.__low > self.__datagram or self.__low == self.__ceiling:
+            self._use(self.__low)
+
+    def too_big(self, mtu: int | None) -> None:
+        """Kernel refused datagram over path MTU, which it learned from ICMP"""
+
+        limit = mtu - IP_UDP_HEADERS if mtu else self.__datagram - 1
+        limit = max(limit, BASE)
+
+        if limit >= self.__datagram:
+            return
+
+        self.__high = min(self.__high, limit + 1)
+        self.__low = min(self.__low, limit)
+        self._use(limit)
+        self._restart()
+
+    def black_hole(self) -> None:
+        """Datagrams of current size are lost, confirm it again"""
+
+        if self.__low != self.__datagram:
+            return
+
+        self.__low = 0
+        self._restart()
+
+    def _next_size(self) -> int | None:
+        if self.__low == 0:
+            return BASE
+
+        if self.__low < self.__datagram:
+            return self.__datagram
+
+        if self.__high - self.__low <= SEARCH_STEP:
+            return None
+
+        return (self.__low + self.__high) // 2
+
+    def _lost(self, size: int) -> None:
+        """Probe was not answered MAX_PROBES times"""
+
+        self.__probe = None
+
+        if size == BASE and self.__low == 0:
+            LOGGER.info("Peer does not answer probes, path MTU is not searched")
+            self.__enabled = False
+            return
+
+        self.__high = min(self.__high, size)
+
+        if size <= self.__datagram:
+            """ Largest answered size is used, while larger ones are searched """
+            self._use(max(self.__low, BASE))
+
+    def _use(self, size: int) -> None:
+        if size != self.__datagram:
+            LOGGER.info(f"Path carries datagrams of {size} bytes")
+        self.__datagram = size
+
+    def _restart(self) -> None:
+        self.__enabled = True
+        self.__probe = None
+        if self.__search_at is not None:
+            self.__search_at = time.perf_counter()
+
+    def stats(self) -> dict:
+        """State of search, for monitoring"""
+
+        return {
+            "datagram": self.__datagram,
+            "confirmed": self.__low,
+            "probing": self.__probe,
+            "enabled": self.__enabled,
+        }
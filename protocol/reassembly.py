@@ -0,0 +1,520 @@
+import os
+import time
+import logging
+
+from typing import Callable
+from compress import Inflater
+
+
+""" Global variables """
+LOGGER = logging.getLogger("Reassembly")
+SMOOTHING = 1 / 8  # Weight of newest write in write cost
+
+
+class Reassembly:
+    """
+    Reassembly buffer of one transfer.
+    Every fragment is copied straight to its final offset when it arrives,
+    so finishing a transfer does not merge or sort anything.
+    Wrapped sequence numbers are unwrapped to absolute fragment indexes
+    relative to the first missing fragment.
+    """
+
+    def __init__(
+        self,
+        fragment_size: int = None,
+        total_size: int = None,
+        seq_space: int = 2**8,
+    ):
+        self.__fragment_size = fragment_size
+        self.__total_size = total_size
+        self.__seq_space = seq_space
+
+        self.__buffer = bytearray()
+        self.__size = 0
+        self.__write_cost: float | None = None
+        self._allocate(total_size)
+
+        self.__next_index = 0
+        self.__received: set[int] = set()
+        self.__pending: dict[int, bytes] = {}
+        self.__closed = False
+
+    @property
+    def closed(self) -> bool:
+        """Finished or discarded, fragments are not taken anymore"""
+        return self.__closed
+
+    @property
+    def fragment_size(self) -> int | None:
+        return self.__fragment_size
+
+    @property
+    def size(self) -> int:
+        return self.__size
+
+    @property
+    def write_rate(self) -> float | None:
+        """Bytes per second, which storage takes, None until first write"""
+        if not self.__write_cost:
+            return None
+        return 1 / self.__write_cost
+
+    @property
+    def next_index(self) -> int:
+        """First fragment index which was not received yet"""
+        return self.__next_index
+
+    def index_of(self, seq_num: int) -> int:
+        """Unwrap sequence number to absolute fragment index"""
+
+        delta = (seq_num - self.__next_index) % self.__seq_space
+        if delta >= self.__seq_space // 2:
+            delta -= self.__seq_space
+
+        return self.__next_index + delta
+
+    def has(self, index: int) -> bool:
+        """Check if fragment was already received"""
+
+        return index < self.__next_index or index in self.__received
+
+    def add(self, seq_num: int, data: bytes) -> bool | None:
+        """
+        Put fragment at its offset, False if it is a duplicate,
+        None if storage has no room for it now, it is not marked received
+        """
+
+        if self.__closed:
+            return False
+
+        index = self.index_of(seq_num)
+
+        if index < 0 or self.has(index):
+            return False
+
+        if self.__fragment_size is None:
+            if index != 0:
+                """Offsets are unknown until the first fragment arrives"""
+                self.__pending[index] = bytes(data)
+                self._mark(index)
+                return True
+
+            self.__fragment_size = len(data)
+
+        if not self._store(index, data):
+            return None
+        self._mark(index)
+
+        """ Fragments which did not fit are kept, until storage has room """
+        for pending_index, pending_data in list(self.__pending.items()):
+            if self._store(pending_index, pending_data):
+                del self.__pending[pending_index]
+
+        return True
+
+    def ranges(self, limit: int = 64) -> list[tuple[int, int]]:
+        """Runs of fragments received above first missing one, (start, length)"""
+
+        runs: list[list[int]] = []
+
+        for index in sorted(self.__received):
+            if runs and runs[-1][0] + runs[-1][1] == index:
+                runs[-1][1] += 1
+                continue
+
+            if len(runs) == limit:
+                break
+            runs.append([index, 1])
+
+        return [(start, length) for start, length in runs]
+
+    def stalled(self) -> bool:
+        """
+        Put fragments, which waited for room in storage,
+        check if some still wait
+        """
+
+        if self.__fragment_size is None:
+            return False
+
+        for pending_index, pending_data in list(self.__pending.items()):
+            if self._store(pending_index, pending_data):
+                del self.__pending[pending_index]
+
+        return bool(self.__pending)
+
+    def is_complete(self) -> bool:
+        """Check that there are no gaps"""
+
+        if self.__received or self.__pending:
+            return False
+
+        if self.__total_size is not None:
+            return self.__size == self.__total_size
+
+        return True
+
+    def getvalue(self) -> memoryview | None:
+        """Reassembled data, without copying it"""
+
+        return memoryview(self.__buffer)[: self.__size]
+
+    def discard(self) -> None:
+        """Drop everything received, transfer was not finished"""
+
+        self.__buffer = bytearray()
+        self.__received.clear()
+        self.__pending.clear()
+        self._close()
+
+    def _close(self) -> None:
+        """Late fragments are dropped, storage is finished or discarded"""
+
+        self.__closed = True
+
+    def _mark(self, index: int) -> None:
+        """Mark fragment as received and move first missing index"""
+
+        self.__received.add(index)
+
+        while self.__next_index in self.__received:
+            self.__received.remove(self.__next_index)
+            self.__next_index += 1
+
+    def _store(self, index: int, data: bytes) -> bool:
+        """Copy fragment to its offset"""
+
+        return self._put(index * self.__fragment_size, data)
+
+    def _put(self, offset: int, data: bytes) -> bool:
+        """Write data at offset of storage, False if it has no room now"""
+
+        end = offset + len(data)
+
+        if self.__total_size is not None and end > self.__total_size:
+            LOGGER.warning("Fragment is out of announced size")
+
+        started = time.perf_counter()
+        if not self._write(offset, data):
+            return False
+        self._measure((time.perf_counter() - started) / max(len(data), 1))
+
+        self.__size = max(self.__size, end)
+
+        return True
+
+    def _measure(self, cost: float) -> None:
+        """Smooth time of writing one byte"""
+
+        if self.__write_cost is None:
+            self.__write_cost = cost
+        else:
+            self.__write_cost += SMOOTHING * (cost - self.__write_cost)
+
+    def _allocate(self, total_size: int | None) -> None:
+        """Preallocate storage, when total size is known"""
+
+        self.__buffer = bytearray(total_size or 0)
+
+    def _write(self, offset: int, data: bytes) -> bool:
+        """Write fragment to storage"""
+
+        end = offset + len(data)
+
+        if end > len(self.__buffer):
+            """Grow geometrically, when total size is unknown"""
+            grow = max(end - len(self.__buffer), len(self.__buffer))
+            self.__buffer.extend(bytes(grow))
+
+        self.__buffer[offset:end] = data
+
+        return True
+
+    def __len__(self) -> int:
+        return self.__next_index + len(self.__received)
+
+    def __repr__(self) -> str:
+        return f"Reassembly({self.__next_index}, {len(self)}, {self.__size})"
+
+
+class FileReassembly(Reassembly):
+    """
+    Reassembly straight into a file, RAM stays flat whatever the file size.
+    Fragments are written at their offsets into a temporary file,
+    which is renamed to its final name when transfer is finished.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        fragment_size: int = None,
+        total_size: int = None,
+        seq_space: int = 2**8,
+    ):
+        self.__path = path
+        self.__part_path = f"{path}.part"
+        self.__fd = os.open(
+            self.__part_path,
+            os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0),
+            0o644,
+        )
+
+        super().__init__(fragment_size, total_size, seq_space)
+
+    @property
+    def path(self) -> str:
+        return self.__path
+
+    def getvalue(self) -> memoryview | None:
+        """Data is on disk, use finish"""
+
+        LOGGER.error("Data of file reassembly is on disk")
+        return None
+
+    def finish(self) -> str | None:
+        """Close temporary file and rename it to its final name"""
+
+        if self.__fd is None:
+            LOGGER.error("File reassembly is already closed")
+            return None
+
+        self._close()
+        os.ftruncate(self.__fd, self.size)
+        os.close(self.__fd)
+        self.__fd = None
+
+        os.replace(self.__part_path, self.__path)
+
+        return self.__path
+
+    def discard(self) -> None:
+        """Close and delete temporary file"""
+
+        super().discard()
+
+        if self.__fd is None:
+            return
+
+        os.close(self.__fd)
+        self.__fd = None
+
+        try:
+            os.remove(self.__part_path)
+        except OSError as e:
+            LOGGER.warning(f"Failed to delete {self.__part_path}: {e}")
+
+    def _allocate(self, total_size: int | None) -> None:
+        """Preallocate file, when total size is known"""
+
+        if total_size:
+            os.ftruncate(self.__fd, total_size)
+
+    def _write(self, offset: int, data: bytes) -> bool:
+        """Write fragment at its offset in file"""
+
+        data = memoryview(data)
+
+        while data:
+            if hasattr(os, "pwrite"):
+                written = os.pwrite(self.__fd, data, offset)
+            else:
+                os.lseek(self.__fd, offset, os.SEEK_SET)
+                written = os.write(self.__fd, data)
+
+            data = data[written:]
+            offset += written
+
+        return True
+
+
+class OffloadReassembly(Reassembly):
+    """
+    Reassembly written by persistence worker (persist.py).
+    Fragments are only copied into its shared ring here, worker writes
+    them into the file and renames it, finish reports the path later.
+    Fragment which does not fit into the ring is not taken, sender resends it.
+    """
+
+    def __init__(
+        self,
+        persister,
+        path: str,
+        fragment_size: int = None,
+        total_size: int = None,
+        seq_space: int = 2**8,
+    ):
+        self.__persister = persister
+        self.__path = path
+        self.__file = persister.open(f"{path}.part", total_size)
+        self.__closed = False
+
+        super().__init__(fragment_size, total_size, seq_space)
+
+    @property
+    def path(self) -> str:
+        return self.__path
+
+    @property
+    def write_rate(self) -> float | None:
+        """Bytes per second, which worker writes"""
+        return self.__persister.write_rate
+
+    def add(self, seq_num: int, data: bytes) -> bool | None:
+        if self.closed or self.has(self.index_of(seq_num)):
+            return False
+
+        if not self.__persister.has_room(len(data)):
+            return None
+
+        return super().add(seq_num, data)
+
+    def getvalue(self) -> memoryview | None:
+        """Data is on disk, use finish"""
+
+        LOGGER.error("Data of file reassembly is on disk")
+        return None
+
+    def finish(self, on_finished: Callable) -> None:
+        """Worker renames file, on_finished gets its path or None"""
+
+        if self.__closed:
+            LOGGER.error("File reassembly is already closed")
+            return
+
+        self.__closed = True
+        self._close()
+        self.__persister.finish(self.__file, self.__path, self.size, on_finished)
+
+    def discard(self) -> None:
+        """Worker deletes temporary file"""
+
+        super().discard()
+
+        if self.__closed:
+            return
+
+        self.__closed = True
+        self.__persister.discard(self.__file)
+
+    def _allocate(self, total_size: int | None) -> None:
+        """Worker preallocates file, when it opens it"""
+
+    def _write(self, offset: int, data: bytes) -> bool:
+        """Copy fragment into ring, False when it is full"""
+        return self.__persister.write(self.__file, offset, data)
+
+
+class InflateReassembly(Reassembly):
+    """
+    Reassembly of compressed transfer (compress.py).
+    Fragments are parts of zlib stream, which is inflated in order into
+    storage, plain, file or offloaded reassembly of announced size.
+    Fragments above a gap wait in memory until it is filled.
+    Output which storage has no room for waits in zlib, next fragment
+    of stream waits in memory and is not acked, until output fits.
+    """
+
+    def __init__(
+        self,
+        storage: Reassembly,
+        fragment_size: int = None,
+        total_size: int = None,
+        seq_space: int = 2**8,
+    ):
+        self.__storage = storage
+        self.__inflater = Inflater(total_size)
+
+        """ Offsets of stream, which is inflated, and of output """
+        self.__inflated = 0
+        self.__output = 0
+        self.__waiting: dict[int, bytes] = {}
+        self.__piece: bytes | None = None
+
+        """ Size of stream is not known, only size of output """
+        super().__init__(fragment_size, None, seq_space)
+
+    @property
+    def storage(self) -> Reassembly:
+        return self.__storage
+
+    @property
+    def size(self) -> int:
+        """Inflated bytes"""
+        return self.__storage.size
+
+    @property
+    def write_rate(self) -> float | None:
+        return self.__storage.write_rate
+
+    def add(self, seq_num: int, data: bytes) -> bool | None:
+        """Output, which did not fit before, is put first"""
+
+        self._inflate()
+        return super().add(seq_num, data)
+
+    def stalled(self) -> bool:
+        """Put output, which waited for room in storage, check if some still waits"""
+
+        self._inflate()
+        return self.__piece is not None or not self.__inflater.idle
+
+    def is_complete(self) -> bool:
+        return (
+            super().is_complete()
+            and not self.stalled()
+            and self.__inflater.finished
+        )
+
+    def getvalue(self) -> memoryview | None:
+        return self.__storage.getvalue()
+
+    def finish(self, *args):
+        """Finish storage, check is_complete first"""
+
+        self._close()
+        return self.__storage.finish(*args)
+
+    def discard(self) -> None:
+        super().discard()
+        self.__waiting.clear()
+        self.__piece = None
+        self.__storage.discard()
+
+    def _allocate(self, total_size: int | None) -> None:
+        """Storage is allocated for output"""
+
+    def _write(self, offset: int, data: bytes) -> bool:
+        """Inflate fragment, when stream before it is inflated already"""
+
+        if offset < self.__inflated:
+            """ Resent fragment, which was inflated while it waited """
+            return True
+
+        self.__waiting[offset] = bytes(data)
+        self._inflate()
+
+        """ Next fragment of stream waits, while storage is full """
+        return offset != self.__inflated
+
+    def _inflate(self) -> None:
+        """Inflate stream in order, until storage has no room"""
+
+        while not self.closed:
+            if self.__piece is None:
+                self.__piece = self.__inflater.next_piece()
+
+            if self.__piece is None:
+                data = self.__waiting.pop(self.__inflated, None)
+                if data is None:
+                    return
+
+                self.__inflated += len(data)
+                self.__inflater.inflate(data)
+                continue
+
+            if self.__piece and not self.__storage._put(self.__output, self.__piece):
+                return
+
+            self.__output += len(self.__piece)
+            self.__piece = None
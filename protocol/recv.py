@@ -4,15 +4,22 @@ import logging
 
 from go.time import Time
 from go.size import Size
-from packet import Packet
+from go.version import Version
+from packet import Packet, HEADERS, SEQ_SPACES
 from go.flags import Flags
 from typing import Callable
 from go.status import Status
+from reassembly import Reassembly, FileReassembly, OffloadReassembly, InflateReassembly
+from scheduler import at_wall
 from go.adressinfo import AddressInfo
 
 
 """ Global variables """
 LOGGER = logging.getLogger("Receiver")
+ACK_EVERY = 8  # RangeACK after that many new fragments
+ACK_DELAY = 0.005  # or after that many seconds
+DRAIN_TIME = 0.1  # Advertised window is written to storage within that many seconds
+MAX_MESSAGE = 2**26  # Messages are reassembled in memory, bigger ones are refused
 
 
 class Receiver:
@@ -21,6 +28,11 @@ class Receiver:
     Devide data into packets if needed.
     Handle sequence numbers.
     Have buffer for packets.
+    Receivers of a host share its socket buffer, window is split among them.
+    When transfer is finished, on_received is called with sender address,
+    path of the saved file and received message, one of them is None.
+    With persister, files are written by persistence worker process.
+    Sender can offer zlib compression in init, it is echoed in SACK.
     """
 
     def __init__(
@@ -31,8 +43,21 @@ class Receiver:
         extention: str = None,
         transfer_flag: int = None,
         fragment_size: int = 1468,
+        version: Version = Version.V1,
+        buffer_size: int = Size.RECV_BUFFER,
+        on_received: Callable = None,
+        persister=None,
+        receivers: set | None = None,
     ):
         self.__seq_num = 0
+        self.__on_received = on_received
+        self.__persister = persister
+        self.__compressed = False
+        self.__version = version
+        self.__buffer_size = buffer_size
+        self.__receivers = set() if receivers is None else receivers
+        self.__receivers.add(self)
+        self.__header_size = HEADERS[version].size
         self.__name = name
         self.__client = addr
         self.__ext = extention
@@ -41,7 +66,12 @@ class Receiver:
         self.__own_transfer_flag = transfer_flag
 
         self.__acks: set[int] = set()
-        self.__packets: set[Packet] = set()
+        self.__range_ack = False
+        self.__flow_control = False
+        self.__ack_pending = 0
+        self.__ack_now = False
+        self.__ack_time = time.time()
+        self.__reassembly = Reassembly(seq_space=SEQ_SPACES[version])
         self.__size_of_all_data = 0
         self.__size_of_all_headers = 0
 
@@ -50,6 +80,8 @@ class Receiver:
 
         self.__started = None
         self.__ended = None
+        self.__fin_waiting = False
+        self.__published = False
 
     @property
     def alive(self) -> Status:
@@ -75,10 +107,46 @@ class Receiver:
     def client(self) -> AddressInfo:
         return self.__client
 
-    def get_packets(self) -> set[Packet]:
-        """Get packets"""
+    def window(self) -> int:
+        """
+        Window in fragments advertised to sender.
+        Limited by datagrams which its share of socket buffer holds,
+        and by fragments which storage writes in DRAIN_TIME.
+        """
 
-        return self.__packets
+        fragment_size = self.__reassembly.fragment_size or self.__fragment_size
+
+        """ Kernel frees memory of read datagrams in quarters of the buffer """
+        share = self.__buffer_size * 3 // 4 // max(len(self.__receivers), 1)
+        window = share // (
+            fragment_size + self.__header_size + Size.DATAGRAM_OVERHEAD
+        )
+
+        write_rate = self.__reassembly.write_rate
+        if write_rate is not None:
+            window = min(window, int(write_rate * DRAIN_TIME / fragment_size))
+
+        return min(max(window, 1), 2**16 - 1)
+
+    def wakeup(self) -> float | None:
+        """perf_counter time when receiver needs to run, data wakes it up as well"""
+
+        if self.__alive == Status.DEAD:
+            return time.perf_counter()
+
+        wake_at = self.__last_time + Time.KEEPALIVE
+
+        if self.__range_ack and self.__ack_pending:
+            wake_at = min(wake_at, self.__ack_time + ACK_DELAY)
+        elif self.__acks:
+            return time.perf_counter()
+
+        return at_wall(wake_at)
+
+    def get_reassembly(self) -> Reassembly:
+        """Get reassembly buffer"""
+
+        return self.__reassembly
 
     def time_is_valid(self) -> bool:
         """Check if receiver is still alive"""
@@ -96,14 +164,16 @@ class Receiver:
     def receive(self, packet: Packet) -> None:
         """Receive FILE, MSG, FIN"""
 
-        self.__size_of_all_data += len(packet.data) + 4
-        self.__size_of_all_headers += 4
+        self.__size_of_all_data += len(packet.data) + self.__header_size
+        self.__size_of_all_headers += self.__header_size
 
         if packet.flags == Flags.FILE:
             self._process_file(packet)
 
         elif packet.flags == Flags.MSG:
-            self._send_sack()
+            _, options = Packet.decode_fields(packet.data)
+            if self._apply_options(options):
+                self._send_sack()
 
         elif packet.flags == Flags.FIN:
             self._process_fin(packet)
@@ -113,46 +183,91 @@ class Receiver:
     def receive_data(self, packet: Packet) -> None:
         """Receive data"""
 
-        self.__size_of_all_data += len(packet.data) + 4
-        self.__size_of_all_headers += 4
+        if self.__alive == Status.DEAD:
+            """Transfer is finished or discarded, late fragment is dropped"""
+            return
 
-        if packet not in self.__packets:
+        self.__size_of_all_data += len(packet.data) + self.__header_size
+        self.__size_of_all_headers += self.__header_size
+
+        taken = self.__reassembly.add(packet.seq_num, packet.data)
+
+        if taken is None:
+            """ No room for it now, it is not acked, so sender resends it """
+            LOGGER.debug(f"Fragment {packet.seq_num} is not taken, storage is full")
+
+        elif taken:
             self.__seq_num += 1
 
             self.__acks.add(packet.seq_num)
-            self.__packets.add(packet)
             self.__last_time = time.time()
 
+            if not self.__ack_pending:
+                self.__ack_time = time.time()
+            self.__ack_pending += 1
+
+            """ Gap in the window is reported at once """
+            if self.__reassembly.next_index != len(self.__reassembly):
+                self.__ack_now = True
+
+        elif self.__range_ack:
+            """Duplicate, previous RangeACK was probably lost"""
+            self.__ack_pending += 1
+            self.__ack_now = True
+
         else:
             """Resend ack"""
             ack = Packet.construct(
                 data=f"{self.own_transfer_flag}".encode(),
                 flags=Flags.ACK,
                 seq_num=packet.seq_num,
+                version=self.__version,
             )
             self.__send_func(ack, self.__client)
-            self.__size_of_all_headers += 4
+            self.__size_of_all_headers += self.__header_size
             self.__size_of_all_data += len(ack)
 
+        """
+        Urgent acks are sent per packet, not once per batch read from socket,
+        so one lost RangeACK does not leave sender waiting for timeout.
+        """
+        if self.__range_ack and (
+            self.__ack_now or self.__ack_pending >= ACK_EVERY
+        ):
+            self._acknowledge_range()
+
     def _send_sack(self) -> None:
         """Send SACK"""
         LOGGER.info(f"Sending SACK to {self.__client}")
+
+        """ Agreed options are echoed only to peers which offered them """
+        options = {}
+        if self.__range_ack:
+            options["ack"] = "range"
+        if self.__flow_control:
+            options["wm"] = self.window()
+        if self.__compressed:
+            options["zlib"] = 1
+
         self.__send_func(
             Packet.construct(
-                data=f"{self.own_transfer_flag}".encode(),
+                data=Packet.encode_fields([self.own_transfer_flag], options),
                 flags=Flags.SACK,
                 seq_num=self.__seq_num,
+                version=self.__version,
             ),
             self.__client,
         )
-        self.__size_of_all_headers += 4
-        self.__size_of_all_data += len(str(self.own_transfer_flag).encode()) + 4
+        self.__size_of_all_headers += self.__header_size
+        self.__size_of_all_data += (
+            len(str(self.own_transfer_flag).encode()) + self.__header_size
+        )
         self.__started = time.time()
 
     def _process_file(self, packet: Packet) -> None:
         """Process file"""
 
-        data = packet.data.decode().split(":")
+        data, options = Packet.decode_fields(packet.data)
 
         name_ext, flag = data[0], int(data[1])
         try:
@@ -164,66 +279,241 @@ class Receiver:
         self.__ext = ext
         self.__own_transfer_flag = flag
 
-        self._send_sack()
+        if self._apply_options(options):
+            self._send_sack()
+
+    def _apply_options(self, options: dict[str, str]) -> bool:
+        """Apply options from FILE/MSG init, False if transfer is refused"""
+
+        size, frag = options.get("size"), options.get("frag")
+
+        """ Only newer peers tell offsets and size, so buffer can be preallocated """
+        try:
+            fragment_size = int(frag) if frag is not None else None
+            total_size = int(size) if size is not None else None
+        except ValueError:
+            return self._refuse(f"invalid size {size} or fragment size {frag}")
+
+        max_fragment = Size.DATAGRAM - self.__header_size
+        if fragment_size is not None and not 1 <= fragment_size <= max_fragment:
+            return self._refuse(f"fragment size {fragment_size}")
+
+        if total_size is not None and total_size < 0:
+            return self._refuse(f"size {total_size}")
+
+        """ Files can be as big as 4B fragment indexes address """
+        is_file = self.name is not None and self.ext is not None
+        max_size = SEQ_SPACES[Version.V2] * max_fragment if is_file else MAX_MESSAGE
+        if total_size is not None and total_size > max_size:
+            return self._refuse(f"size {total_size}")
+
+        self.__range_ack = options.get("ack") == "range"
+        self.__flow_control = "wm" in options
+
+        """ Compressed stream is inflated into storage of announced size """
+        self.__compressed = "zlib" in options and None not in (frag, size)
+
+        self.__reassembly.discard()
+
+        if is_file and self.__persister:
+            """Persistence worker writes files, loop only hands fragments over"""
+            self.__reassembly = OffloadReassembly(
+                self.__persister,
+                self._file_path(),
+                fragment_size=fragment_size,
+                total_size=total_size,
+                seq_space=SEQ_SPACES[self.__version],
+            )
+        elif is_file:
+            """Files are written to disk as fragments arrive"""
+            try:
+                self.__reassembly = FileReassembly(
+                    self._file_path(),
+                    fragment_size=fragment_size,
+                    total_size=total_size,
+                    seq_space=SEQ_SPACES[self.__version],
+                )
+            except OSError as e:
+                return self._refuse(f"file can not be created: {e}")
+        else:
+            self.__reassembly = Reassembly(
+                fragment_size=fragment_size,
+                total_size=total_size,
+                seq_space=SEQ_SPACES[self.__version],
+            )
+
+        if self.__compressed:
+            self.__reassembly = InflateReassembly(
+                self.__reassembly,
+                fragment_size=fragment_size,
+                total_size=total_size,
+                seq_space=SEQ_SPACES[self.__version],
+            )
+
+        return True
+
+    def _refuse(self, reason: str) -> bool:
+        """Transfer with invalid options is not answered, receiver dies"""
+
+        LOGGER.warning(f"Refused transfer from {self.__client}: {reason}")
+        self.__alive = Status.DEAD
+
+        return False
 
-    def _process_fin(self, packet: Packet) -> None:
-        """Process FIN"""
+    def _file_path(self) -> str:
+        """Full path of received file"""
+
+        file_name = f"{self.__name}_{int(time.time())}.{self.__ext}"
+        if self.__ext == "":
+            file_name = f"{self.__name}_{int(time.time())}"
+
+        """ Construct fpath """
+        script_dir = os.path.dirname(os.path.abspath(__file__))
+        return os.path.join(script_dir, "files", file_name)
+
+    def _process_fin(self, packet: Packet | None) -> None:
+        """Process FIN, it is answered only when data is saved"""
+
+        if self.__ended is not None:
+            """Repeated FIN, our answer was lost"""
+            if self.__published:
+                self._send_fin()
+            return
+
+        if self.__reassembly.stalled():
+            """ Storage is full, FIN is answered, once data fits """
+            LOGGER.info(f"Data from {self.__client} waits for room in storage")
+            self.__fin_waiting = True
+            return
+
+        self.__fin_waiting = False
 
         self.__alive = Status.DEAD
         self.__ended = time.time()
 
         LOGGER.info(
             f"File transfer is finished from {self.__client} in {self.__ended - self.__started} seconds,"
-            f"with number of packets: {len(self.__packets)}"
+            f"with number of packets: {len(self.__reassembly)}"
         )
 
-        """ Send FIN """
-        self.__send_func(
-            Packet.construct(
-                data=f"{self.own_transfer_flag}".encode(), flags=Flags.FIN, seq_num=3
-            ),
-            self.__client,
-        )
-
-        self.__size_of_all_headers += 4
-        self.__size_of_all_data += len(str(self.own_transfer_flag).encode()) + 4
-
         LOGGER.info(
             f"In percentage: {(self.__size_of_all_headers / self.__size_of_all_data) * 100}",
         )
 
         LOGGER.info(f"{self.__size_of_all_data}, {self.__size_of_all_headers}")
 
-        if self.name is not None and self.ext is not None:
-            """Create file from packets and save it"""
-            file_data = Packet.merge_new(self.__packets)
-            file_name = f"{self.__name}_{int(time.time())}.{self.__ext}"
-            if self.__ext == "":
-                file_name = f"{self.__name}_{int(time.time())}"
+        """
+        FIN can overtake a lost fragment, gaps are never published,
+        FIN stays unanswered, so sender does not count transfer as completed
+        """
+        if not self.__reassembly.is_complete():
+            LOGGER.error(f"Data from {self.__client} is incomplete")
+            self.__reassembly.discard()
+            return
+
+        storage = self.__reassembly
+        if isinstance(storage, InflateReassembly):
+            storage = storage.storage
 
-            """ Construct fpath """
-            script_dir = os.path.dirname(os.path.abspath(__file__))
-            full_file_path = os.path.join(script_dir, "files", file_name)
+        if isinstance(storage, OffloadReassembly):
+            """Worker renames the file, FIN is answered when it has written all of it"""
+            self.__reassembly.finish(self._saved)
 
+        elif self.name is not None and self.ext is not None:
+            """Fragments are already on disk, only rename the file"""
             try:
-                with open(full_file_path, "wb") as f:
-                    f.write(file_data)
-                LOGGER.info(f"Received file from {self.__client}")
-                LOGGER.info(f"File name: {self.__name}_{int(time.time())}.{self.__ext}")
-                LOGGER.info(
-                    f"File size: {len(self.__packets) * self.fragment_size} bytes"
-                )
+                full_file_path = self.__reassembly.finish()
             except Exception as e:
                 LOGGER.error(f"Failed to save file: {e}")
+                return
+
+            self._saved(full_file_path)
 
         else:
             """Create message from packets and print it"""
-            message = Packet.merge_new(self.__packets).decode()
+            message = bytes(self.__reassembly.getvalue()).decode()
             LOGGER.info(f"Received message from {self.__client} : {message}")
 
+            self._published()
+
+            if self.__on_received is not None:
+                self.__on_received(self.__client, None, message)
+
+    def _saved(self, full_file_path: str | None) -> None:
+        """File is saved, or saving failed when there is no path"""
+
+        if full_file_path is None:
+            LOGGER.error(f"Failed to save file from {self.__client}")
+            return
+
+        LOGGER.info(f"Received file from {self.__client}")
+        LOGGER.info(f"File name: {os.path.basename(full_file_path)}")
+        LOGGER.info(f"File size: {self.__reassembly.size} bytes")
+
+        self._published()
+
+        if self.__on_received is not None:
+            self.__on_received(self.__client, full_file_path, None)
+
+    def _published(self) -> None:
+        """Data is saved, FIN tells sender, that transfer is completed"""
+
+        self.__published = True
+        self._send_fin()
+
+    def _send_fin(self) -> None:
+        """Send FIN"""
+
+        self.__send_func(
+            Packet.construct(
+                data=f"{self.own_transfer_flag}".encode(),
+                flags=Flags.FIN,
+                seq_num=3,
+                version=self.__version,
+            ),
+            self.__client,
+        )
+
+        self.__size_of_all_headers += self.__header_size
+        self.__size_of_all_data += (
+            len(str(self.own_transfer_flag).encode()) + self.__header_size
+        )
+
+    def _acknowledge_range(self) -> None:
+        """Acknowledge whole window with one RangeACK"""
+
+        cumulative = self.__reassembly.next_index
+        ranges = self.__reassembly.ranges()
+
+        ack = Packet.construct(
+            data=Packet.encode_range_ack(cumulative, self.window(), ranges),
+            flags=Flags.WM | self.own_transfer_flag,
+            seq_num=0,
+            version=self.__version,
+        )
+        self.__send_func(ack, self.__client)
+        self.__size_of_all_headers += self.__header_size
+        self.__size_of_all_data += len(ack)
+
+        self.__ack_pending = 0
+        self.__ack_now = False
+        self.__acks.clear()
+
     def _acknowledge_data(self) -> None:
         """Acknowledge data"""
 
+        if self.__range_ack:
+            if not self.__ack_pending:
+                return
+
+            if (
+                self.__ack_now
+                or self.__ack_pending >= ACK_EVERY
+                or time.time() - self.__ack_time > ACK_DELAY
+            ):
+                self._acknowledge_range()
+            return
+
         if len(self.__acks) == 0:
             return
 
@@ -232,9 +522,10 @@ class Receiver:
                 data=f"{self.own_transfer_flag}".encode(),
                 flags=Flags.ACK,
                 seq_num=seq_num,
+                version=self.__version,
             )
             self.__send_func(ack, self.__client)
-            self.__size_of_all_headers += 4
+            self.__size_of_all_headers += self.__header_size
             self.__size_of_all_data += len(str(self.own_transfer_flag).encode())
 
         self.__acks.clear()
@@ -244,8 +535,18 @@ class Receiver:
 
         if self.__alive == Status.DEAD or not self.time_is_valid():
             self.__alive = Status.DEAD
+            self.__receivers.discard(self)
+            if self.__ended is None:
+                """Transfer was not finished, drop what was received"""
+                self.__reassembly.discard()
             return Status.FINISHED
 
+        """ Storage has room again, data which waited for it goes first """
+        if self.__fin_waiting:
+            self._process_fin(None)
+        else:
+            self.__reassembly.stalled()
+
         self._acknowledge_data()
 
         return Status.SLEEPING
@@ -0,0 +1,94 @@
+from go.time import Time
+
+
+""" Global variables """
+ALPHA = 1 / 8
+BETA = 1 / 4
+K = 4
+GRANULARITY = 0.001
+MIN_RTO = 0.2
+INITIAL_RTO = 1.0
+MAX_RTO = float(Time.TTL)
+
+
+class RttEstimator:
+    """
+    Round trip time estimator of one connection (RFC 6298).
+    Samples of retransmitted packets must not be passed in (Karn's rule),
+    their ack can belong to any of the copies.
+    """
+
+    def __init__(self):
+        self.__srtt: float | None = None
+        self.__rttvar: float | None = None
+        self.__rto = INITIAL_RTO
+        self.__backoffs = 0
+        self.__samples = 0
+        self.__last_sample: float | None = None
+
+    @property
+    def srtt(self) -> float | None:
+        return self.__srtt
+
+    @property
+    def rttvar(self) -> float | None:
+        return self.__rttvar
+
+    @property
+    def rto(self) -> float:
+        return self.__rto
+
+    @property
+    def backoffs(self) -> int:
+        return self.__backoffs
+
+    @property
+    def samples(self) -> int:
+        return self.__samples
+
+    @property
+    def last_sample(self) -> float | None:
+        return self.__last_sample
+
+    def sample(self, rtt: float) -> None:
+        """Update estimation with measured round trip time"""
+
+        if rtt < 0:
+            return
+
+        if self.__srtt is None:
+            self.__srtt = rtt
+            self.__rttvar = rtt / 2
+        else:
+            self.__rttvar = (1 - BETA) * self.__rttvar + BETA * abs(self.__srtt - rtt)
+            self.__srtt = (1 - ALPHA) * self.__srtt + ALPHA * rtt
+
+        self.__samples += 1
+        self.__last_sample = rtt
+        self.__backoffs = 0
+        self.__rto = self._clamp(self.__srtt + max(GRANULARITY, K * self.__rttvar))
+
+    def backoff(self) -> None:
+        """Retransmission timer expired, double the timeout"""
+
+        self.__backoffs += 1
+        self.__rto = self._clamp(self.__rto * 2)
+
+    def stats(self) -> dict:
+        """State of estimator, for monitoring"""
+
+        return {
+            "srtt": self.__srtt,
+            "rttvar": self.__rttvar,
+            "rto": self.__rto,
+            "backoffs": self.__backoffs,
+            "samples": self.__samples,
+            "last_sample": self.__last_sample,
+        }
+
+    @staticmethod
+    def _clamp(rto: float) -> float:
+        return min(max(rto, MIN_RTO), MAX_RTO)
+
+    def __repr__(self) -> str:
+        return f"RttEstimator({self.__srtt}, {self.__rttvar}, {self.__rto})"
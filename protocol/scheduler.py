@@ -0,0 +1,356 @@
+import time
+import heapq
+import socket
+import asyncio
+import logging
+import itertools
+import threading
+
+from typing import Callable
+from go.status import Status
+from collections import deque
+from selectors import DefaultSelector, EVENT_READ
+
+
+""" Global variables """
+LOGGER = logging.getLogger("Scheduler")
+MAX_WAIT = 1.0  # Longest sleep without any event, stop is noticed within it
+
+
+def at_wall(when: float) -> float:
+    """perf_counter time of a time.time moment"""
+    return time.perf_counter() + when - time.time()
+
+
+class Scheduler:
+    """
+    Event loop of host, replaces polling of every iterator on every pass.
+    Tasks are iterators of connections and transfers, they run only when
+    a packet wakes them up or when their timer expires.
+    After every run task is asked when it needs to run again, through its
+    wakeup function, which returns perf_counter time or None, if only
+    a packet can move it.
+    Sockets are watched by selector, other threads interrupt the wait
+    through a socket pair.
+    """
+
+    def __init__(self):
+        self.__selector = DefaultSelector()
+        self.__tasks: dict[Callable, Callable | None] = {}
+        self.__ready: deque[Callable] = deque()
+        self.__queued: set[Callable] = set()
+
+        """ Heap of (time, order, task), entry is valid while it is in due """
+        self.__timers: list[tuple[float, int, Callable]] = []
+        self.__due: dict[Callable, float] = {}
+        self.__order = itertools.count()
+
+        self.__thread: int | None = None
+        self.__runs = 0
+
+        self.__waker, self.__waiter = socket.socketpair()
+        self.__waker.setblocking(False)
+        self.__waiter.setblocking(False)
+        self.__selector.register(self.__waiter, EVENT_READ, self._drain_waiter)
+
+    @property
+    def runs(self) -> int:
+        """Number of task runs, for monitoring"""
+        return self.__runs
+
+    def __len__(self) -> int:
+        return len(self.__tasks)
+
+    def add(self, task: Callable, wakeup: Callable | None = None) -> None:
+        """Register task, it runs on the next pass"""
+
+        self.__tasks[task] = wakeup
+        self.wake(task)
+
+    def wake(self, task: Callable) -> None:
+        """Run task on the next pass, safe to call from any thread"""
+
+        if task in self.__queued or task not in self.__tasks:
+            return
+
+        self.__queued.add(task)
+        self.__ready.append(task)
+
+        if self.__thread is not None and self.__thread != threading.get_ident():
+            self.interrupt()
+
+    def call_at(self, task: Callable, when: float) -> None:
+        """Run task at perf_counter time, replaces earlier timer of task"""
+
+        if self.__due.get(task) == when:
+            return
+
+        self.__due[task] = when
+        heapq.heappush(self.__timers, (when, next(self.__order), task))
+
+    def add_reader(self, fileobj, callback: Callable) -> None:
+        """Call callback, when fileobj can be read"""
+        self.__selector.register(fileobj, EVENT_READ, callback)
+
+    def remove_reader(self, fileobj) -> None:
+        self.__selector.unregister(fileobj)
+
+    def interrupt(self) -> None:
+        """Wake loop, which waits for events"""
+
+        try:
+            self.__waker.send(b"\0")
+        except (BlockingIOError, OSError):
+            """Loop is already woken up"""
+
+    def run_once(self) -> None:
+        """Wait for packets or timers, then run tasks which are ready"""
+
+        self.__thread = threading.get_ident()
+
+        for key, _ in self.__selector.select(timeout=self._timeout()):
+            key.data()
+
+        self._expire(time.perf_counter())
+
+        """ Tasks woken up by this pass run on the next one """
+        for _ in range(len(self.__ready)):
+            task = self.__ready.popleft()
+            self.__queued.discard(task)
+            self._run(task)
+
+    def clear(self) -> None:
+        """Forget all tasks and timers"""
+
+        self.__tasks.clear()
+        self.__ready.clear()
+        self.__queued.clear()
+        self.__timers.clear()
+        self.__due.clear()
+
+    def close(self) -> None:
+        self.__selector.close()
+        self.__waker.close()
+        self.__waiter.close()
+
+    def _run(self, task: Callable) -> None:
+        if task not in self.__tasks:
+            return
+
+        self.__runs += 1
+
+        if task() is Status.FINISHED:
+            del self.__tasks[task]
+            self.__due.pop(task, None)
+            return
+
+        wakeup = self.__tasks[task]
+        when = wakeup() if wakeup is not None else None
+
+        if when is None:
+            self.__due.pop(task, None)
+        elif when <= time.perf_counter():
+            self.wake(task)
+        else:
+            self.call_at(task, when)
+
+    def _expire(self, now: float) -> None:
+        """Move tasks which timer expired to ready"""
+
+        while self.__timers and self.__timers[0][0] <= now:
+            when, _, task = heapq.heappop(self.__timers)
+
+            if self.__due.get(task) == when:
+                del self.__due[task]
+                self.wake(task)
+
+    def _timeout(self) -> float:
+        """How long to wait for packets, before next timer expires"""
+
+        if self.__ready:
+            return 0
+
+        """ Drop timers which were replaced or cancelled """
+        while self.__timers:
+            when, _, task = self.__timers[0]
+            if self.__due.get(task) == when:
+                break
+            heapq.heappop(self.__timers)
+
+        if not self.__timers:
+            return MAX_WAIT
+
+        return min(max(self.__timers[0][0] - time.perf_counter(), 0), MAX_WAIT)
+
+    def _drain_waiter(self) -> None:
+        try:
+            while self.__waiter.recv(4096):
+                pass
+        except (BlockingIOError, OSError):
+            pass
+
+
+class AsyncScheduler:
+    """
+    Same tasks as Scheduler, driven by asyncio event loop.
+    Woken task runs from call_soon, its timer is a loop TimerHandle.
+    Coroutines can wait until a task gets into some state.
+    """
+
+    def __init__(self):
+        self.__loop: asyncio.AbstractEventLoop | None = None
+        self.__tasks: dict[Callable, Callable | None] = {}
+        self.__queued: set[Callable] = set()
+        self.__timers: dict[Callable, tuple[float, asyncio.TimerHandle]] = {}
+        self.__waiters: dict[Callable, list[tuple[Callable, asyncio.Future]]] = {}
+        self.__runs = 0
+
+    @property
+    def runs(self) -> int:
+        """Number of task runs, for monitoring"""
+        return self.__runs
+
+    def __len__(self) -> int:
+        return len(self.__tasks)
+
+    def attach(self, loop: asyncio.AbstractEventLoop) -> None:
+        """Start running tasks in loop, tasks woken before run now"""
+
+        self.__loop = loop
+
+        for task in self.__queued:
+            loop.call_soon(self._run, task)
+
+    def add(self, task: Callable, wakeup: Callable | None = None) -> None:
+        """Register task, it runs as soon as possible"""
+
+        self.__tasks[task] = wakeup
+        self.wake(task)
+
+    def wake(self, task: Callable) -> None:
+        """Run task as soon as possible, safe to call from any thread"""
+
+        if task in self.__queued or task not in self.__tasks:
+            return
+
+        self.__queued.add(task)
+
+        if self.__loop is None:
+            return
+
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+
+        if running is self.__loop:
+            self.__loop.call_soon(self._run, task)
+        else:
+            self.__loop.call_soon_threadsafe(self._run, task)
+
+    def until(self, task: Callable, predicate: Callable) -> asyncio.Future:
+        """Future which is done when predicate is true after run of task"""
+
+        future = self.__loop.create_future()
+
+        if predicate() or task not in self.__tasks:
+            future.set_result(None)
+        else:
+            self.__waiters.setdefault(task, []).append((predicate, future))
+
+        return future
+
+    def interrupt(self) -> None:
+        """Loop is never blocked by scheduler"""
+
+    def clear(self) -> None:
+        """Forget all tasks and timers"""
+
+        for _, handle in self.__timers.values():
+            handle.cancel()
+
+        self.__tasks.clear()
+        self.__queued.clear()
+        self.__timers.clear()
+
+    def close(self) -> None:
+        self.clear()
+
+        for waiters in self.__waiters.values():
+            for _, future in waiters:
+                future.cancel()
+        self.__waiters.clear()
+
+    def _run(self, task: Callable) -> None:
+        self.__queued.discard(task)
+
+        if task not in self.__tasks:
+            return
+
+        self.__runs += 1
+
+        if task() is Status.FINISHED:
+            del self.__tasks[task]
+            self._cancel_timer(task)
+            self._notify(task, finished=True)
+            return
+
+        self._notify(task)
+
+        wakeup = self.__tasks[task]
+        when = wakeup() if wakeup is not None else None
+
+        if when is None:
+            self._cancel_timer(task)
+        elif when <= time.perf_counter():
+            self.wake(task)
+        else:
+            self._call_at(task, when)
+
+    def _call_at(self, task: Callable, when: float) -> None:
+        """
+        Run task at perf_counter time.
+        Earlier timer of task is kept, task which runs too soon only asks
+        for its time again, which is cheaper than new handle on every run.
+        """
+
+        timer = self.__timers.get(task)
+        if timer is not None:
+            if timer[0] <= when:
+                return
+            timer[1].cancel()
+
+        handle = self.__loop.call_at(
+            self.__loop.time() + when - time.perf_counter(), self._expire, task
+        )
+        self.__timers[task] = (when, handle)
+
+    def _cancel_timer(self, task: Callable) -> None:
+        timer = self.__timers.pop(task, None)
+        if timer is not None:
+            timer[1].cancel()
+
+    def _expire(self, task: Callable) -> None:
+        self.__timers.pop(task, None)
+        self.wake(task)
+
+    def _notify(self, task: Callable, finished: bool = False) -> None:
+        """Resolve futures of coroutines waiting for task"""
+
+        waiters = self.__waiters.get(task)
+        if not waiters:
+            return
+
+        pending = []
+        for predicate, future in waiters:
+            if future.done():
+                continue
+            if finished or predicate():
+                future.set_result(None)
+            else:
+                pending.append((predicate, future))
+
+        if pending:
+            self.__waiters[task] = pending
+        else:
+            del self.__waiters[task]
@@ -1,25 +1,35 @@
 import time
+import heapq
 import logging
 
 from go.size import Size
 from go.time import Time
-from packet import Packet
+from go.version import Version
+from packet import Packet, HEADERS, SEQ_SPACES
 from go.flags import Flags
 from typing import Callable
+from rtt import RttEstimator
+from congestion import CongestionControl, NewReno
+from pacing import Pacer
+from compress import Deflater, compressible
+from scheduler import at_wall
 from go.status import Status
 from go.adressinfo import AddressInfo
 
 
 """ Global variables """
 LOGGER = logging.getLogger("Sender")
+DUPTHRESH = 3  # Fragments acked above a missing one, before it is resent
 
 
 class Sender:
     """
     Sender class which will send messages and files.
-    Devide data into packets if needed.
+    Devide data into packets lazily, when window moves.
     Handle sequence numbers.
     Have buffer for packets.
+    With compress, zlib is offered in init for compressible data, and when
+    receiver agrees in SACK, fragments are cut from compressed stream.
     """
 
     def __init__(
@@ -31,28 +41,66 @@ class Sender:
         extention: str = None,
         transfer_flag: int = None,
         fragment_size: int = 1468,
+        version: Version = Version.V1,
+        rtt: RttEstimator = None,
+        congestion: CongestionControl = None,
+        pacer: Pacer = None,
+        compress: bool = False,
     ):
         self.__seq_num = 0
+        self.__rtt = rtt if rtt is not None else RttEstimator()
+        self.__congestion = congestion if congestion is not None else NewReno()
+        self.__pacer = pacer
+        self.__retransmitted = 0
+        self.__fast_retransmitted = 0
+        self.__timeout_at = 0.0
+        self.__fin_at: float | None = None
+        self.__confirmed = False
+        self.__version = version
+        self.__seq_space = SEQ_SPACES[version]
+        self.__data_size = 0
         self.__type = type
         self.__name = name
         self.__client = addr
         self.__ext = extention
         self.__send_func = send_func
-        self.__fragment_size = fragment_size
+
+        """ Wider header of newer versions takes place of payload """
+        self.__fragment_size = min(fragment_size, Size.DATAGRAM - HEADERS[version].size)
         self.__own_transfer_flag = transfer_flag
 
-        self.__window_size = Size.WINDOW_SIZE
+        """ Unwrapping of sequence numbers needs window below half of space """
+        self.__max_window = min(Size.MAX_WINDOW, self.__seq_space // 2 - 1)
+        """ Standard window, until receiver advertises its own """
+        self.__rwnd = Size.WINDOW_SIZE
         self.__started = False
 
         self.__acks: set[int] = set()
-        self.__all_packets: list[Packet] = []
-        self.__sent_packets: list[Packet] = []
+        self.__cumulative = 0
+        self.__highest_acked = -1
+        self.__acked_sent_at = 0.0
+        self.__recover = -1  # Highest index sent, when fast recovery started
+
+        """ Packets in flight by absolute index, in order of first sending """
+        self.__in_flight: dict[int, Packet] = {}
+        self.__lowest_in_flight = 0
+        """ Retransmission timers (time_stamp, index, retransmits), oldest first """
+        self.__timers: list[tuple[float, int, int]] = []
+
+        """ Data is not copied, fragments are sliced from it on demand """
+        self.__data = memoryview(b"")
+        self.__data_flags = None
+        self.__release = None
+        self.__next_index = 0
+        self.__fragments_num = 0
+
+        """ Compression is offered, deflater exists once receiver agreed """
+        self.__compress = compress
+        self.__deflater: Deflater | None = None
 
         self.__alive = Status.ALIVE
         self.__last_time = time.time()
 
-        self.extended = 2
-
     @property
     def alive(self) -> Status:
         return self.__alive
@@ -77,15 +125,155 @@ class Sender:
     def client(self) -> AddressInfo:
         return self.__client
 
-    def prepare_data(self, data: bytes, flags: Flags) -> None:
-        """Prepare data for sending"""
+    @property
+    def version(self) -> Version:
+        return self.__version
+
+    @property
+    def rtt(self) -> RttEstimator:
+        return self.__rtt
+
+    @property
+    def retransmitted(self) -> int:
+        return self.__retransmitted
+
+    @property
+    def fast_retransmitted(self) -> int:
+        return self.__fast_retransmitted
+
+    @property
+    def completed(self) -> bool:
+        """Receiver answered FIN, it does so only when it saved all data"""
+        return self.__confirmed
+
+    @property
+    def compression(self) -> float | None:
+        """Compressed bytes per byte of data, None when data is sent raw"""
+        if self.__deflater is None:
+            return None
+        return self.__deflater.ratio
+
+    @property
+    def congestion(self) -> CongestionControl:
+        return self.__congestion
+
+    @property
+    def pacer(self) -> Pacer | None:
+        return self.__pacer
+
+    @property
+    def deadline(self) -> float | None:
+        """perf_counter time when paced sender can send next packet, if it waits"""
+
+        if self.__pacer is None or not self.__started or not self._window_open():
+            return None
+
+        next_send = self.__pacer.next_send()
+        return next_send if next_send is not None else time.perf_counter()
+
+    def wakeup(self) -> float | None:
+        """perf_counter time when sender needs to run, acks wake it up as well"""
+
+        now = time.perf_counter()
+
+        if self.__alive == Status.DEAD:
+            return now
+
+        if not self.__started:
+            return at_wall(self.__last_time + Time.RESEND)
+
+        if not self._has_unsent() and not self.__in_flight:
+            """FIN is due, it is repeated after RTO, if peer did not answer"""
+            if self.__fin_at is None:
+                return now
+            return self.__fin_at + self.__rtt.rto
 
-        packets = Packet.devide(
-            data, self.__seq_num, fragment_size=self.fragment_size, flags=flags
+        wake_at = at_wall(self.__last_time + Time.KEEPALIVE)
+
+        if self.__timers:
+            wake_at = min(wake_at, self.__timers[0][0] + self.__rtt.rto)
+
+        if self._window_open():
+            deadline = self.deadline
+            wake_at = min(wake_at, now if deadline is None else deadline)
+
+        return wake_at
+
+    @property
+    def rwnd(self) -> int:
+        return self.__rwnd
+
+    @property
+    def window_size(self) -> int:
+        return min(self.__congestion.cwnd, self.__rwnd, self.__max_window)
+
+    def prepare_data(self, data: bytes, flags: Flags, release: Callable = None) -> None:
+        """
+        Prepare data for sending, data can be bytes or memory-mapped file.
+        Release is called, when transfer does not need data anymore.
+        """
+
+        self.__data = memoryview(data).cast("B")
+        self.__data_flags = flags
+        self.__release = release
+        self.__data_size = len(self.__data)
+        self.__next_index = 0
+        self.__fragments_num = (
+            self.__data_size + self.fragment_size - 1
+        ) // self.fragment_size
+
+        """ Already compressed data would only cost CPU """
+        if self.__compress:
+            self.__compress = compressible(self.__data)
+
+        LOGGER.info(f"Number of fragments: {self.__fragments_num}")
+
+    def _has_unsent(self) -> bool:
+        """Check if there are fragments which were never sent"""
+        if self.__deflater is not None:
+            return self.__deflater.has_more()
+        return self.__next_index < self.__fragments_num
+
+    def _window_open(self) -> bool:
+        """Check if next fragment can be sent without waiting for acks"""
+
+        if not self._has_unsent() or len(self.__in_flight) >= self.window_size:
+            return False
+
+        """ V1 sequence numbers wrap, whole previous round must be acked """
+        return self.__next_index % self.__seq_space != 0 or not self.__in_flight
+
+    def _next_packet(self) -> Packet:
+        """Slice next fragment from data, without copying it"""
+        if self.__deflater is not None:
+            data = self.__deflater.next_fragment()
+        else:
+            start = self.__next_index * self.fragment_size
+            data = self.__data[start : min(start + self.fragment_size, self.__data_size)]
+
+        packet = Packet(
+            data,
+            self.__data_flags,
+            self.__next_index % self.__seq_space,
         )
+        self.__next_index += 1
+
+        return packet
 
-        self.__all_packets.extend(packets)
-        LOGGER.info(f"len(self.__all_packets): {len(self.__all_packets)}")
+    def _release_data(self) -> None:
+        """Drop data, when transfer is finished"""
+        self.__in_flight.clear()
+        self.__timers.clear()
+        self.__deflater = None
+        self.__data.release()
+        self.__fragments_num = self.__next_index
+
+        if self.__release is not None:
+            release, self.__release = self.__release, None
+            try:
+                release()
+            except BufferError as e:
+                LOGGER.debug(f"Data is still in use, left for gc: {e}")
 
     def receive(self, packet: Packet) -> None:
         """Receive ack"""
@@ -95,17 +283,195 @@ class Sender:
             self.__acks.add(packet.seq_num)
             return
 
+        if packet.flags == Flags.WM | self.own_transfer_flag:
+            self._receive_range_ack(packet)
+            return
+
         if packet.flags == Flags.FIN:
             LOGGER.info(f"File transfer is finished from {self.__client}")
+            self.__confirmed = True
             self.__alive = Status.DEAD
             return
 
         if packet.flags == Flags.SACK:
             LOGGER.info(f"Starting sending data to {self.__client}")
+            self._apply_options(packet)
             self.__last_time = time.time()
             self.__started = True
             return
 
+    def _apply_options(self, packet: Packet) -> None:
+        """Apply options agreed in SACK, old peers (V1) send none"""
+
+        _, options = Packet.decode_fields(packet.data)
+
+        try:
+            if "wm" in options:
+                self.__rwnd = max(int(options["wm"]), 1)
+        except ValueError:
+            LOGGER.warning(f"Invalid window from {self.__client}: {options['wm']}")
+
+        """ Receivers which do not know zlib do not echo it, data goes raw """
+        if self.__compress and "zlib" in options and self.__deflater is None:
+            if self.__next_index == 0:
+                self.__deflater = Deflater(self.__data, self.fragment_size)
+
+    def _receive_range_ack(self, packet: Packet) -> None:
+        """
+        Receive RangeACK of a whole window.
+        It is agreed only in V2, so seq_num of packets is their absolute index.
+        """
+
+        range_ack = Packet.decode_range_ack(packet.data)
+        if range_ack is None:
+            return
+
+        cumulative, window, ranges = range_ack
+
+        self.__last_time = time.time()
+
+        """ Reordered older ack carries stale window, it is not taken """
+        if cumulative >= self.__cumulative:
+            self.__cumulative = cumulative
+            self.__rwnd = max(window, 1)
+
+        for start, length in ranges:
+            self.__acks.update(range(start, start + length))
+
+    def _sample_rtt(self, acked_packets: list[Packet]) -> float | None:
+        """Take RTT sample from newest acked packet, which was sent only once"""
+
+        samples = [packet for packet in acked_packets if packet.retransmits == 0]
+        if not samples:
+            return None
+
+        newest = max(samples, key=lambda packet: packet.time_stamp)
+        rtt = time.perf_counter() - newest.time_stamp
+        self.__rtt.sample(rtt)
+
+        return rtt
+
+    def _index_of(self, seq_num: int) -> int:
+        """Unwrap sequence number of packet in flight to absolute fragment index"""
+
+        return self.__next_index - (self.__next_index - seq_num) % self.__seq_space
+
+    def _collect_acked(self) -> list[Packet]:
+        """Remove acked packets from flight, cost is number of acks"""
+
+        acked_packets = []
+
+        """ Everything below cumulative ack """
+        cumulative = min(self.__cumulative, self.__next_index)
+        while self.__lowest_in_flight < cumulative:
+            packet = self.__in_flight.pop(self.__lowest_in_flight, None)
+            if packet is not None:
+                acked_packets.append(packet)
+            self.__lowest_in_flight += 1
+
+        if cumulative - 1 > self.__highest_acked:
+            self.__highest_acked = cumulative - 1
+
+        """ Selectively acked above it """
+        for seq_num in self.__acks:
+            index = self._index_of(seq_num)
+            packet = self.__in_flight.pop(index, None)
+            if packet is not None:
+                acked_packets.append(packet)
+                if index > self.__highest_acked:
+                    self.__highest_acked = index
+
+        for packet in acked_packets:
+            if packet.time_stamp > self.__acked_sent_at:
+                self.__acked_sent_at = packet.time_stamp
+
+        return acked_packets
+
+    def _detect_lost(self, acked_packets: list[Packet]) -> list[Packet]:
+        """
+        Packet is lost, when DUPTHRESH later fragments were acked,
+        and one of them was sent after it (not only before its retransmission).
+        Only holes below the highest acked fragment are visited,
+        and only when new acks arrived.
+        """
+
+        if not acked_packets:
+            return []
+
+        lost_packets = []
+
+        for index, packet in self.__in_flight.items():
+            if index + DUPTHRESH > self.__highest_acked:
+                break
+            if packet.time_stamp < self.__acked_sent_at:
+                lost_packets.append(packet)
+
+        return lost_packets
+
+    def _partial_ack(
+        self, acked_packets: list[Packet], lost_packets: list[Packet]
+    ) -> list[Packet]:
+        """
+        Fast recovery ends, when every fragment sent before loss is acked.
+        Ack which leaves some of them unacked is partial, first unacked
+        fragment is lost as well, it is resent without waiting for DUPTHRESH.
+        """
+
+        if not acked_packets or not self.__congestion.recovering:
+            return []
+
+        index = next(iter(self.__in_flight), None)
+        if index is None or index > self.__recover:
+            self.__congestion.on_recovered()
+            return []
+
+        """ Resent already, and nothing sent after it was acked yet """
+        packet = self.__in_flight[index]
+        if packet.time_stamp >= self.__acked_sent_at:
+            return []
+
+        if lost_packets and lost_packets[0] is packet:
+            return []
+
+        return [packet]
+
+    def _collect_expired(self, now: float, rto: float) -> list[Packet]:
+        """
+        Pop expired retransmission timers.
+        Stale timers (packet was acked or resent since) are dropped from the top
+        as soon as they get there, so heap stays about as big as the window.
+        """
+
+        expired_packets = []
+
+        while self.__timers:
+            time_stamp, index, retransmits = self.__timers[0]
+
+            packet = self.__in_flight.get(index)
+            if packet is not None and packet.retransmits == retransmits:
+                if now - time_stamp <= rto:
+                    break
+                expired_packets.append(packet)
+
+            heapq.heappop(self.__timers)
+
+        return expired_packets
+
+    def _start_timer(self, index: int, packet: Packet) -> None:
+        """Retransmission timer of packet, which was just (re)sent"""
+
+        heapq.heappush(self.__timers, (packet.time_stamp, index, packet.retransmits))
+
+    def _resend(self, packets: list[Packet]) -> None:
+        """Resend packets, which were not acked"""
+
+        for packet in packets:
+            packet.stamp(retransmit=True)
+            self._start_timer(self._index_of(packet.seq_num), packet)
+            self.__send_func(
+                Packet.packet_to_bytes(packet, self.__version), self.__client
+            )
+
     def time_is_valid(self) -> bool:
         """Check if connection is still alive"""
         if time.time() - self.__last_time > Time.KEEPALIVE:
@@ -123,26 +489,48 @@ class Sender:
         """Kill connection"""
         self.__alive = Status.DEAD
 
+    def _init_options(self) -> dict:
+        """Options of FILE/MSG init, old peers (V1) do not know them"""
+        if self.__version < Version.V2:
+            return {}
+
+        options = {
+            "size": self.__data_size,
+            "frag": self.fragment_size,
+            "ack": "range",
+            "wm": 1,
+        }
+
+        if self.__compress:
+            options["zlib"] = 1
+
+        return options
+
+    def _send_init(self) -> None:
+        """Send FILE/MSG init packet"""
+        if self.__type == "file":
+            fields = [f"{self.name}{self.ext}", self.own_transfer_flag]
+            flags = Flags.FILE
+        else:
+            fields = [self.own_transfer_flag]
+            flags = Flags.MSG
+
+        self.__send_func(
+            Packet.construct(
+                Packet.encode_fields(fields, self._init_options()),
+                flags,
+                0,
+                self.__version,
+            ),
+            self.__client,
+        )
+
     def _start(self) -> bool:
         """Only for waiting SACK to start sending data"""
         if not self.__started and self.time_to_resend():
             LOGGER.info(f"Resending FILE/MSG to {self.__client}")
-            if self.__type == "file":
-                self.__send_func(
-                    Packet.construct(
-                        f"{self.name}{self.ext}:{self.own_transfer_flag}".encode(),
-                        Flags.FILE,
-                        0,
-                    ),
-                    self.__client,
-                )
-            else:
-                self.__send_func(
-                    Packet.construct(
-                        f"{self.own_transfer_flag}".encode(), Flags.MSG, 0
-                    ),
-                    self.__client,
-                )
+            self._send_init()
+            self.__last_time = time.time()
             return False
         if self.__started:
             return True
@@ -153,53 +541,71 @@ class Sender:
         """Send rest of data"""
 
         packets_to_send: list[Packet] = []
+        first_index = self.__next_index
+        room = self.window_size - num_to_skip
+
+        """ Paced sender spreads window over RTT, instead of sending it at once """
+        if self.__pacer is not None:
+            self.__pacer.update(
+                self.window_size,
+                self.__rtt.srtt,
+                self.__congestion.cwnd < self.__congestion.ssthresh,
+            )
+            room = min(room, self.__pacer.available())
 
-        while (
-            self.__all_packets
-            and len(packets_to_send) < self.__window_size - num_to_skip
-        ):
-            if self.__all_packets[0].seq_num == 0 and self.__sent_packets != []:
+        while self._has_unsent() and len(packets_to_send) < room:
+            if self.__next_index % self.__seq_space == 0 and self.__in_flight:
                 break
-            packet = self.__all_packets.pop(0)
-            # packet.__time_to_live = time.time()  # HACK: only for testing
+            index = self.__next_index
+            packet = self._next_packet()
+            self.__in_flight[index] = packet
             packets_to_send.append(packet)
-            self.__sent_packets.append(packet)
 
-        for packet in packets_to_send:
-            # if packet.seq_num == 255:
-            #     packet = Packet.packet_to_bytes_broken_crc(
-            #         packet
-            #     )  # HACK: ONLY FOR TESTING
-            #     self.__send_func(packet, self.__client)
-            #     continue
+        for index, packet in enumerate(packets_to_send, first_index):
+            packet.stamp()
+            self._start_timer(index, packet)
 
-            packet = Packet.packet_to_bytes(packet)
+        if self.__pacer is not None:
+            self.__pacer.consume(len(packets_to_send))
+
+        """ Checksums of the whole window are computed in one batch """
+        for packet in Packet.construct_window(packets_to_send, self.__version):
             self.__send_func(packet, self.__client)
 
         """ Update sequence number """
-        self.__seq_num = (self.__seq_num + len(packets_to_send)) % (
-            2**8
-        )  # HACK: 8 bits
-
-        if self.__all_packets == [] and self.__sent_packets == []:
-            """Send FIN"""
+        self.__seq_num = (self.__seq_num + len(packets_to_send)) % self.__seq_space
+
+        if not self._has_unsent() and not self.__in_flight and self._fin_due():
+            """
+            FIN is repeated after RTO, until receiver answers it,
+            it can wait for room in its storage, without answer transfer
+            dies after KEEPALIVE
+            """
             LOGGER.info(f"sending fin, seq: {self.__seq_num}")
             self.__send_func(
                 Packet.construct(
                     data=f"{self.own_transfer_flag}".encode(),
                     flags=Flags.FIN,
                     seq_num=self.__seq_num,
+                    version=self.__version,
                 ),
                 self.__client,
             )
-            self.extended -= 1
-            self.__seq_num += 1
-            if self.extended == 0:
-                self.__alive = Status.DEAD
+            self.__fin_at = time.perf_counter()
+            self.__seq_num = (self.__seq_num + 1) % self.__seq_space
+
+    def _fin_due(self) -> bool:
+        """First FIN is sent at once, next one after RTO"""
+
+        if self.__fin_at is None:
+            return True
+
+        return time.perf_counter() - self.__fin_at >= self.__rtt.rto
 
     def _iterator(self):
         """Handle packets"""
         if self.__alive == Status.DEAD:
+            self._release_data()
             return Status.FINISHED
 
         """ Check if we can start """
@@ -210,29 +616,50 @@ class Sender:
         if not self.time_is_valid():
             LOGGER.info(f"Transfer is not alive anymore")
             self.__alive = Status.DEAD
+            self._release_data()
             return Status.FINISHED
 
-        LOGGER.info(f"Got acks: {self.__acks}")
+        LOGGER.debug("Got acks: %s", self.__acks)
+
+        """ Check for acknowledgments and remove acked packets from flight """
+        acked_packets = self._collect_acked()
 
-        """ Check for acknowledgments and remove acked packets from sent_packets"""
-        self.__sent_packets = [
-            packet
-            for packet in self.__sent_packets
-            if packet.seq_num not in self.__acks
-        ]
+        rtt = self._sample_rtt(acked_packets)
+        self.__congestion.on_ack(len(acked_packets), rtt)
 
-        """ Find packets which ttl is expired """
-        expired_packets = [
-            packet for packet in self.__sent_packets if packet.time_is_valid() == False
-        ]
+        """ Resend packets which later ones overtook, without waiting for timeout """
+        lost_packets = self._detect_lost(acked_packets)
+        lost_packets = self._partial_ack(acked_packets, lost_packets) + lost_packets
+
+        if lost_packets:
+            sent_at = max(packet.time_stamp for packet in lost_packets)
+            if self.__congestion.on_loss(sent_at):
+                self.__recover = self.__next_index - 1
+            self.__fast_retransmitted += len(lost_packets)
+            self.__retransmitted += len(lost_packets)
+            self._resend(lost_packets)
+
+        """ Find packets which retransmission timeout is expired """
+        now = time.perf_counter()
+        rto = self.__rtt.rto
+        expired_packets = self._collect_expired(now, rto)
+
+        if expired_packets:
+            sent_at = max(packet.time_stamp for packet in expired_packets)
+
+            """ Packets sent before last timeout expire in the same event """
+            if sent_at > self.__timeout_at:
+                self.__rtt.backoff()
+                self.__timeout_at = now
+
+            self.__congestion.on_timeout(sent_at)
+            self.__retransmitted += len(expired_packets)
 
         """ Resend packets if needed """
-        for packet in expired_packets:
-            packet = Packet.packet_to_bytes(packet)
-            self.__send_func(packet, self.__client)
+        self._resend(expired_packets)
 
         """ Send rest of data """
-        count = len(self.__sent_packets) + len(expired_packets)
+        count = len(self.__in_flight)
         self._send_restof_data(count)
 
         self.__acks.clear()
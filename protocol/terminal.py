@@ -1,8 +1,16 @@
 import os
+import sys
+import mmap
+import asyncio
 import logging
 import threading
 
 from host import Host
+from go.size import Size
+from packet import HEADERS
+from typing import Callable
+from cache import CONTENT_CACHE
+from congestion import CONTROLLERS
 
 
 def is_file(path: str) -> bool:
@@ -19,21 +27,21 @@ def get_name_and_extension(path: str) -> tuple[str, str]:
     return name, ext
 
 
-def file_to_bytes(path: str) -> bytes | None:
-    """Read file and return bytes"""
+def file_to_buffer(path: str) -> tuple[mmap.mmap, Callable] | None:
+    """
+    Get memory-mapped file from the shared content cache,
+    with function which releases it when transfer is finished.
+    """
 
     if not is_file(path):
         print(f"File {path} does not exist")
         return None
 
-    with open(path, "rb") as file:
-        data = file.read()
-
-    if data == b"":
+    if os.path.getsize(path) == 0:
         print(f"File {path} is empty")
         return None
 
-    return data
+    return CONTENT_CACHE.acquire(path)
 
 
 class Terminal:
@@ -56,6 +64,44 @@ class Terminal:
                 return
             self.handle_command(command)
 
+    async def serve(self):
+        """Read commands in running event loop, instead of own thread"""
+
+        loop = asyncio.get_running_loop()
+        fd = sys.stdin.fileno()
+        lines: asyncio.Queue = asyncio.Queue()
+        pending = bytearray()
+
+        def readable():
+            data = os.read(fd, 4096)
+            if not data:  # EOF
+                loop.remove_reader(fd)
+                lines.put_nowait(None)
+                return
+
+            pending.extend(data)
+            while b"\n" in pending:
+                line, _, rest = bytes(pending).partition(b"\n")
+                pending[:] = rest
+                lines.put_nowait(line.decode(errors="replace"))
+
+        loop.add_reader(fd, readable)
+
+        self.running = True
+        try:
+            while self.running:
+                print("Try 'help' >>> ", end="", flush=True)
+
+                command = await lines.get()
+                if command is None:
+                    print()
+                    self.stop()
+                    return
+
+                self.handle_command(command)
+        finally:
+            loop.remove_reader(fd)
+
     def stop(self):
         self.running = False
 
@@ -108,6 +154,94 @@ class Terminal:
         elif command == "list":
             self.__host.list_connections()
 
+        elif command == "stats":
+            """ Kernel drops are socket buffer loss, the rest is lost on the way """
+            for key, value in self.__host.stats().items():
+                print("  {}: {}".format(key, value))
+
+        elif command.startswith("stats"):
+            try:
+                ip, port = command.split(" ")[1].split(":")
+                port = int(port)
+            except (IndexError, ValueError):
+                print("Missing or incorrect arguments")
+                return
+
+            stats = self.__host.connection_stats(ip, port)
+
+            if stats is None:
+                print("Connection to {}:{} does not exist".format(ip, port))
+                return
+
+            for key, value in stats.items():
+                print("  {}: {}".format(key, value))
+
+        elif command.startswith("congestion"):
+            try:
+                ip, port = command.split(" ")[1].split(":")
+                port = int(port)
+            except (IndexError, ValueError):
+                print("Missing or incorrect arguments")
+                return
+
+            try:
+                algorithm = command.split(" ")[2]
+            except IndexError:
+                stats = self.__host.connection_stats(ip, port)
+                if stats is None:
+                    print("Connection to {}:{} does not exist".format(ip, port))
+                    return
+                print("Congestion control: {}".format(stats["algorithm"]))
+                return
+
+            if not self.__host.set_congestion(ip, port, algorithm):
+                print(
+                    "Failed to set {}, available: {}".format(
+                        algorithm, ", ".join(CONTROLLERS)
+                    )
+                )
+                return
+
+            print("Congestion control set to {}".format(algorithm))
+
+        elif command.startswith("pacing"):
+            try:
+                ip, port = command.split(" ")[1].split(":")
+                port = int(port)
+                mode = command.split(" ")[2]
+            except (IndexError, ValueError):
+                print("Missing or incorrect arguments")
+                return
+
+            if mode not in ("on", "off"):
+                print("Pacing can be on or off")
+                return
+
+            if not self.__host.set_pacing(ip, port, mode == "on"):
+                print("Connection to {}:{} does not exist".format(ip, port))
+                return
+
+            print("Pacing {} for {}:{}".format(mode, ip, port))
+
+        elif command.startswith("compression"):
+            try:
+                ip, port = command.split(" ")[1].split(":")
+                port = int(port)
+                mode = command.split(" ")[2]
+            except (IndexError, ValueError):
+                print("Missing or incorrect arguments")
+                return
+
+            if mode not in ("on", "off"):
+                print("Compression can be on or off")
+                return
+
+            if not self.__host.set_compression(ip, port, mode == "on"):
+                print("Connection to {}:{} does not exist".format(ip, port))
+                return
+
+            print("Compression {} for {}:{}".format(mode, ip, port))
+
         elif command.startswith("send_f"):
             try:
                 ip, port = command.split(" ")[1].split(":")
@@ -116,19 +250,21 @@ class Terminal:
                 print("Missing arguments")
                 return
 
-            data = file_to_bytes(file)
+            if not self.__host.validate_addr(ip, int(port)):
+                print("Invalid address: {}:{}".format(ip, port))
+                return
 
-            if data is None:
+            shared = file_to_buffer(file)
+
+            if shared is None:
                 return
 
-            if self.__host.validate_addr(ip, int(port)):
-                print("Sending file to {}:{}".format(ip, port))
+            print("Sending file to {}:{}".format(ip, port))
 
-                name, ext = get_name_and_extension(file)
+            data, release = shared
+            name, ext = get_name_and_extension(file)
 
-                self.__host.send_file(ip, int(port), data, name, ext)
-            else:
-                print("Invalid address: {}:{}".format(ip, port))
+            self.__host.send_file(ip, int(port), data, name, ext, release=release)
 
         elif command.startswith("send_m"):
             try:
@@ -173,13 +309,32 @@ class Terminal:
                 print("Invalid fragment size")
                 return
 
-            if size < 1 and size > 1468:
-                print("Invalid fragment size: Allowed range is 1-1468")
+            """ Connections lower it further to what their path MTU carries """
+            max_size = Size.DATAGRAM - min(h.size for h in HEADERS.values())
+            if size < 1 or size > max_size:
+                print("Invalid fragment size: Allowed range is 1-{}".format(max_size))
                 return
 
             self.__host.fragment_size = size
             print("Fragment size set to {}".format(size))
 
+        elif command.startswith("cache_budget"):
+            try:
+                budget = int(command.split(" ")[1])
+            except IndexError:
+                print(
+                    "Cache budget is {} MB, used {} MB".format(
+                        CONTENT_CACHE.budget // 1024**2, CONTENT_CACHE.size // 1024**2
+                    )
+                )
+                return
+            except ValueError:
+                print("Invalid cache budget")
+                return
+
+            CONTENT_CACHE.budget = budget * 1024**2
+            print("Cache budget set to {} MB".format(budget))
+
         else:
             print("Unknown command: {}".format(command))
 
@@ -207,6 +362,13 @@ class Terminal:
         print("  disconnect <ip>:<port>: Disconnect from a host")
         print("  disconnect_all: Disconnect from all hosts")
         print("  list: List connected hosts")
+        print("  stats: Display state of host (connections, kernel drops, ...)")
+        print("  stats <ip>:<port>: Display state of connection (RTT, window, ...)")
+        print(
+            "  congestion <ip>:<port> [algorithm]: Show or set congestion control"
+        )
+        print("  pacing <ip>:<port> on|off: Spread sent packets evenly over RTT")
+        print("  compression <ip>:<port> on|off: Compress transfers with zlib")
         print("  list_available: List available hosts")  # IDK if i want this
         print(
             "  detection_time <time>: Set the detection time of available hosts"
@@ -214,6 +376,7 @@ class Terminal:
         print("  send_m <ip>:<port> <message>: Send a message to a host")
         print("  send_f <ip>:<port> <file>: Send a file to a host")
         print("  change_fragment_size <size>: Change the fragment size")
+        print("  cache_budget [megabytes]: Show or set memory budget of file cache")
         print("  log_level <level>: Set the log level")
         print("  help: Display this help message")
         print("  exit: Exit the terminal")
@@ -0,0 +1,14 @@
+"""
+Unit tests of pure logic, which runs without sockets.
+
+Run from the repository or protocol directory:
+
+    python -m pytest protocol/tests
+"""
+
+import os
+import sys
+
+
+""" Modules of the protocol import each other by flat names """
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,63 @@
+import time
+
+from congestion import CongestionControl, NewReno
+
+
+def test_slow_start_and_congestion_avoidance():
+    reno = NewReno(initial_window=4)
+
+    reno.on_ack(4)
+    assert reno.cwnd == 8
+
+    reno.on_loss(time.perf_counter())
+    reno.on_recovered()
+    assert reno.cwnd == reno.ssthresh == 4
+
+    reno.on_ack(4)
+    assert reno.cwnd == 5
+
+
+def test_loss_halves_window_once_per_event():
+    reno = NewReno(initial_window=32)
+    sent_at = time.perf_counter()
+
+    assert reno.on_loss(sent_at)
+    assert reno.cwnd == 16
+    assert reno.recovering
+
+    """ Packet sent before reduction was lost in the same event """
+    assert not reno.on_loss(sent_at)
+    assert reno.cwnd == 16
+
+
+def test_window_is_held_until_recovery_ends():
+    reno = NewReno(initial_window=32)
+    reno.on_loss(time.perf_counter())
+
+    reno.on_ack(10)
+    assert reno.cwnd == 16
+
+    reno.on_recovered()
+    assert not reno.recovering
+
+    reno.on_ack(16)
+    assert reno.cwnd == 17
+
+
+def test_timeout_ends_recovery_and_restarts_slow_start():
+    reno = NewReno(initial_window=32)
+    reno.on_loss(time.perf_counter())
+
+    reno.on_timeout(time.perf_counter())
+
+    assert not reno.recovering
+    assert reno.cwnd == 1
+    assert reno.ssthresh == 8
+
+
+def test_fixed_window_does_not_recover():
+    fixed = CongestionControl(initial_window=16)
+
+    assert not fixed.on_loss(time.perf_counter())
+    assert not fixed.recovering
+    assert fixed.cwnd == 16
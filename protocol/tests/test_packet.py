@@ -0,0 +1,56 @@
+from packet import Packet, RANGE_ACK, RANGE
+from go.flags import Flags
+from go.version import Version
+
+
+def test_range_ack_round_trip():
+    ranges = [(105, 3), (120, 1), (60000, 2)]
+
+    data = Packet.encode_range_ack(100, 512, ranges)
+
+    assert len(data) == RANGE_ACK.size + 3 * RANGE.size
+    assert Packet.decode_range_ack(data) == (100, 512, ranges)
+
+
+def test_range_ack_drops_ranges_it_can_not_encode():
+    """Offsets and lengths are 2 bytes, only 255 ranges fit"""
+
+    ranges = [(2**16 + 10, 1), (20, 2**16)]
+    ranges += [(10 + i * 2, 1) for i in range(1, 300)]
+
+    cumulative, window, decoded = Packet.decode_range_ack(
+        Packet.encode_range_ack(10, 1, ranges)
+    )
+
+    assert (cumulative, window) == (10, 1)
+    assert len(decoded) == 2**8 - 1
+    assert decoded[0] == (12, 1)
+
+
+def test_truncated_range_ack_is_rejected():
+    data = Packet.encode_range_ack(0, 1, [(5, 1), (9, 2)])
+
+    assert Packet.decode_range_ack(data[:-1]) is None
+    assert Packet.decode_range_ack(b"") is None
+
+
+def test_packet_over_receive_buffer_is_hashable():
+    """Received data is a view into writable batch buffer"""
+
+    slot = bytearray(b"payload")
+    received = Packet(memoryview(slot), Flags.SR, 7)
+    sent = Packet(b"payload", Flags.SR, 7)
+
+    assert hash(received) == hash(sent)
+    assert received == sent
+    assert len({received, sent}) == 1
+
+
+def test_construct_and_decode_v2():
+    data = Packet.construct(b"fragment", Flags.SR, 2**20, Version.V2)
+
+    packet = Packet.decode(data, Version.V2)
+
+    assert packet.flags == Flags.SR
+    assert packet.seq_num == 2**20
+    assert bytes(packet.data) == b"fragment"
@@ -0,0 +1,73 @@
+from pmtu import PathMtu, BASE, IP_UDP_HEADERS, SEARCH_STEP
+
+
+def search(pmtu: PathMtu, limit: int) -> None:
+    """Answer probes, which fit into path of limit, until search is over"""
+
+    for _ in range(1000):
+        size = pmtu.next_probe(0.0)
+        if size is None:
+            return
+        if size <= limit:
+            pmtu.acked(size)
+
+
+def test_search_waits_for_start():
+    pmtu = PathMtu(1472)
+
+    assert pmtu.next_probe(0.0) is None
+    assert not pmtu.searching
+
+    pmtu.start()
+
+    assert pmtu.next_probe(0.0) == BASE
+
+
+def test_configured_size_is_confirmed():
+    pmtu = PathMtu(1472)
+    pmtu.start()
+
+    search(pmtu, 1472)
+
+    assert pmtu.datagram == 1472
+    assert pmtu.confirmed == 1472
+    assert not pmtu.searching
+
+
+def test_largest_size_is_searched_on_black_hole_path():
+    pmtu = PathMtu(1472)
+    pmtu.start()
+
+    search(pmtu, 1200)
+
+    assert 1200 - SEARCH_STEP < pmtu.datagram <= 1200
+    assert pmtu.confirmed == pmtu.datagram
+
+
+def test_peer_without_probes_keeps_configured_size():
+    pmtu = PathMtu(1400)
+    pmtu.start()
+
+    search(pmtu, 0)
+
+    assert not pmtu.enabled
+    assert pmtu.datagram == 1400
+    assert pmtu.next_probe(0.0) is None
+
+
+def test_too_big_lowers_size_at_once():
+    pmtu = PathMtu(1472)
+
+    pmtu.too_big(1300)
+
+    assert pmtu.datagram == 1300 - IP_UDP_HEADERS
+
+    pmtu.too_big(100)
+
+    assert pmtu.datagram == BASE
+
+
+def test_size_is_capped_by_ceiling():
+    pmtu = PathMtu(9000, ceiling=1472)
+
+    assert pmtu.datagram == 1472
@@ -0,0 +1,124 @@
+import os
+import zlib
+
+from reassembly import Reassembly, FileReassembly, InflateReassembly
+
+
+def test_fragments_out_of_order_land_at_offsets():
+    reassembly = Reassembly(fragment_size=4, total_size=10, seq_space=2**32)
+
+    assert reassembly.add(2, b"ij")
+    assert reassembly.add(0, b"abcd")
+    assert not reassembly.is_complete()
+    assert reassembly.add(1, b"efgh")
+
+    assert reassembly.is_complete()
+    assert bytes(reassembly.getvalue()) == b"abcdefghij"
+
+
+def test_offsets_are_known_from_first_fragment():
+    """Old peers announce no fragment size, fragments above wait for it"""
+
+    reassembly = Reassembly()
+
+    assert reassembly.add(1, b"cd")
+    assert reassembly.add(0, b"ab")
+
+    assert reassembly.is_complete()
+    assert bytes(reassembly.getvalue()) == b"abcd"
+
+
+def test_duplicate_is_not_taken():
+    reassembly = Reassembly(fragment_size=2, seq_space=2**32)
+
+    assert reassembly.add(0, b"ab")
+    assert reassembly.add(0, b"ab") is False
+    assert reassembly.add(2, b"ef")
+    assert reassembly.add(2, b"ef") is False
+
+
+def test_wrapped_sequence_numbers_are_unwrapped():
+    reassembly = Reassembly(fragment_size=1, seq_space=2**8)
+
+    for index in range(300):
+        assert reassembly.add(index % 2**8, bytes([index % 2**8]))
+
+    assert reassembly.next_index == 300
+    assert reassembly.index_of(300 % 2**8) == 300
+    assert reassembly.index_of(299 % 2**8) == 299
+    assert reassembly.add(299 % 2**8, b"x") is False
+
+
+def test_ranges_above_first_missing_fragment():
+    reassembly = Reassembly(fragment_size=1, seq_space=2**32)
+
+    for index in (0, 1, 3, 4, 5, 8, 10, 11):
+        reassembly.add(index, b"x")
+
+    assert reassembly.next_index == 2
+    assert reassembly.ranges() == [(3, 3), (8, 1), (10, 2)]
+    assert reassembly.ranges(limit=2) == [(3, 3), (8, 1)]
+    assert len(reassembly) == 8
+
+
+def test_gap_is_not_complete():
+    reassembly = Reassembly(fragment_size=2, total_size=6, seq_space=2**32)
+
+    reassembly.add(0, b"ab")
+    reassembly.add(2, b"ef")
+
+    assert not reassembly.is_complete()
+
+
+def test_discard_drops_late_fragments():
+    reassembly = Reassembly(fragment_size=2, seq_space=2**32)
+
+    reassembly.add(0, b"ab")
+    reassembly.add(2, b"ef")
+    reassembly.discard()
+
+    assert reassembly.closed
+    assert reassembly.ranges() == []
+    assert reassembly.add(1, b"cd") is False
+
+
+def test_file_reassembly_writes_at_offsets(tmp_path):
+    path = str(tmp_path / "data.bin")
+    reassembly = FileReassembly(path, fragment_size=3, total_size=7, seq_space=2**32)
+
+    reassembly.add(2, b"g")
+    reassembly.add(0, b"abc")
+    reassembly.add(1, b"def")
+
+    assert reassembly.is_complete()
+    assert reassembly.finish() == path
+    assert open(path, "rb").read() == b"abcdefg"
+    assert reassembly.add(3, b"h") is False
+
+
+def test_file_reassembly_late_fragment_after_discard(tmp_path):
+    path = str(tmp_path / "data.bin")
+    reassembly = FileReassembly(path, fragment_size=3, seq_space=2**32)
+
+    reassembly.add(0, b"abc")
+    reassembly.discard()
+
+    assert reassembly.add(1, b"def") is False
+    assert os.listdir(tmp_path) == []
+
+
+def test_inflate_reassembly_inflates_in_order():
+    data = b"compressed stream " * 1000
+    stream = zlib.compress(data)
+    fragments = [stream[i : i + 100] for i in range(0, len(stream), 100)]
+
+    storage = Reassembly(fragment_size=100, total_size=len(data), seq_space=2**32)
+    reassembly = InflateReassembly(
+        storage, fragment_size=100, total_size=len(data), seq_space=2**32
+    )
+
+    for index in reversed(range(len(fragments))):
+        assert reassembly.add(index, fragments[index])
+
+    assert reassembly.is_complete()
+    assert bytes(reassembly.getvalue()) == data
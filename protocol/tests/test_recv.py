@@ -0,0 +1,125 @@
+from recv import Receiver, MAX_MESSAGE
+from packet import Packet
+from go.size import Size
+from go.flags import Flags
+from go.status import Status
+from go.version import Version
+from go.adressinfo import AddressInfo
+
+
+""" Global variables """
+CLIENT = AddressInfo("127.0.0.1", 50000)
+TRANSFER_FLAG = Flags.SR
+
+
+def receiver(sent: list, receivers: set | None = None, **kwargs) -> Receiver:
+    return Receiver(
+        lambda data, addr: sent.append(Packet.decode(data, Version.V2)),
+        CLIENT,
+        transfer_flag=TRANSFER_FLAG,
+        version=Version.V2,
+        receivers=receivers,
+        **kwargs,
+    )
+
+
+def init_msg(options: dict) -> Packet:
+    data = Packet.encode_fields([TRANSFER_FLAG], options)
+    return Packet.decode(Packet.construct(data, Flags.MSG, 0, Version.V2), Version.V2)
+
+
+def fragment(index: int, data: bytes) -> Packet:
+    data = Packet.construct(data, TRANSFER_FLAG, index, Version.V2)
+    return Packet.decode(data, Version.V2)
+
+
+def fin() -> Packet:
+    data = Packet.construct(f"{TRANSFER_FLAG}".encode(), Flags.FIN, 0, Version.V2)
+    return Packet.decode(data, Version.V2)
+
+
+def test_window_is_split_among_live_receivers():
+    receivers = set()
+    first = receiver([], receivers)
+    alone = first.window()
+
+    second = receiver([], receivers)
+
+    assert first.window() == second.window() < alone
+
+    second.kill()
+    second._iterator()
+
+    assert first.window() == alone
+    assert second.window() == alone
+
+
+def test_window_fits_into_socket_buffer():
+    window = receiver([], buffer_size=Size.RECV_BUFFER).window()
+
+    datagram = 1468 + 7 + Size.DATAGRAM_OVERHEAD
+    assert window == Size.RECV_BUFFER * 3 // 4 // datagram
+
+
+def test_message_is_answered_only_when_complete():
+    sent = []
+    messages = []
+    transfer = receiver(sent, on_received=lambda *args: messages.append(args))
+
+    transfer.receive(init_msg({"size": 6, "frag": 2, "ack": "range"}))
+    transfer.receive_data(fragment(0, b"he"))
+    transfer.receive_data(fragment(2, b"lo"))
+    transfer.receive(fin())
+
+    assert messages == []
+    assert Flags.FIN not in [packet.flags for packet in sent]
+    assert transfer.alive == Status.DEAD
+
+
+def test_complete_message_is_published_before_fin():
+    sent = []
+    messages = []
+    transfer = receiver(sent, on_received=lambda *args: messages.append(args))
+
+    transfer.receive(init_msg({"size": 6, "frag": 2, "ack": "range"}))
+    for index, data in enumerate((b"he", b"ll", b"o!")):
+        transfer.receive_data(fragment(index, data))
+    transfer.receive(fin())
+
+    assert messages == [(CLIENT, None, "hello!")]
+    assert sent[-1].flags == Flags.FIN
+
+
+def test_invalid_options_refuse_transfer():
+    for options in (
+        {"size": "abc", "frag": 2},
+        {"size": 10, "frag": 0},
+        {"size": 10, "frag": Size.DATAGRAM},
+        {"size": -1, "frag": 2},
+        {"size": MAX_MESSAGE + 1, "frag": 2},
+    ):
+        sent = []
+        transfer = receiver(sent)
+
+        transfer.receive(init_msg(options))
+
+        assert transfer.alive == Status.DEAD
+        assert sent == []
+
+
+def test_late_fragment_of_dead_receiver_is_dropped(tmp_path, monkeypatch):
+    sent = []
+    transfer = receiver(sent, name="late", extention="bin")
+    monkeypatch.setattr(transfer, "_file_path", lambda: str(tmp_path / "late.bin"))
+
+    data = Packet.encode_fields(["late.bin", TRANSFER_FLAG], {"size": 4, "frag": 2})
+    transfer.receive(
+        Packet.decode(Packet.construct(data, Flags.FILE, 0, Version.V2), Version.V2)
+    )
+    transfer.receive_data(fragment(0, b"ab"))
+
+    transfer.kill()
+    transfer._iterator()
+    transfer.receive_data(fragment(1, b"cd"))
+
+    assert list(tmp_path.iterdir()) == []
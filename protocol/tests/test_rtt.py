@@ -0,0 +1,64 @@
+import pytest
+
+from rtt import RttEstimator, INITIAL_RTO, MIN_RTO, MAX_RTO
+
+
+def test_first_sample():
+    rtt = RttEstimator()
+
+    assert rtt.rto == INITIAL_RTO
+
+    rtt.sample(0.4)
+
+    assert rtt.srtt == pytest.approx(0.4)
+    assert rtt.rttvar == pytest.approx(0.2)
+    assert rtt.rto == pytest.approx(0.4 + 4 * 0.2)
+
+
+def test_next_samples_are_smoothed():
+    rtt = RttEstimator()
+
+    rtt.sample(0.4)
+    rtt.sample(0.8)
+
+    assert rtt.rttvar == pytest.approx(0.75 * 0.2 + 0.25 * 0.4)
+    assert rtt.srtt == pytest.approx(0.875 * 0.4 + 0.125 * 0.8)
+    assert rtt.rto == pytest.approx(rtt.srtt + 4 * rtt.rttvar)
+    assert rtt.samples == 2
+
+
+def test_rto_is_clamped():
+    rtt = RttEstimator()
+
+    rtt.sample(0.001)
+    assert rtt.rto == MIN_RTO
+
+    for _ in range(64):
+        rtt.backoff()
+    assert rtt.rto == MAX_RTO
+
+
+def test_backoff_doubles_until_next_sample():
+    rtt = RttEstimator()
+    rtt.sample(0.1)
+    rto = rtt.rto
+
+    rtt.backoff()
+    rtt.backoff()
+
+    assert rtt.rto == pytest.approx(rto * 4)
+    assert rtt.backoffs == 2
+
+    rtt.sample(0.1)
+
+    assert rtt.backoffs == 0
+    assert rtt.rto < rto * 4
+
+
+def test_negative_sample_is_ignored():
+    rtt = RttEstimator()
+
+    rtt.sample(-1.0)
+
+    assert rtt.srtt is None
+    assert rtt.samples == 0
@@ -0,0 +1,211 @@
+import os
+import socket
+import logging
+import threading
+import multiprocessing
+
+from host import Host
+from go.adressinfo import AddressInfo
+from multiprocessing.connection import Connection
+
+
+""" Global variables """
+LOGGER = logging.getLogger("Workers")
+START_TIMEOUT = 5  # Seconds for a worker to bind its socket
+
+
+def configure(host: Host, options: dict) -> None:
+    """Apply shared config to host"""
+
+    for key, value in options.items():
+        if key == "fragment_size":
+            host.fragment_size = int(value)
+        elif key == "window":
+            host.window = int(value)
+        elif key == "congestion":
+            host.congestion = value
+        elif key == "pacing":
+            host.pacing = bool(value)
+        elif key == "compression":
+            host.compression = bool(value)
+        elif key == "log_level":
+            logging.getLogger().setLevel(value)
+        else:
+            LOGGER.warning(f"Unknown config option {key}")
+
+
+def _commands(host: Host, pipe: Connection) -> None:
+    """Answer supervisor, while host runs its loop"""
+
+    while True:
+        try:
+            command, argument = pipe.recv()
+        except (EOFError, OSError):
+            """ Supervisor is gone """
+            host.stop()
+            return
+
+        if command == "config":
+            configure(host, argument)
+        elif command == "stats":
+            pipe.send(host.stats())
+        elif command == "stop":
+            host.disconnect_all()
+            host.stop()
+            return
+
+
+def _work(ip: str, port: int, config: dict, pipe: Connection) -> None:
+    """Worker process, Host with shared port"""
+
+    host = Host(ip, port, reuse_port=True)
+    configure(host, config)
+
+    try:
+        host.register()
+    except OSError as e:
+        pipe.send(e)
+        return
+
+    pipe.send(host.get_bounded_ip_port())
+
+    threading.Thread(target=_commands, args=(host, pipe), daemon=True).start()
+
+    try:
+        host.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        host.unregister()
+
+
+class Supervisor:
+    """
+    Runs node as workers, processes with own Host bound to the same port
+    through SO_REUSEPORT. Kernel hashes every peer to one worker, so
+    a node with many peers uses as many cores as it has workers.
+    Supervisor sends shared config to workers and sums their stats.
+    Peers have to connect to the node, connection started by a worker
+    gets its answers at the worker, which kernel picks for the peer.
+    """
+
+    def __init__(
+        self, ip: str, port: int, workers: int | None = None, config: dict = None
+    ):
+        self.__me = AddressInfo(ip, port)
+        self.__count = workers or os.cpu_count() or 1
+        self.__config = dict(config or {})
+
+        self.__processes: list[multiprocessing.Process] = []
+        self.__pipes: list[Connection] = []
+        self.__lock = threading.Lock()
+
+    @property
+    def me(self) -> AddressInfo:
+        return self.__me
+
+    @property
+    def workers(self) -> int:
+        return self.__count
+
+    @property
+    def config(self) -> dict:
+        return dict(self.__config)
+
+    def start(self) -> bool:
+        """Start workers, False if they could not bind"""
+
+        if not hasattr(socket, "SO_REUSEPORT"):
+            LOGGER.error("SO_REUSEPORT is not supported, workers can not share port")
+            return False
+
+        for _ in range(self.__count):
+            if not self._spawn():
+                self.stop()
+                return False
+
+        LOGGER.info(f"{self.__count} workers on {self.__me.ip}:{self.__me.port}")
+
+        return True
+
+    def configure(self, **options) -> None:
+        """Change shared config of all workers"""
+
+        with self.__lock:
+            self.__config.update(options)
+
+            for pipe in self.__pipes:
+                pipe.send(("config", options))
+
+    def stats(self) -> dict:
+        """Sum of stats of workers, with stats of every worker"""
+
+        with self.__lock:
+            workers = []
+
+            for pipe in self.__pipes:
+                try:
+                    pipe.send(("stats", None))
+                    workers.append(pipe.recv())
+                except (OSError, EOFError):
+                    """ Worker has exited """
+                    continue
+
+        """ No worker runs, before start or after all of them exited """
+        keys = workers[0] if workers else {}
+
+        total = {key: sum(stats[key] for stats in workers) for key in keys}
+        total["workers"] = workers
+
+        return total
+
+    def stop(self) -> None:
+        """Stop workers, their connections are disconnected"""
+
+        with self.__lock:
+            for pipe in self.__pipes:
+                try:
+                    pipe.send(("stop", None))
+                except OSError:
+                    pass
+
+            for process in self.__processes:
+                process.join(START_TIMEOUT)
+                if process.is_alive():
+                    process.terminate()
+
+            for pipe in self.__pipes:
+                pipe.close()
+
+            self.__processes.clear()
+            self.__pipes.clear()
+
+    def _spawn(self) -> bool:
+        """Start one worker and wait until it binds"""
+
+        pipe, child = multiprocessing.Pipe()
+        process = multiprocessing.Process(
+            target=_work,
+            args=(*self.__me.values(), self.__config, child),
+            daemon=True,
+        )
+        process.start()
+        child.close()
+
+        self.__processes.append(process)
+        self.__pipes.append(pipe)
+
+        if not pipe.poll(START_TIMEOUT):
+            LOGGER.error("Worker did not start")
+            return False
+
+        bound = pipe.recv()
+
+        if isinstance(bound, OSError):
+            LOGGER.error(f"Worker could not bind: {bound}")
+            return False
+
+        """ First worker picks port, when it was not given """
+        self.__me = AddressInfo(*bound)
+
+        return True